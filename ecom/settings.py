@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,6 +43,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main_app.middleware.RequestMetricsMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -73,14 +76,48 @@ WSGI_APPLICATION = 'ecom.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# SQLite tuning, overridable through the environment:
+# - WAL journaling lets readers keep working while an import writes.
+# - synchronous=NORMAL is durable in WAL mode and avoids an fsync per commit.
+# - IMMEDIATE transactions take the write lock up front, so concurrent
+#   writers wait on the busy timeout instead of failing with "database is locked".
+SQLITE_PRAGMAS = {
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Negative values are KiB: 64 MiB of page cache per connection.
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64 * 1024)),
+    'temp_store': os.environ.get('SQLITE_TEMP_STORE', 'MEMORY'),
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', 'true').lower() in ('1', 'true', 'yes'),
+        'OPTIONS': {
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            'transaction_mode': os.environ.get('SQLITE_TRANSACTION_MODE', 'IMMEDIATE'),
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
     }
 }
 
 
+# Cache for rendered customer listing pages. Their keys embed a version kept
+# in the database, so writes from any process invalidate every worker's
+# local-memory cache; set CACHE_DIR to share one file-based cache between
+# several workers instead of rendering each page once per worker.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache' if os.environ.get('CACHE_DIR')
+        else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.environ.get('CACHE_DIR', 'main_app'),
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -117,7 +154,39 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Uploaded import files and generated exports of background jobs
+MEDIA_ROOT = BASE_DIR / 'media'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Rows per transaction for main_app CSV imports
+IMPORT_CHUNK_SIZE = 1000
+# Created records echoed back in the import response
+IMPORT_PREVIEW_SIZE = 50
+# Customers fetched per round trip while streaming CSV exports
+EXPORT_CHUNK_SIZE = 2000
+# Upper bound for page_size on /api/customers/
+CUSTOMER_API_MAX_PAGE_SIZE = 100
+# Upper bound for records per POST to /api/customers/batch/
+CUSTOMER_BATCH_MAX_SIZE = 1000
+# Bearer tokens accepted by /api/customers/batch/ (comma-separated in the
+# environment); with none set the endpoint refuses every request
+CUSTOMER_API_TOKENS = [token for token in os.environ.get('CUSTOMER_API_TOKENS', '').split(',') if token]
+# Import row validation: worker processes (default: CPU count) and rows per task
+IMPORT_VALIDATION_WORKERS = None
+IMPORT_VALIDATION_BATCH_SIZE = 250
+# Days the change feed keeps deletion tombstones and its change log; older
+# cursors get 410 and must sync in full (manage.py prune_change_feed)
+CHANGE_FEED_RETENTION_DAYS = 30
+# run_jobs: seconds a running job's lease lasts without a heartbeat, and the
+# claims a job gets before a dying worker fails it
+JOB_LEASE_SECONDS = 60
+JOB_MAX_ATTEMPTS = 3
+# Seconds a rendered customer listing page stays cached
+LISTING_CACHE_TIMEOUT = 300
+# Serve the async versions of the hot views (main_app.async_urls); asgi.py
+# turns this on by default
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
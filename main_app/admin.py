@@ -1,17 +1,57 @@
 from django.contrib import admin
-from .models import UserProfile, Address
+from .models import UserProfile, Address, ImportCheckpoint, Job, Tombstone
+from .search import fts_filter, USERPROFILE_FTS, ADDRESS_FTS
+
+
+class FullTextSearchMixin:
+    """
+    Serves changelist searches from an FTS5 index instead of the
+    LIKE '%term%' scans generated from search_fields, which are kept
+    as the fallback on databases without FTS5.
+    """
+    fts_index = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if search_term:
+            matched = fts_filter(queryset, self.fts_index, search_term)
+            if matched is not None:
+                return matched, False
+        return super().get_search_results(request, queryset, search_term)
+
 
 @admin.register(UserProfile)
-class UserProfileAdmin(admin.ModelAdmin):
+class UserProfileAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['Name', 'Group', 'CreditLimit', 'Status', 'Active']
     list_filter = ['Active', 'Group']
     search_fields = ['Name', 'Email', 'Mobile', 'Number']
     ordering = ['Name']
+    fts_index = USERPROFILE_FTS
 
 
 @admin.register(Address)
-class AddressAdmin(admin.ModelAdmin):
+class AddressAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['AddressName', 'user', 'Address', 'City', 'State', 'Zip', 'Country', 'IsDefault']
     list_filter = ['City', 'State', 'Country', 'IsDefault']
     search_fields = ['AddressName', 'Address', 'City', 'State', 'Zip', 'Country']
     ordering = ['user', 'AddressName']
+    fts_index = ADDRESS_FTS
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'processed_rows', 'progress', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    ordering = ['-created_at']
+
+
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['file_hash', 'rows_done', 'byte_offset', 'completed_at', 'updated_at']
+    ordering = ['-updated_at']
+
+
+@admin.register(Tombstone)
+class TombstoneAdmin(admin.ModelAdmin):
+    list_display = ['model', 'object_id', 'customer_id', 'number', 'deleted_at']
+    list_filter = ['model']
+    ordering = ['-deleted_at']
@@ -1,6 +1,34 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def ensure_search_index(sender, using='default', **kwargs):
+    # SQLite table rebuilds in later migrations drop the FTS triggers.
+    from .search import install_fts
+    install_fts(connections[using])
+
+
+def ensure_customer_summary(sender, using='default', **kwargs):
+    # Migrations that rebuild the profile or address table drop and
+    # restore the summary triggers themselves (see summary.py); this only
+    # recreates missing ones, rebuilding the summary when it does.
+    from .summary import install_summary
+    install_summary(connections[using])
+
+
+def ensure_change_log(sender, using='default', **kwargs):
+    # Only recreates triggers a migration dropped without restoring them.
+    from .changelog import install_change_log
+    install_change_log(connections[using])
 
 
 class MainAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main_app'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        post_migrate.connect(ensure_search_index, sender=self)
+        post_migrate.connect(ensure_customer_summary, sender=self)
+        post_migrate.connect(ensure_change_log, sender=self)
@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+# The same routes as urls.py, with the async views swapped in by name.
+ASYNC_VIEWS = {
+    'home': async_views.home_page,
+    'export_csv': async_views.export_users_csv,
+    'import_csv': async_views.import_users_csv,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS.get(pattern.name, pattern.callback), name=pattern.name)
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,56 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.shortcuts import render
+
+from .changes import acondition_on_customer_data
+from .checkpoints import ImportConflict, import_csv_resumable
+from .exporters import aiter_export
+from .forms import UnifiedUserForm
+from .listing import acached_customer_page_json
+from .services import create_customer
+from .views import (
+    customer_save_error_json, customer_saved_json, export_etag, export_last_modified, export_response,
+    form_invalid_json, home_context, import_result_json, parse_import_request,
+)
+
+# Async versions of the hot views, served under ASGI (see async_urls.py).
+# Reads go through the async ORM and cache; transactional writes and the
+# bulk import stay synchronous code run through sync_to_async, since
+# transaction.atomic() has no async form.
+
+
+async def home_page(request):
+    form = UnifiedUserForm()
+
+    if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
+        form = UnifiedUserForm(request.POST)
+        if form.is_valid():
+            try:
+                user_profile, address_record, _ = await sync_to_async(create_customer)(form.cleaned_data)
+            except Exception as e:
+                return customer_save_error_json(e)
+            return customer_saved_json(user_profile, address_record)
+        return form_invalid_json(form)
+
+    return render(request, 'index.html', home_context(form, await acached_customer_page_json()))
+
+
+@acondition_on_customer_data(etag_func=export_etag, last_modified_func=export_last_modified)
+async def export_users_csv(request):
+    return export_response(request, aiter_export)
+
+
+async def import_users_csv(request):
+    options, error = parse_import_request(request)
+    if error:
+        return error
+    csv_file, mode = options
+    try:
+        result = await sync_to_async(import_csv_resumable)(
+            csv_file, mode, chunk_size=request.POST.get('chunk_size'), restart=request.POST.get('restart') == '1',
+        )
+    except ImportConflict as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=409)
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': f'Error reading CSV: {str(e)}'}, status=500)
+    return import_result_json(result, mode)
@@ -0,0 +1,197 @@
+import csv
+import io
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .exporters import EXPORT_FORMATS, EXPORT_HEADERS, export_row
+from .forms import UnifiedUserForm
+from .listing import bump_listing_version
+from .models import UserProfile, Address, ShippingAndTax
+from .synthetic import synthetic_customer
+
+# Rows in the CSV uploaded by the import case.
+IMPORT_ROWS = 1000
+
+# Customers created per run by the single-record and batch create cases.
+CREATE_RECORDS = 100
+
+
+def _consume(response):
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def _import_payload(rows=IMPORT_ROWS):
+    rng = random.Random(0)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_HEADERS)
+    for index in range(rows):
+        profile, address, shipping = synthetic_customer(rng, 10**9 + index)
+        profile.ordered_addresses = [address]
+        profile.shipping_tax = shipping
+        writer.writerow(export_row(profile))
+    return buffer.getvalue().encode('utf-8')
+
+
+def _create_records(count=CREATE_RECORDS):
+    # UnifiedUserForm fields of synthetic customers.
+    rng = random.Random(1)
+    records = []
+    for index in range(count):
+        customer = synthetic_customer(rng, 2 * 10**9 + index)
+        record = {}
+        for instance in customer:
+            for field in instance._meta.concrete_fields:
+                value = getattr(instance, field.attname)
+                if field.attname in UnifiedUserForm.base_fields and value is not None:
+                    record[field.attname] = value if isinstance(value, (bool, int)) else str(value)
+        records.append(record)
+    return records
+
+
+class BenchmarkCases:
+    """
+    The request paths under benchmark, run through the test client so the
+    full middleware and view stack is included.
+    """
+
+    def __init__(self):
+        self.client = Client()
+        User = get_user_model()
+        admin_user = User.objects.filter(username='benchmark').first() or User.objects.create_superuser(
+            'benchmark', 'benchmark@example.com', None
+        )
+        self.client.force_login(admin_user)
+        self.import_payload = _import_payload()
+        self.create_records = _create_records()
+
+    def _discard_created(self, last_pk):
+        # Keep the dataset at its nominal size for the next case. Plain SQL
+        # deletes skip the per-object delete signals, which would otherwise
+        # dominate the timings of the cases that create customers.
+        with connection.cursor() as cursor:
+            for model in (Address, ShippingAndTax):
+                cursor.execute(f'DELETE FROM {model._meta.db_table} WHERE user_id > %s', [last_pk])
+            cursor.execute(f'DELETE FROM {UserProfile._meta.db_table} WHERE id > %s', [last_pk])
+        bump_listing_version()
+
+    def home_page(self):
+        return self.client.get(reverse('home'))
+
+    def export_users_csv(self):
+        return _consume(self.client.get(reverse('export_csv')))
+
+    def export_users_csv_gzip(self):
+        return _consume(self.client.get(reverse('export_csv'), {'compress': 'gzip'}))
+
+    def export_users_ndjson(self):
+        return _consume(self.client.get(reverse('export_csv'), {'format': 'ndjson'}))
+
+    def export_users_parquet(self):
+        return _consume(self.client.get(reverse('export_csv'), {'format': 'parquet'}))
+
+    def import_users_csv(self):
+        last_pk = UserProfile.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        upload = SimpleUploadedFile('bench.csv', self.import_payload, content_type='text/csv')
+        response = self.client.post(reverse('import_csv'), {'csv_file': upload})
+        self._discard_created(last_pk)
+        return response
+
+    # The per-record and batch create paths, on the same CREATE_RECORDS customers.
+    def home_page_post_each(self):
+        last_pk = UserProfile.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        for record in self.create_records:
+            # Unchecked checkboxes are simply absent from a form POST.
+            data = {key: value for key, value in record.items() if value is not False}
+            self.client.post(reverse('home'), data, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self._discard_created(last_pk)
+
+    def customers_batch_api(self):
+        last_pk = UserProfile.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        with override_settings(CUSTOMER_API_TOKENS=['benchmark']):
+            response = self.client.post(
+                reverse('customers_batch_api'), json.dumps(self.create_records), content_type='application/json',
+                HTTP_AUTHORIZATION='Bearer benchmark',
+            )
+        self._discard_created(last_pk)
+        return response
+
+    def admin_userprofile_changelist(self):
+        return self.client.get(reverse('admin:main_app_userprofile_changelist'))
+
+    def admin_address_changelist(self):
+        return self.client.get(reverse('admin:main_app_address_changelist'))
+
+    def names(self):
+        names = [
+            'home_page', 'export_users_csv', 'export_users_csv_gzip', 'export_users_ndjson', 'import_users_csv',
+            'home_page_post_each', 'customers_batch_api',
+            'admin_userprofile_changelist', 'admin_address_changelist',
+        ]
+        if EXPORT_FORMATS['parquet'].available:
+            names.insert(4, 'export_users_parquet')
+        return names
+
+
+def measure(func, repeat=3):
+    """
+    Runs `func` `repeat` times for the median latency, CPU time and query
+    count, then once more under tracemalloc for peak Python memory.
+    """
+    latencies, cpu_times, queries = [], [], []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started, cpu_started = time.perf_counter(), time.process_time()
+            func()
+            latencies.append(time.perf_counter() - started)
+            cpu_times.append(time.process_time() - cpu_started)
+        queries.append(len(captured))
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'latency_seconds': round(statistics.median(latencies), 4),
+        'cpu_seconds': round(statistics.median(cpu_times), 4),
+        'queries': max(queries),
+        'peak_memory_bytes': peak,
+    }
+
+
+def find_regressions(results, baseline, threshold):
+    """
+    Compares results to a baseline of the same shape ({size: {case: stats}})
+    and lists human-readable regressions: latency or peak memory above
+    baseline * (1 + threshold), or more queries than before.
+    """
+    regressions = []
+    for size, cases in results.items():
+        for case, stats in cases.items():
+            before = baseline.get(str(size), {}).get(case)
+            if not before:
+                continue
+            for key in ('latency_seconds', 'peak_memory_bytes'):
+                if before.get(key) and stats[key] > before[key] * (1 + threshold):
+                    regressions.append(
+                        f'{case} @ {size}: {key} {stats[key]} > {before[key]} (+{threshold:.0%} allowed)'
+                    )
+            if 'queries' in before and stats['queries'] > before['queries']:
+                regressions.append(f"{case} @ {size}: queries {stats['queries']} > {before['queries']}")
+    return regressions
@@ -0,0 +1,152 @@
+from django.db import connection
+from django.db.models import Min
+
+from .models import UserProfile, Address, ShippingAndTax, CustomerChange
+
+# -----------------------
+# Change log triggers
+# -----------------------
+# SQLite triggers append a CustomerChange row for every write to a
+# customer's profile, address or shipping row, so bulk_create(), queryset
+# updates and raw SQL are logged as well as save() and delete(). Readers
+# only see committed rows, and a writer can only insert after the previous
+# one committed, so no row ever appears below a position already read.
+#
+# The triggers stay in place across migrate. Rebuilding a logged table
+# drops its triggers, so a migration that does so restores them in its own
+# transaction (restore_triggers_after_migration below); if they still have
+# to be recreated after migrate, writes may have gone unlogged, and every
+# outstanding cursor is expired so its client resyncs.
+CHANGE_TABLE = CustomerChange._meta.db_table
+
+# Logged model -> its column holding the customer id.
+LOGGED_MODELS = {UserProfile: 'id', Address: 'user_id', ShippingAndTax: 'user_id'}
+
+
+def _trigger_sql():
+    statements = {}
+    for model, column in LOGGED_MODELS.items():
+        table, name = model._meta.db_table, f'{CHANGE_TABLE}_{model._meta.model_name}'
+        insert_new = f'INSERT INTO {CHANGE_TABLE} (customer_id) VALUES (new.{column});'
+        insert_old = f'INSERT INTO {CHANGE_TABLE} (customer_id) VALUES (old.{column});'
+        update = insert_new
+        if column != 'id':
+            # A child row moved to another customer changes both.
+            update = (
+                f'INSERT INTO {CHANGE_TABLE} (customer_id) SELECT old.{column} WHERE old.{column} != new.{column}; '
+                f'{insert_new}'
+            )
+        statements[f'{name}_ai'] = f'AFTER INSERT ON {table} BEGIN {insert_new} END'
+        statements[f'{name}_au'] = f'AFTER UPDATE ON {table} BEGIN {update} END'
+        statements[f'{name}_ad'] = f'AFTER DELETE ON {table} BEGIN {insert_old} END'
+    return {name: f'CREATE TRIGGER IF NOT EXISTS {name} {statement}' for name, statement in statements.items()}
+
+
+TRIGGER_NAMES = list(_trigger_sql())
+
+
+def change_log_available(conn=None):
+    """
+    Whether writes are being logged: SQLite, with all of the triggers
+    installed. Elsewhere the change feed falls back to updated_at cursors.
+    Like summary_available(), the answer is kept per database connection.
+    """
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return False
+    conn.ensure_connection()
+    known = getattr(conn, '_change_log_triggers', None)
+    if known is not None and known[0] is conn.connection:
+        return known[1]
+    placeholders = ', '.join(['%s'] * len(TRIGGER_NAMES))
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", TRIGGER_NAMES,
+        )
+        available = cursor.fetchone()[0] == len(TRIGGER_NAMES)
+    _remember_triggers(conn, available)
+    return available
+
+
+def _remember_triggers(conn, available):
+    conn._change_log_triggers = (conn.connection, available)
+
+
+def install_change_log(conn=None, expire_cursors=True):
+    """
+    Creates the change log triggers if missing. With `expire_cursors`,
+    recreating any of them also expires every cursor handed out so far:
+    writes committed while they were missing were never logged.
+    """
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        if CHANGE_TABLE not in existing:
+            # Migrated back to before the change log.
+            return
+        missing = [sql for name, sql in _trigger_sql().items() if name not in existing]
+        for sql in missing:
+            cursor.execute(sql)
+        if missing and expire_cursors:
+            _expire_cursors(cursor)
+    _remember_triggers(conn, True)
+
+
+def _expire_cursors(cursor):
+    # Empty the log and skip an id: every earlier position is then more
+    # than one behind the oldest change (see change_log_expired()).
+    cursor.execute(f'DELETE FROM {CHANGE_TABLE}')
+    cursor.execute('UPDATE sqlite_sequence SET seq = seq + 1 WHERE name = %s', [CHANGE_TABLE])
+
+
+def uninstall_change_log(conn=None):
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    _remember_triggers(conn, False)
+
+
+# --- Positions ---
+def change_log_position():
+    """
+    The id of the newest committed change, 0 before the first one. Read
+    from the AUTOINCREMENT sequence, which outlives pruned or expired rows.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT seq FROM sqlite_sequence WHERE name = %s', [CHANGE_TABLE])
+        row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def change_log_expired(position):
+    """
+    Whether changes after `position` are gone from the log. Ids have no
+    gaps except pruned or expired ones, so the oldest remaining change (or
+    the next id, once the log is empty) must follow right after it.
+    """
+    first = CustomerChange.objects.aggregate(first=Min('pk'))['first']
+    if first is None:
+        first = change_log_position() + 1
+    return first > position + 1
+
+
+def logged_customer_ids(after, upto):
+    """Ids of customers changed in the log positions (after, upto]."""
+    return list(
+        CustomerChange.objects.filter(pk__gt=after, pk__lte=upto)
+        .order_by('customer_id').values_list('customer_id', flat=True).distinct()
+    )
+
+
+# --- Migrations ---
+# A migration that rebuilds (creates, copies, drops, renames) a logged
+# table runs this as its last operation, in the same transaction, so no
+# write can commit in between and outstanding cursors stay current.
+def restore_triggers_after_migration(apps, schema_editor):
+    install_change_log(schema_editor.connection, expire_cursors=False)
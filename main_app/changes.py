@@ -0,0 +1,287 @@
+import hashlib
+from datetime import timedelta, timezone as dt_timezone
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import condition
+
+from .exporters import EXPORT_HEADERS, export_queryset, export_row, get_chunk_size
+from .changelog import change_log_available, change_log_expired, change_log_position, logged_customer_ids
+from .importers import chunked
+from .models import UserProfile, Address, ShippingAndTax, CustomerChange, Tombstone
+
+TRACKED_MODELS = (UserProfile, Address, ShippingAndTax)
+
+UPSERT = 'upsert'
+DELETE = 'delete'
+
+# Days tombstones and change log rows are kept (prune_change_feed).
+DEFAULT_RETENTION_DAYS = 30
+# Rows deleted per transaction when pruning.
+PRUNE_CHUNK_SIZE = 10000
+
+
+def _fingerprint(marks):
+    # marks: (label, value, timestamp or None) of each source of changes.
+    parts = [f'{label}:{value}' for label, value, _ in marks]
+    stamps = [stamp for _, _, stamp in marks if stamp]
+    etag = hashlib.md5('|'.join(parts).encode('utf-8'), usedforsecurity=False).hexdigest()
+    return {'last_modified': max(stamps, default=None), 'etag': etag}
+
+
+def _log_mark(newest):
+    pk, changed_at = newest or (0, None)
+    return ('log', pk, changed_at)
+
+
+def _updated_mark(model, last):
+    return (model._meta.model_name, last.isoformat() if last else '-', last)
+
+
+def _deleted_mark(deleted):
+    return ('deleted', deleted.isoformat() if deleted else '-', deleted)
+
+
+def customer_data_state():
+    """
+    A cheap fingerprint of all customer data. Returns the newest timestamp
+    and an ETag value built from the newest change log row, which every
+    write appends (queryset updates and raw SQL included), and the newest
+    tombstone: two index lookups. Without the change log it uses each
+    model's newest updated_at instead, which misses writes that leave
+    updated_at alone.
+    """
+    deleted = _deleted_mark(Tombstone.objects.aggregate(last=Max('deleted_at'))['last'])
+    if change_log_available():
+        return _fingerprint([_log_mark(_newest_change().first()), deleted])
+    return _fingerprint([
+        _updated_mark(model, model.objects.aggregate(last=Max('updated_at'))['last']) for model in TRACKED_MODELS
+    ] + [deleted])
+
+
+async def acustomer_data_state():
+    deleted = _deleted_mark((await Tombstone.objects.aaggregate(last=Max('deleted_at')))['last'])
+    if await sync_to_async(change_log_available)():
+        return _fingerprint([_log_mark(await _newest_change().afirst()), deleted])
+    return _fingerprint([
+        _updated_mark(model, (await model.objects.aaggregate(last=Max('updated_at')))['last'])
+        for model in TRACKED_MODELS
+    ] + [deleted])
+
+
+def _newest_change():
+    return CustomerChange.objects.order_by('-pk').values_list('pk', 'changed_at')
+
+
+def _request_state(request):
+    # condition() asks for the ETag and Last-Modified separately; compute once.
+    if not hasattr(request, '_customer_data_state'):
+        request._customer_data_state = customer_data_state()
+    return request._customer_data_state
+
+
+def customer_data_etag(request, *args, **kwargs):
+    return _request_state(request)['etag']
+
+
+def customer_data_last_modified(request, *args, **kwargs):
+    return _request_state(request)['last_modified']
+
+
+def variant_etag(request, *variant):
+    """
+    The customer data ETag of a response that also depends on `variant`
+    (e.g. the export target and format), so one variant's ETag never
+    validates another's.
+    """
+    key = '|'.join([customer_data_etag(request), *map(str, variant)])
+    return hashlib.md5(key.encode('utf-8'), usedforsecurity=False).hexdigest()
+
+
+def acondition_on_customer_data(etag_func=customer_data_etag, last_modified_func=customer_data_last_modified):
+    """
+    condition() on the customer data state for async views: the state is
+    loaded with the async ORM first, so condition()'s synchronous ETag and
+    Last-Modified callbacks only read it back.
+    """
+    def decorator(view):
+        conditional = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            request._customer_data_state = await acustomer_data_state()
+            return await conditional(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+# --- Change feed cursors ---
+def format_cursor(value):
+    # Log positions as digits; timestamps in UTC with a 'Z' suffix, since a
+    # '+00:00' offset would need escaping in URLs.
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return str(value)
+    return value.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+def parse_cursor(value):
+    """
+    The change log position of a `since` cursor, or the datetime of one
+    issued from updated_at (before the change log existed, or on other
+    databases); None if it is neither. Naive datetimes are taken as UTC.
+    """
+    if value.isdigit():
+        return int(value)
+    try:
+        parsed = parse_datetime(value)
+    except ValueError:
+        return None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+class CursorExpired(Exception):
+    """Changes after the cursor were pruned; the client must sync in full."""
+
+
+def retention_cutoff():
+    days = getattr(settings, 'CHANGE_FEED_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+# --- Change feed ---
+def changed_customer_ids(since, until=None):
+    """
+    Ids of customers with a profile, address or shipping row changed or
+    deleted in (since, until], in one UNION query over the updated_at and
+    deleted_at indexes. A write stamped before `since` but committed after
+    it is missed, which is why the feed prefers the change log.
+    """
+    window = {'updated_at__gt': since}
+    deleted = {'deleted_at__gt': since}
+    if until is not None:
+        window['updated_at__lte'] = deleted['deleted_at__lte'] = until
+    profiles = UserProfile.objects.filter(**window).values_list('pk')
+    addresses = Address.objects.filter(**window).values_list('user_id')
+    shipping = ShippingAndTax.objects.filter(**window).values_list('user_id')
+    tombstones = Tombstone.objects.filter(**deleted).values_list('customer_id')
+    return sorted(pk for (pk,) in profiles.union(addresses, shipping, tombstones))
+
+
+def read_changes(since):
+    """
+    The cursor a feed read now after `since` ends at, and the ids of the
+    customers it sends (None for a full sync). With the change log the
+    cursor is the log position, taken before anything else is read;
+    otherwise it is the newest updated_at. Raises CursorExpired when
+    changes after `since` have been pruned.
+    """
+    if change_log_available():
+        cursor = change_log_position()
+        if since is None:
+            return cursor, None
+        if isinstance(since, int):
+            if change_log_expired(since):
+                raise CursorExpired
+            return max(cursor, since), logged_customer_ids(since, cursor)
+        # A cursor from before the change log: one last read by updated_at.
+        if since < retention_cutoff():
+            raise CursorExpired
+        return cursor, changed_customer_ids(since)
+
+    if isinstance(since, int):
+        # The triggers are gone (or never existed here): positions mean nothing.
+        raise CursorExpired
+    until = customer_data_state()['last_modified']
+    if since is None:
+        return until, None
+    if since < retention_cutoff():
+        raise CursorExpired
+    cursor = until if until and until > since else since
+    return cursor, changed_customer_ids(since, cursor)
+
+
+def _entry(user):
+    return {
+        'op': UPSERT,
+        'id': user.pk,
+        'number': user.Number,
+        'created_at': format_cursor(user.created_at),
+        'updated_at': format_cursor(user.updated_at),
+        'record': dict(zip(EXPORT_HEADERS, export_row(user))),
+    }
+
+
+def iter_changes(customer_ids, chunk_size=None):
+    """
+    Yields one entry per customer, by id: 'upsert' with the customer's
+    export record, or 'delete' with the account number it had. None
+    yields every customer (a full sync). A customer changed while the feed
+    is read may also show up again in the next one; applying an entry
+    twice is harmless.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    if customer_ids is None:
+        for user in export_queryset().iterator(chunk_size=chunk_size):
+            yield _entry(user)
+        return
+
+    for ids in chunked(customer_ids, chunk_size):
+        users = {user.pk: user for user in export_queryset().filter(pk__in=ids)}
+        gone = [pk for pk in ids if pk not in users]
+        numbers = dict(
+            Tombstone.objects.filter(model=UserProfile._meta.model_name, object_id__in=gone)
+            .values_list('object_id', 'number')
+        ) if gone else {}
+        for pk in ids:
+            if pk in users:
+                yield _entry(users[pk])
+            else:
+                yield {'op': DELETE, 'id': pk, 'number': numbers.get(pk)}
+
+
+def iter_change_feed_json(since, cursor, customer_ids, chunk_size=None):
+    """
+    Streams the feed as one JSON object: the cursor to pass as `since` next
+    time, then the changes array an entry at a time.
+    """
+    encoder = DjangoJSONEncoder()
+    yield '{"since": %s, "cursor": %s, "changes": [' % (
+        encoder.encode(format_cursor(since)), encoder.encode(format_cursor(cursor)),
+    )
+    for index, entry in enumerate(iter_changes(customer_ids, chunk_size)):
+        yield (',\n' if index else '\n') + encoder.encode(entry)
+    yield '\n]}\n'
+
+
+# --- Retention ---
+def prune_change_feed(before=None, chunk_size=PRUNE_CHUNK_SIZE):
+    """
+    Deletes tombstones and change log rows older than `before` (default:
+    CHANGE_FEED_RETENTION_DAYS ago), a chunk per transaction so writers
+    are never held up for long. The newest log row is kept for the data
+    fingerprint. Returns the numbers of tombstones and log rows deleted.
+    """
+    before = before or retention_cutoff()
+    newest = change_log_position()
+    counts = []
+    for queryset in (
+        Tombstone.objects.filter(deleted_at__lt=before),
+        CustomerChange.objects.filter(changed_at__lt=before, pk__lt=newest),
+    ):
+        deleted = 0
+        while True:
+            pks = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            deleted += queryset.model.objects.filter(pk__in=pks).delete()[0]
+        counts.append(deleted)
+    return tuple(counts)
@@ -0,0 +1,87 @@
+import hashlib
+
+from django.utils import timezone
+
+from .importers import INSERT, OffsetCsvReader, bulk_import_rows
+from .models import ImportCheckpoint
+
+# -----------------------
+# Resumable imports
+# -----------------------
+# An import records, in the same transaction as each chunk, how many rows
+# of its file are committed and the byte offset after them. If it dies,
+# importing the same file again (matched on its SHA-256) seeks straight
+# to that offset: committed rows are neither read nor written twice.
+
+
+class ImportConflict(Exception):
+    """Another import of the same file committed a chunk first."""
+
+
+def file_sha256(file):
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResumableImport:
+    """
+    The checkpoint side of bulk_import_rows(): where to continue from, and
+    advance(), called inside each chunk's transaction. The update only
+    applies from the position this import last saw, so two concurrent
+    imports of one file cannot both commit the same rows.
+    """
+
+    def __init__(self, checkpoint, reader):
+        self.checkpoint = checkpoint
+        self.reader = reader
+
+    @property
+    def rows_done(self):
+        return self.checkpoint.rows_done
+
+    @property
+    def totals(self):
+        return self.checkpoint.totals
+
+    def advance(self, rows_done, totals):
+        updated = ImportCheckpoint.objects.filter(
+            pk=self.checkpoint.pk, rows_done=self.checkpoint.rows_done, completed_at=None,
+        ).update(rows_done=rows_done, byte_offset=self.reader.offset, totals=totals, updated_at=timezone.now())
+        if updated != 1:
+            raise ImportConflict('This file is being imported by another request.')
+        self.checkpoint.rows_done = rows_done
+        self.checkpoint.byte_offset = self.reader.offset
+        self.checkpoint.totals = dict(totals)
+
+
+def open_checkpoint(file_hash, restart=False):
+    """
+    The checkpoint of an unfinished earlier import of the file, else a
+    fresh one: a file that was fully imported, or `restart`, starts over.
+    """
+    checkpoint, created = ImportCheckpoint.objects.get_or_create(file_hash=file_hash)
+    if not created and (restart or checkpoint.completed_at):
+        checkpoint.rows_done = checkpoint.byte_offset = 0
+        checkpoint.totals = {}
+        checkpoint.completed_at = None
+        checkpoint.save()
+    return checkpoint
+
+
+def import_csv_resumable(file, mode=INSERT, chunk_size=None, restart=False, on_chunk=None):
+    """
+    Imports a CSV file (a Django File opened in binary mode) through
+    bulk_import_rows() with a checkpoint per chunk, continuing an earlier
+    interrupted import of the same content. The counts of the result cover
+    the whole file; `resumed_from_row` is the number of rows committed
+    before this run, whose preview and error lists only cover this run.
+    """
+    checkpoint = open_checkpoint(file_sha256(file), restart)
+    reader = OffsetCsvReader(file, checkpoint.byte_offset)
+    result = bulk_import_rows(
+        reader, chunk_size=chunk_size, mode=mode, on_chunk=on_chunk, checkpoint=ResumableImport(checkpoint, reader),
+    )
+    ImportCheckpoint.objects.filter(pk=checkpoint.pk).update(completed_at=timezone.now())
+    return result
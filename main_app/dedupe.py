@@ -0,0 +1,220 @@
+import unicodedata
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Count, Q
+
+from .models import PRIMARY_ADDRESS_ORDERING, UserProfile, Address
+
+# -----------------------
+# Duplicate detection
+# -----------------------
+# Every profile carries normalized blocking keys in indexed columns. Two
+# customers sharing any non-blank key are likely duplicates, so finding
+# candidates is an index lookup per key instead of comparing every pair.
+KEY_FIELDS = ('email_key', 'phone_key', 'name_zip_key')
+KEY_LABELS = {'email_key': 'email', 'phone_key': 'phone', 'name_zip_key': 'name+zip'}
+
+# Shorter digit strings (extensions, partial numbers) are too common to block on.
+MIN_PHONE_DIGITS = 7
+
+# Keeps name_zip_key within its column: 4 + 10 + ':' + 5 characters.
+MAX_NAME_DIGITS = 10
+
+DEFAULT_REFRESH_CHUNK_SIZE = 2000
+
+SOUNDEX_CODES = {
+    letter: code
+    for code, letters in (('1', 'BFPV'), ('2', 'CGJKQSXZ'), ('3', 'DT'), ('4', 'L'), ('5', 'MN'), ('6', 'R'))
+    for letter in letters
+}
+
+
+def _ascii_letters(value):
+    value = unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode('ascii')
+    return [c for c in value.upper() if 'A' <= c <= 'Z']
+
+
+def soundex(value):
+    """
+    American Soundex of the letters in `value`, e.g. 'Robert' -> 'R163';
+    '' when there are none.
+    """
+    letters = _ascii_letters(value)
+    if not letters:
+        return ''
+    codes, last = [], SOUNDEX_CODES.get(letters[0])
+    for letter in letters[1:]:
+        code = SOUNDEX_CODES.get(letter)
+        if code is None:
+            # Vowels separate repeated codes; H and W do not.
+            if letter not in 'HW':
+                last = None
+            continue
+        if code != last:
+            codes.append(code)
+        last = code
+    return (letters[0] + ''.join(codes) + '000')[:4]
+
+
+def normalize_email(value):
+    value = (value or '').strip().lower()
+    return value if '@' in value else ''
+
+
+def normalize_phone(value):
+    # Digits only; a leading 1 (NANP country code) on 11 digits is dropped.
+    digits = ''.join(c for c in value or '' if c.isdigit())
+    if len(digits) == 11 and digits.startswith('1'):
+        digits = digits[1:]
+    return digits if len(digits) >= MIN_PHONE_DIGITS else ''
+
+
+def normalize_zip(value):
+    # ZIP+4 and spacing variants collapse to the first five characters.
+    return ''.join(c for c in value or '' if c.isalnum()).upper()[:5]
+
+
+def name_zip_key(name, zip_code):
+    # Digits in a name (store or branch numbers) tell apart names that
+    # otherwise sound alike, so they are kept after the Soundex code.
+    digits = ''.join(c for c in name or '' if c.isdigit())[:MAX_NAME_DIGITS]
+    name, zip_code = soundex(name), normalize_zip(zip_code)
+    return f'{name}{digits}:{zip_code}' if name and zip_code else ''
+
+
+def customer_keys(profile, address):
+    return {
+        'email_key': normalize_email(profile.Email),
+        'phone_key': normalize_phone(profile.Mobile),
+        'name_zip_key': name_zip_key(profile.Name, address.Zip if address is not None else ''),
+    }
+
+
+def set_customer_keys(profile, address):
+    for field, value in customer_keys(profile, address).items():
+        setattr(profile, field, value)
+    return profile
+
+
+def refresh_customer_keys(chunk_size=DEFAULT_REFRESH_CHUNK_SIZE, profile_model=UserProfile, address_model=Address):
+    """
+    Recomputes every profile's keys from its fields and primary address,
+    a chunk at a time, writing only the ones that changed. Returns the
+    number of profiles updated. The models can be swapped for historical
+    ones in migrations.
+    """
+    fields = ('pk', 'Name', 'Email', 'Mobile', *KEY_FIELDS)
+    updated, after = 0, 0
+    while True:
+        rows = list(profile_model.objects.filter(pk__gt=after).order_by('pk').values_list(*fields)[:chunk_size])
+        if not rows:
+            return updated
+        zips = {}
+        for user_id, zip_code in address_model.objects.filter(user_id__in=[row[0] for row in rows]).order_by(
+            'user_id', *PRIMARY_ADDRESS_ORDERING
+        ).values_list('user_id', 'Zip'):
+            zips.setdefault(user_id, zip_code)
+
+        changed = []
+        for pk, name, email, mobile, *current in rows:
+            keys = [normalize_email(email), normalize_phone(mobile), name_zip_key(name, zips.get(pk, ''))]
+            if keys != current:
+                changed.append(profile_model(pk=pk, **dict(zip(KEY_FIELDS, keys))))
+        profile_model.objects.bulk_update(changed, KEY_FIELDS, batch_size=chunk_size)
+        updated += len(changed)
+        after = rows[-1][0]
+
+
+def _key_filter(keys_by_field):
+    query = Q()
+    for field, keys in keys_by_field.items():
+        if keys:
+            query |= Q(**{f'{field}__in': keys})
+    return query
+
+
+def find_duplicates(numbered_customers):
+    """
+    Flags likely duplicates among (row_number, (profile, address, shipping))
+    pairs whose profiles have their keys set: customers already stored with
+    a shared key (one indexed lookup for the whole batch) and earlier rows
+    of the batch. A row with the same account number as its match is the
+    same customer, not a duplicate. Returns one entry per flagged row.
+    """
+    keys_by_field = {field: set() for field in KEY_FIELDS}
+    for _, (profile, _, _) in numbered_customers:
+        for field in KEY_FIELDS:
+            if getattr(profile, field):
+                keys_by_field[field].add(getattr(profile, field))
+    query = _key_filter(keys_by_field)
+    if not query:
+        return []
+
+    stored = {}
+    for pk, number, name, *keys in UserProfile.objects.filter(query).values_list('pk', 'Number', 'Name', *KEY_FIELDS):
+        for field, key in zip(KEY_FIELDS, keys):
+            if key:
+                stored.setdefault((field, key), []).append({'id': pk, 'number': number, 'name': name})
+
+    seen, flagged = {}, []
+    for row_number, (profile, _, _) in numbered_customers:
+        matches = {}
+        for field in KEY_FIELDS:
+            key = getattr(profile, field)
+            if not key:
+                continue
+            for match in stored.get((field, key), []) + seen.get((field, key), []):
+                if profile.Number and match['number'] == profile.Number:
+                    continue
+                ref = ('id', match['id']) if 'id' in match else ('row', match['row'])
+                matches.setdefault(ref, {**match, 'on': []})['on'].append(KEY_LABELS[field])
+            seen.setdefault((field, key), []).append({'row': row_number, 'number': profile.Number, 'name': profile.Name})
+        if matches:
+            flagged.append({
+                'row': row_number,
+                'number': profile.Number,
+                'name': profile.Name,
+                'matches': list(matches.values()),
+            })
+    return flagged
+
+
+def duplicate_clusters():
+    """
+    Groups stored customers linked by any shared key, transitively, into
+    clusters, largest first: [{'ids': [...], 'on': ['email', ...]}]. Only
+    keys held by more than one profile are read, found by grouping on the
+    key indexes, so the scan stays linear in the table size.
+    """
+    parent = {}
+
+    def find(pk):
+        while parent.setdefault(pk, pk) != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    groups = []
+    for field in KEY_FIELDS:
+        shared = (UserProfile.objects.exclude(**{field: ''}).order_by().values(field)
+                  .annotate(n=Count('pk')).filter(n__gt=1).values(field))
+        members = (UserProfile.objects.filter(**{f'{field}__in': shared})
+                   .order_by(field, 'pk').values_list(field, 'pk'))
+        for _, group in groupby(members, key=itemgetter(0)):
+            pks = [pk for _, pk in group]
+            for pk in pks[1:]:
+                root, other = find(pks[0]), find(pk)
+                if root != other:
+                    parent[other] = root
+            groups.append((KEY_LABELS[field], pks[0]))
+
+    clusters = {}
+    for pk in list(parent):
+        clusters.setdefault(find(pk), {'ids': [], 'on': set()})['ids'].append(pk)
+    for label, pk in groups:
+        clusters[find(pk)]['on'].add(label)
+    return sorted(
+        ({'ids': sorted(c['ids']), 'on': sorted(c['on'])} for c in clusters.values()),
+        key=lambda c: (-len(c['ids']), c['ids'][0]),
+    )
@@ -0,0 +1,560 @@
+import csv
+import io
+import zlib
+from operator import itemgetter
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .importers import chunked
+from .models import PRIMARY_ADDRESS_ORDERING, UserProfile, Address, ShippingAndTax
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # optional: only the Parquet format needs it
+    pyarrow = None
+
+# Customers fetched per database round trip while streaming an export.
+DEFAULT_CHUNK_SIZE = 2000
+
+# Column sources are written as '<model>.<field>' over these models.
+RECORD_MODELS = {'profile': UserProfile, 'address': Address, 'shipping': ShippingAndTax}
+
+# Order of the models' fields in a record, after the profile pk.
+RECORD_ORDER = ('profile', 'shipping', 'address')
+
+
+# --- Helper: Shared row pipeline ---
+# Exports read plain value tuples rather than model instances: a record is
+# (profile pk, *profile fields, *shipping fields, *primary address fields),
+# holding only the fields the target's columns use. Profiles (with their
+# shipping row joined) stream in pk order; the primary addresses of each
+# chunk come from one more query.
+def export_queryset():
+    # Model instances, for callers that need more than the export columns.
+    return UserProfile.objects.order_by('pk').with_primary_address().select_related('shipping_tax')
+
+
+def get_chunk_size(value=None):
+    return value or getattr(settings, 'EXPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+
+
+def _profile_rows(target, after, chunk_size):
+    # The next chunk by keyset on pk: every chunk is an index range scan.
+    shipping = [f'shipping_tax__{field}' for field in target.layout['shipping']]
+    queryset = UserProfile.objects.order_by('pk').values_list('pk', *target.layout['profile'], *shipping)
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    return queryset[:chunk_size]
+
+
+def _address_rows(target, rows):
+    return Address.objects.filter(user_id__in=[row[0] for row in rows]).order_by(
+        'user_id', *PRIMARY_ADDRESS_ORDERING
+    ).values_list('user_id', *target.layout['address'])
+
+
+def _add_addresses(target, rows, address_rows):
+    primary = {}
+    for address in address_rows:
+        primary.setdefault(address[0], address[1:])
+    missing = (None,) * len(target.layout['address'])
+    return [row + primary.get(row[0], missing) for row in rows]
+
+
+def iter_customer_records(target=None, chunk_size=None):
+    """
+    Walks every customer once, in pk order, yielding `target`'s records
+    (CSV by default). Only `chunk_size` profiles are held at once.
+    """
+    target = target or CSV
+    chunk_size = get_chunk_size(chunk_size)
+    after = None
+    while True:
+        rows = list(_profile_rows(target, after, chunk_size))
+        if not rows:
+            return
+        if target.layout['address']:
+            rows = _add_addresses(target, rows, _address_rows(target, rows))
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][0]
+
+
+async def aiter_customer_records(target=None, chunk_size=None):
+    """
+    iter_customer_records() for async code, on the async ORM.
+    """
+    target = target or CSV
+    chunk_size = get_chunk_size(chunk_size)
+    after = None
+    while True:
+        rows = [row async for row in _profile_rows(target, after, chunk_size)]
+        if not rows:
+            return
+        if target.layout['address']:
+            rows = _add_addresses(target, rows, [address async for address in _address_rows(target, rows)])
+        for record in rows:
+            yield record
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][0]
+
+
+class Computed:
+    """
+    A column derived from other fields: `func` is called with their values
+    (None where the related row is missing), in `sources` order.
+    """
+    def __init__(self, func, *sources):
+        self.func = func
+        self.sources = sources
+
+
+def compile_column(positions, source, default=None):
+    """
+    Turns a column source into a function of a record, given the record
+    position of every '<model>.<field>': a field reads its value (`default`
+    if it is None or the related row is missing), a Computed column calls
+    its function.
+    """
+    if isinstance(source, Computed):
+        func, indexes = source.func, [positions[s] for s in source.sources]
+        if len(indexes) == 1:
+            index = indexes[0]
+            return lambda record: func(record[index])
+        return lambda record: func(*[record[i] for i in indexes])
+    index = positions[source]
+    if default is None:
+        return itemgetter(index)
+    return lambda record: default if record[index] is None else record[index]
+
+
+class ExportTarget:
+    """
+    A declarative export format: an ordered list of (header, source) or
+    (header, source, default) columns over the customer records. The
+    fields the columns read and their getters are worked out once, so
+    fetching reads just those fields and a row is a list of lookups.
+    """
+
+    def __init__(self, name, label, columns, basename):
+        self.name = name
+        self.label = label
+        self.basename = basename
+        self.headers = [column[0] for column in columns]
+
+        # model -> fields the records carry, each once.
+        self.layout = {model: [] for model in RECORD_ORDER}
+        for column in columns:
+            sources = column[1].sources if isinstance(column[1], Computed) else [column[1]]
+            for source in sources:
+                model, _, field = source.partition('.')
+                if field not in self.layout[model]:
+                    self.layout[model].append(field)
+        self.sources = [(model, field) for model in RECORD_ORDER for field in self.layout[model]]
+        positions = {f'{model}.{field}': index for index, (model, field) in enumerate(self.sources, 1)}
+
+        self.getters = [compile_column(positions, *column[1:]) for column in columns]
+        # The model field behind each column (None for computed ones), for typed formats.
+        self.fields = [
+            None if isinstance(column[1], Computed) else
+            RECORD_MODELS[column[1].partition('.')[0]]._meta.get_field(column[1].partition('.')[2])
+            for column in columns
+        ]
+
+    def row(self, record):
+        return [getter(record) for getter in self.getters]
+
+    def instance_record(self, user):
+        """
+        The record of a UserProfile instance, read through `primary_address`
+        and `shipping_tax`; for instances that are already loaded.
+        """
+        objects = {'profile': user, 'address': user.primary_address, 'shipping': getattr(user, 'shipping_tax', None)}
+        return (user.pk, *[
+            None if objects[model] is None else getattr(objects[model], field) for model, field in self.sources
+        ])
+
+
+EXPORT_TARGETS = {}
+
+
+def register_target(target):
+    EXPORT_TARGETS[target.name] = target
+    return target
+
+
+def get_target(name):
+    """
+    The registered target called `name`; raises KeyError for unknown ones.
+    """
+    return EXPORT_TARGETS[name]
+
+
+# --- Helper: Value transforms shared by targets ---
+def _contact_words(contact):
+    return (contact or '').split()
+
+
+def _first_name(contact):
+    words = _contact_words(contact)
+    return words[0] if words else ''
+
+
+def _last_name(contact):
+    return ' '.join(_contact_words(contact)[1:])
+
+
+first_name = Computed(_first_name, 'address.AddressContact')
+last_name = Computed(_last_name, 'address.AddressContact')
+
+
+def yes_no(source):
+    return Computed(lambda value: 'true' if value else 'false', source)
+
+
+# --- Targets ---
+# The app's own format; import_users_csv reads it back.
+CSV = register_target(ExportTarget('csv', 'CSV', [
+    ('Name', 'profile.Name'),
+    ('Group', 'profile.Group'),
+    ('Account Number', 'profile.Number', ''),
+    ('Mobile', 'profile.Mobile'),
+    ('Email', 'profile.Email'),
+    ('Status', 'profile.Status'),
+    ('Credit Limit', 'profile.CreditLimit', ''),
+    ('Payment Terms', 'profile.PaymentTerms'),
+    ('Salesman', 'profile.Salesman'),
+    ('Priority', 'profile.DefaultPriority', ''),
+    ('Alert Notes', 'profile.AlertNotes', ''),
+    ('Address Name', 'address.AddressName', ''),
+    ('Address Contact', 'address.AddressContact', ''),
+    ('Address Type', 'address.AddressType', ''),
+    ('Address', 'address.Address', ''),
+    ('City', 'address.City', ''),
+    ('State', 'address.State', ''),
+    ('Zip', 'address.Zip', ''),
+    ('Country', 'address.Country', ''),
+    ('Tax Rate', 'shipping.TaxRate', ''),
+    ('Tax Exempt', 'shipping.TaxExempt', False),
+    ('Tax Exempt Number', 'shipping.TaxExemptNumber', ''),
+    ('URL', 'shipping.URL', ''),
+    ('Carrier', 'shipping.CarrierName', ''),
+    ('Shipping Terms', 'shipping.ShippingTerms', ''),
+    ('Is Default', 'address.IsDefault', False),
+    ('Active', 'profile.Active'),
+], 'user_data'))
+
+# Fishbowl's customer import; the model fields are named after its columns.
+FISHBOWL = register_target(ExportTarget('fishbowl', 'Fishbowl', [
+    ('Name', 'profile.Name'),
+    ('AddressName', 'address.AddressName', ''),
+    ('AddressContact', 'address.AddressContact', ''),
+    ('AddressType', 'address.AddressType', ''),
+    ('IsDefault', yes_no('address.IsDefault')),
+    ('Address', 'address.Address', ''),
+    ('City', 'address.City', ''),
+    ('State', 'address.State', ''),
+    ('Zip', 'address.Zip', ''),
+    ('Country', 'address.Country', ''),
+    ('Mobile', 'profile.Mobile', ''),
+    ('Fax', 'address.Fax', ''),
+    ('Email', 'profile.Email', ''),
+    ('Pager', 'address.Pager', ''),
+    ('Web', 'address.Web', ''),
+    ('Group', 'profile.Group', ''),
+    ('CreditLimit', 'profile.CreditLimit', ''),
+    ('Status', 'profile.Status', ''),
+    ('Active', yes_no('profile.Active')),
+    ('TaxRate', 'shipping.TaxRate', ''),
+    ('Salesman', 'profile.Salesman', ''),
+    ('DefaultPriority', 'profile.DefaultPriority', ''),
+    ('Number', 'profile.Number', ''),
+    ('PaymentTerms', 'profile.PaymentTerms', ''),
+    ('TaxExempt', yes_no('shipping.TaxExempt')),
+    ('TaxExemptNumber', 'shipping.TaxExemptNumber', ''),
+    ('URL', 'shipping.URL', ''),
+    ('CarrierName', 'shipping.CarrierName', ''),
+    ('CarrierService', 'shipping.CarrierService', ''),
+    ('ShippingTerms', 'shipping.ShippingTerms', ''),
+    ('AlertNotes', 'profile.AlertNotes', ''),
+    ('QuickBooksClassName', 'profile.QuickBooksClassName', ''),
+    ('ToBeEmailed', yes_no('shipping.ToBeEmailed')),
+    ('ToBePrinted', yes_no('shipping.ToBePrinted')),
+    ('IssuableStatus', 'profile.IssuableStatus', ''),
+], 'fishbowl_customers'))
+
+# WooCommerce customer CSV import: billing and shipping from the primary address.
+WOOCOMMERCE = register_target(ExportTarget('woocommerce', 'WooCommerce', [
+    ('username', 'profile.Number', ''),
+    ('email', 'profile.Email', ''),
+    ('first_name', first_name),
+    ('last_name', last_name),
+    ('billing_first_name', first_name),
+    ('billing_last_name', last_name),
+    ('billing_company', 'profile.Name'),
+    ('billing_address_1', 'address.Address', ''),
+    ('billing_city', 'address.City', ''),
+    ('billing_state', 'address.State', ''),
+    ('billing_postcode', 'address.Zip', ''),
+    ('billing_country', 'address.Country', ''),
+    ('billing_email', 'profile.Email', ''),
+    ('billing_phone', 'profile.Mobile', ''),
+    ('shipping_first_name', first_name),
+    ('shipping_last_name', last_name),
+    ('shipping_company', 'profile.Name'),
+    ('shipping_address_1', 'address.Address', ''),
+    ('shipping_city', 'address.City', ''),
+    ('shipping_state', 'address.State', ''),
+    ('shipping_postcode', 'address.Zip', ''),
+    ('shipping_country', 'address.Country', ''),
+], 'woocommerce_customers'))
+
+# Zoho CRM Accounts import.
+ZOHO_CRM = register_target(ExportTarget('zoho', 'Zoho CRM', [
+    ('Account Name', 'profile.Name'),
+    ('Account Number', 'profile.Number', ''),
+    ('Account Type', 'profile.Group', ''),
+    ('Phone', 'profile.Mobile', ''),
+    ('Fax', 'address.Fax', ''),
+    ('Website', 'shipping.URL', ''),
+    ('Billing Street', 'address.Address', ''),
+    ('Billing City', 'address.City', ''),
+    ('Billing State', 'address.State', ''),
+    ('Billing Code', 'address.Zip', ''),
+    ('Billing Country', 'address.Country', ''),
+    ('Shipping Street', 'address.Address', ''),
+    ('Shipping City', 'address.City', ''),
+    ('Shipping State', 'address.State', ''),
+    ('Shipping Code', 'address.Zip', ''),
+    ('Shipping Country', 'address.Country', ''),
+    ('Description', 'profile.AlertNotes', ''),
+], 'zoho_accounts'))
+
+EXPORT_HEADERS = CSV.headers
+
+
+def export_row(user):
+    return CSV.row(CSV.instance_record(user))
+
+
+# --- Helper: Output formats ---
+# An encoder turns batches of records into text or bytes: header() once,
+# encode() per batch, footer() at the end. The sync and async pipelines
+# below drive the same encoders.
+class CsvEncoder:
+    def __init__(self, target):
+        self.target = target
+
+    def _write(self, rows):
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return buffer.getvalue()
+
+    def header(self):
+        return self._write([self.target.headers])
+
+    def encode(self, records):
+        return self._write(map(self.target.row, records))
+
+    def footer(self):
+        return ''
+
+
+class NdjsonEncoder:
+    # One JSON object per customer and line; decimals are written as strings.
+    def __init__(self, target):
+        self.target = target
+        self.json = DjangoJSONEncoder()
+
+    def header(self):
+        return ''
+
+    def encode(self, records):
+        headers, row, encode = self.target.headers, self.target.row, self.json.encode
+        return ''.join(encode(dict(zip(headers, row(record)))) + '\n' for record in records)
+
+    def footer(self):
+        return ''
+
+
+class StreamSink(io.RawIOBase):
+    """
+    Write-only file that hands out what was written so far via drain(),
+    while tell() keeps counting from the start, as the Parquet writer
+    records absolute offsets in the footer.
+    """
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def arrow_type(field):
+    # Columns computed by callables, and text fields, are strings.
+    kind = field.get_internal_type() if field is not None else None
+    if kind == 'DecimalField':
+        return pyarrow.decimal128(field.max_digits, field.decimal_places)
+    if kind in ('IntegerField', 'BigIntegerField', 'PositiveIntegerField', 'AutoField', 'BigAutoField'):
+        return pyarrow.int64()
+    if kind == 'BooleanField':
+        return pyarrow.bool_()
+    if kind == 'DateTimeField':
+        return pyarrow.timestamp('us', tz='UTC')
+    return pyarrow.string()
+
+
+def _arrow_values(values, type_):
+    if pyarrow.types.is_string(type_):
+        return [None if value is None else str(value) for value in values]
+    # Blank defaults of typed columns are missing values.
+    return [None if value == '' else value for value in values]
+
+
+class ParquetEncoder:
+    """
+    Writes one row group per batch; column types come from the model
+    fields behind the columns. Bytes are handed out as each row group is
+    written, so the file is never held whole in memory.
+    """
+    def __init__(self, target):
+        self.target = target
+        self.schema = pyarrow.schema([(h, arrow_type(f)) for h, f in zip(target.headers, target.fields)])
+        self.sink = StreamSink()
+        self.writer = pyarrow.parquet.ParquetWriter(self.sink, self.schema)
+
+    def header(self):
+        return self.sink.drain()
+
+    def encode(self, records):
+        columns = zip(*map(self.target.row, records))
+        self.writer.write_table(pyarrow.Table.from_arrays(
+            [pyarrow.array(_arrow_values(values, f.type), type=f.type) for values, f in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+        return self.sink.drain()
+
+    def footer(self):
+        self.writer.close()
+        return self.sink.drain()
+
+
+class Gzipper:
+    # Incremental gzip of text (as UTF-8) or byte chunks.
+    def __init__(self, level=6):
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, chunk):
+        return self.compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+
+    def flush(self):
+        return self.compressor.flush()
+
+
+class ExportFormat:
+    def __init__(self, name, label, content_type, extension, encoder, available=True):
+        self.name = name
+        self.label = label
+        self.content_type = content_type
+        self.extension = extension
+        self.encoder = encoder
+        self.available = available
+
+
+EXPORT_FORMATS = {
+    export_format.name: export_format for export_format in [
+        ExportFormat('csv', 'CSV', 'text/csv', 'csv', CsvEncoder),
+        ExportFormat('ndjson', 'NDJSON', 'application/x-ndjson', 'ndjson', NdjsonEncoder),
+        ExportFormat(
+            'parquet', 'Parquet', 'application/vnd.apache.parquet', 'parquet', ParquetEncoder,
+            available=pyarrow is not None,
+        ),
+    ]
+}
+
+
+def get_format(name):
+    """
+    The export format called `name`; raises KeyError for unknown ones.
+    Check `available` before use: Parquet needs pyarrow installed.
+    """
+    return EXPORT_FORMATS[name]
+
+
+def export_filename(target, export_format, compress=False):
+    return f"{target.basename}.{export_format.extension}{'.gz' if compress else ''}"
+
+
+def iter_export(target=CSV, export_format=EXPORT_FORMATS['csv'], compress=False, records=None, chunk_size=None):
+    """
+    Yields the export of `records` (by default every customer, in one
+    pass) in `target`'s columns and `export_format`, gzipped if asked,
+    encoding `chunk_size` records at a time.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    if records is None:
+        records = iter_customer_records(target, chunk_size)
+    encoder = export_format.encoder(target)
+    gzipper = Gzipper() if compress else None
+
+    def chunks():
+        yield encoder.header()
+        for batch in chunked(records, chunk_size):
+            yield encoder.encode(batch)
+        yield encoder.footer()
+
+    for chunk in chunks():
+        if gzipper:
+            chunk = gzipper.compress(chunk)
+        if chunk:
+            yield chunk
+    if gzipper:
+        yield gzipper.flush()
+
+
+async def aiter_export(target=CSV, export_format=EXPORT_FORMATS['csv'], compress=False, chunk_size=None):
+    """
+    iter_export() over every customer as an async generator, for streaming
+    responses from async views.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    encoder = export_format.encoder(target)
+    gzipper = Gzipper() if compress else None
+
+    async def chunks():
+        yield encoder.header()
+        batch = []
+        async for record in aiter_customer_records(target, chunk_size):
+            batch.append(record)
+            if len(batch) >= chunk_size:
+                yield encoder.encode(batch)
+                batch = []
+        if batch:
+            yield encoder.encode(batch)
+        yield encoder.footer()
+
+    async for chunk in chunks():
+        if gzipper:
+            chunk = gzipper.compress(chunk)
+        if chunk:
+            yield chunk
+    if gzipper:
+        yield gzipper.flush()
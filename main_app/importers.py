@@ -0,0 +1,428 @@
+import csv
+import time
+from contextlib import nullcontext
+from itertools import islice
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, connection, transaction
+from django.utils import timezone
+
+from .dedupe import KEY_FIELDS, find_duplicates, set_customer_keys
+from .listing import bump_listing_version, table_record
+from .models import UserProfile, Address, ShippingAndTax
+from .validation import RowValidator
+
+# Number of CSV rows written per transaction. Each chunk costs three
+# multi-row INSERTs and a single commit instead of three commits per row.
+DEFAULT_CHUNK_SIZE = 1000
+
+# Running counts of an import, carried over when it resumes from a checkpoint.
+CHECKPOINT_TOTALS = ('imported', 'failed', 'created', 'updated', 'unchanged', 'duplicates')
+
+# Errors a bad row can cause. Anything else, such as an OperationalError
+# ("database is locked"), aborts the import instead of failing the rows,
+# so a resumed import retries the chunk.
+ROW_ERRORS = (IntegrityError, DataError, ValidationError, ValueError, TypeError, ArithmeticError)
+
+# Only a bounded slice of the created records and errors is echoed back.
+DEFAULT_PREVIEW_SIZE = 50
+MAX_ERROR_ROWS = 100
+
+# Import modes: always insert, or update existing customers matched on
+# their account number (Number) and insert the rest.
+INSERT = 'insert'
+UPSERT = 'upsert'
+IMPORT_MODES = (INSERT, UPSERT)
+
+# Model fields filled from export columns. Upserts only compare and update
+# these, so fields the CSV does not carry (Fax, Web, ...) are left alone.
+PROFILE_IMPORT_FIELDS = [
+    'Name', 'Mobile', 'Email', 'Group', 'Status', 'Active', 'CreditLimit', 'PaymentTerms',
+    'Salesman', 'DefaultPriority', 'AlertNotes',
+]
+ADDRESS_IMPORT_FIELDS = [
+    'AddressName', 'AddressContact', 'AddressType', 'IsDefault', 'Address', 'City', 'State', 'Zip', 'Country',
+]
+SHIPPING_IMPORT_FIELDS = [
+    'TaxRate', 'TaxExempt', 'TaxExemptNumber', 'URL', 'CarrierName', 'ShippingTerms',
+]
+
+
+def get_chunk_size(value=None):
+    """
+    Resolves the chunk size from an explicit value, the IMPORT_CHUNK_SIZE
+    setting, or the module default (in that order).
+    """
+    if value in (None, ''):
+        value = getattr(settings, 'IMPORT_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        value = DEFAULT_CHUNK_SIZE
+    return max(1, value)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+# --- Helper: Map one exported CSV row onto unsaved model instances ---
+def build_customer(row):
+    user_profile = UserProfile(
+        Name=row.get('Name', ''),
+        Mobile=row.get('Mobile', ''),
+        Email=row.get('Email', ''),
+        Group=row.get('Group', ''),
+        Status=row.get('Status', ''),
+        Active=row.get('Active', 'True') == 'True',
+        CreditLimit=row.get('Credit Limit') or None,
+        PaymentTerms=row.get('Payment Terms', ''),
+        Salesman=row.get('Salesman', ''),
+        DefaultPriority=row.get('Priority') or 5,
+        AlertNotes=row.get('Alert Notes', ''),
+        QuickBooksClassName='',
+        IssuableStatus='',
+        Number=row.get('Account Number') or None
+    )
+
+    address = Address(
+        AddressName=row.get('Address Name', ''),
+        AddressContact=row.get('Address Contact', ''),
+        AddressType=row.get('Address Type', ''),
+        IsDefault=row.get('Is Default', 'False') == 'True',
+        Address=row.get('Address', ''),
+        City=row.get('City', ''),
+        State=row.get('State', ''),
+        Zip=row.get('Zip', ''),
+        Country=row.get('Country', ''),
+        Fax='',
+        Pager='',
+        Web=''
+    )
+
+    shipping = ShippingAndTax(
+        TaxRate=row.get('Tax Rate') or None,
+        TaxExempt=row.get('Tax Exempt', 'False') == 'True',
+        TaxExemptNumber=row.get('Tax Exempt Number', ''),
+        URL=row.get('URL', ''),
+        CarrierName=row.get('Carrier', ''),
+        CarrierService='',
+        ShippingTerms=row.get('Shipping Terms', ''),
+        ToBeEmailed=False,
+        ToBePrinted=False,
+    )
+    set_customer_keys(user_profile, address)
+    return user_profile, address, shipping
+
+
+def _create_profiles(profiles, chunk_size):
+    if connection.features.can_return_rows_from_bulk_insert:
+        return UserProfile.objects.bulk_create(profiles, batch_size=chunk_size)
+    # Older SQLite builds cannot RETURNING the new keys; fall back to
+    # per-row inserts, still inside the chunk's single transaction.
+    for profile in profiles:
+        profile.save(force_insert=True)
+    return profiles
+
+
+def save_customer(customer):
+    """
+    Saves one unsaved (UserProfile, Address, ShippingAndTax) triple in a
+    single transaction: one commit, and never a profile without its
+    address and shipping rows.
+    """
+    profile, address, shipping = customer
+    with transaction.atomic():
+        profile.save(force_insert=True)
+        address.user = profile
+        address.save(force_insert=True)
+        shipping.user = profile
+        shipping.save(force_insert=True)
+    return customer
+
+
+def import_chunk(customers, chunk_size=None):
+    """
+    Writes a list of (UserProfile, Address, ShippingAndTax) tuples in one
+    transaction and returns the saved (profile, address) pairs.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    with transaction.atomic():
+        profiles = _create_profiles([c[0] for c in customers], chunk_size)
+
+        addresses, shippings = [], []
+        for profile, (_, address, shipping) in zip(profiles, customers):
+            address.user = profile
+            shipping.user = profile
+            addresses.append(address)
+            shippings.append(shipping)
+
+        Address.objects.bulk_create(addresses, batch_size=chunk_size)
+        ShippingAndTax.objects.bulk_create(shippings, batch_size=chunk_size)
+        # bulk_create() sends no post_save signals.
+        bump_listing_version()
+    return list(zip(profiles, addresses))
+
+
+def _same(current, incoming):
+    # The export writes NULL as an empty string; treat the two as equal so
+    # re-importing an export is a no-op.
+    if current in (None, '') and incoming in (None, ''):
+        return True
+    return current == incoming
+
+
+def apply_changes(instance, incoming, fields):
+    """
+    Copies the values of `fields` from `incoming` onto `instance` where
+    they differ and returns the names of the fields that changed.
+    """
+    changed = []
+    for name in fields:
+        value = instance._meta.get_field(name).to_python(getattr(incoming, name))
+        if not _same(getattr(instance, name), value):
+            setattr(instance, name, value)
+            changed.append(name)
+    return changed
+
+
+def upsert_chunk(customers, chunk_size=None):
+    """
+    Writes a chunk of customers keyed on account number in one transaction.
+
+    Existing profiles for the chunk's numbers are loaded with one query
+    (plus the address prefetch); changed ones go through bulk_update with
+    only the changed fields, unknown numbers and rows without a number
+    through bulk_create. Returns the saved (profile, address) pairs and a
+    dict of created/updated/unchanged counts.
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    numbers = {customer[0].Number for customer in customers if customer[0].Number}
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0}
+
+    with transaction.atomic():
+        existing = {
+            profile.Number: profile
+            for profile in UserProfile.objects.filter(Number__in=numbers)
+            .with_primary_address().select_related('shipping_tax')
+        }
+        saved, new_customers, pending_numbers = [], [], {}
+        updates = {UserProfile: {}, Address: {}, ShippingAndTax: {}}
+        update_fields = {UserProfile: set(), Address: set(), ShippingAndTax: set()}
+        addresses_to_create, shippings_to_create = [], []
+
+        now = timezone.now()
+
+        def track(instance, fields):
+            if fields:
+                # bulk_update() does not apply auto_now.
+                instance.updated_at = now
+                updates[type(instance)][instance.pk] = instance
+                update_fields[type(instance)].update(fields + ['updated_at'])
+            return bool(fields)
+
+        for customer in customers:
+            profile, address, shipping = customer
+            current = existing.get(profile.Number)
+            if current is None:
+                if profile.Number in pending_numbers:
+                    # Repeated number within the chunk: the later row wins.
+                    new_customers[pending_numbers[profile.Number]] = customer
+                    stats['updated'] += 1
+                    continue
+                if profile.Number:
+                    pending_numbers[profile.Number] = len(new_customers)
+                new_customers.append(customer)
+                continue
+
+            changed = track(current, apply_changes(current, profile, PROFILE_IMPORT_FIELDS + list(KEY_FIELDS)))
+
+            current_address = current.primary_address
+            if current_address is None:
+                address.user = current
+                addresses_to_create.append(address)
+                current.ordered_addresses = [address]
+                current_address = address
+                changed = True
+            else:
+                changed = track(current_address, apply_changes(current_address, address, ADDRESS_IMPORT_FIELDS)) or changed
+
+            current_shipping = getattr(current, 'shipping_tax', None)
+            if current_shipping is None:
+                shipping.user = current
+                shippings_to_create.append(shipping)
+                changed = True
+            else:
+                changed = track(current_shipping, apply_changes(current_shipping, shipping, SHIPPING_IMPORT_FIELDS)) or changed
+
+            stats['updated' if changed else 'unchanged'] += 1
+            saved.append((current, current_address))
+
+        for model, objects in updates.items():
+            if objects:
+                model.objects.bulk_update(list(objects.values()), sorted(update_fields[model]), batch_size=chunk_size)
+        Address.objects.bulk_create(addresses_to_create, batch_size=chunk_size)
+        ShippingAndTax.objects.bulk_create(shippings_to_create, batch_size=chunk_size)
+        if any(updates.values()) or addresses_to_create or shippings_to_create:
+            bump_listing_version()
+
+        if new_customers:
+            saved.extend(import_chunk(new_customers, chunk_size))
+            stats['created'] += len(new_customers)
+    return saved, stats
+
+
+def write_chunk(customers, mode=INSERT, chunk_size=None):
+    if mode == UPSERT:
+        return upsert_chunk(customers, chunk_size)
+    saved = import_chunk(customers, chunk_size)
+    return saved, {'created': len(saved), 'updated': 0, 'unchanged': 0}
+
+
+def _import_one_by_one(numbered_rows, mode=INSERT):
+    """
+    Fallback for a chunk whose bulk write failed on bad data: retries each
+    row in its own transaction so the bad rows can be reported and the
+    rest kept.
+    """
+    saved, errors = [], []
+    stats = {'created': 0, 'updated': 0, 'unchanged': 0}
+    for row_number, row in numbered_rows:
+        try:
+            if mode == UPSERT:
+                row_saved, row_stats = upsert_chunk([build_customer(row)], chunk_size=1)
+            else:
+                profile, address, _ = save_customer(build_customer(row))
+                row_saved, row_stats = [(profile, address)], {'created': 1, 'updated': 0, 'unchanged': 0}
+        except ROW_ERRORS as e:
+            errors.append({'row': row_number, 'message': str(e)})
+            continue
+        saved.extend(row_saved)
+        for key, value in row_stats.items():
+            stats[key] += value
+    return saved, stats, errors
+
+
+class OffsetCsvReader:
+    """
+    csv.DictReader over a binary UTF-8 file that tracks the byte offset
+    just after the last row returned, and can start at such an offset:
+    the header line is read from the top, then reading seeks straight past
+    the rows before it.
+    """
+
+    def __init__(self, file, offset=0):
+        self.file = file
+        file.seek(0)
+        header = file.readline()
+        self.fieldnames = next(csv.reader([header.decode('utf-8-sig')]), [])
+        self.offset = max(offset, len(header))
+        file.seek(self.offset)
+
+    def _lines(self):
+        # csv only pulls the lines of the row it is parsing, so once a row
+        # is returned the offset is at its end.
+        for line in iter(self.file.readline, b''):
+            self.offset += len(line)
+            yield line.decode('utf-8')
+
+    def __iter__(self):
+        return iter(csv.DictReader(self._lines(), fieldnames=self.fieldnames))
+
+
+def bulk_import_rows(rows, chunk_size=None, preview_size=None, mode=INSERT, on_chunk=None, validate=True,
+                     flag_duplicates=True, checkpoint=None):
+    """
+    Imports CSV rows (dicts keyed by the export headers) in chunks, either
+    inserting every row or upserting on account number (see IMPORT_MODES).
+
+    With `validate`, each chunk is first checked against UnifiedUserForm
+    (in parallel for large chunks) and invalid rows are reported instead
+    of written. With `flag_duplicates`, rows sharing a blocking key with a
+    stored customer or an earlier row of their chunk are still written but
+    reported as possible duplicates (see dedupe.py).
+
+    Memory stays bounded by the chunk size: only the first `preview_size`
+    saved records and the first MAX_ERROR_ROWS errors are kept. Returns a
+    summary dict with counts, the preview, error rows and rows/second.
+    `on_chunk(imported, failed)` is called after every committed chunk.
+
+    A `checkpoint` (see checkpoints.ResumableImport) makes the import
+    resumable: `rows` continue after its `rows_done` rows, counts start
+    from its `totals`, and each chunk is written in one transaction with
+    a `checkpoint.advance(rows_done, totals)` call.
+    """
+    if mode not in IMPORT_MODES:
+        raise ValueError(f'Unknown import mode: {mode}')
+    chunk_size = get_chunk_size(chunk_size)
+    if preview_size is None:
+        preview_size = getattr(settings, 'IMPORT_PREVIEW_SIZE', DEFAULT_PREVIEW_SIZE)
+    started = time.perf_counter()
+    resumed_from = checkpoint.rows_done if checkpoint else 0
+    totals = {key: 0 for key in CHECKPOINT_TOTALS}
+    if checkpoint:
+        totals.update(checkpoint.totals)
+    imported_before = totals['imported']
+    preview, errors, duplicates = [], [], []
+
+    with (RowValidator() if validate else nullcontext()) as validator:
+        for numbered_rows in chunked(enumerate(rows, start=resumed_from + 1), chunk_size):
+            last_row = numbered_rows[-1][0]
+            chunk_errors = []
+            if validator is not None:
+                numbered_rows, chunk_errors = validator(numbered_rows)
+
+            saved, stats = [], {}
+            with transaction.atomic() if checkpoint else nullcontext():
+                if numbered_rows:
+                    customers = None
+                    try:
+                        customers = [build_customer(row) for _, row in numbered_rows]
+                    except ROW_ERRORS:
+                        pass
+                    if customers is not None:
+                        if flag_duplicates:
+                            flagged = find_duplicates([(n, c) for (n, _), c in zip(numbered_rows, customers)])
+                            totals['duplicates'] += len(flagged)
+                            duplicates.extend(flagged[:max(0, MAX_ERROR_ROWS - len(duplicates))])
+                        try:
+                            saved, stats = write_chunk(customers, mode, chunk_size)
+                        except ROW_ERRORS:
+                            customers = None
+                    if customers is None:
+                        # Some row is bad: retry one by one to report it and keep the rest.
+                        saved, stats, write_errors = _import_one_by_one(numbered_rows, mode)
+                        chunk_errors = sorted(chunk_errors + write_errors, key=lambda e: e['row'])
+
+                totals['imported'] += sum(stats.values())
+                totals['failed'] += len(chunk_errors)
+                for key, value in stats.items():
+                    totals[key] += value
+                if checkpoint:
+                    checkpoint.advance(last_row, totals)
+
+            imported, failed = totals['imported'], totals['failed']
+            for user_profile, address in saved[:max(0, preview_size - len(preview))]:
+                preview.append(table_record(user_profile, address))
+            errors.extend(chunk_errors[:max(0, MAX_ERROR_ROWS - len(errors))])
+            if on_chunk:
+                on_chunk(imported, failed)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'mode': mode,
+        **totals,
+        'preview': preview,
+        'errors': errors,
+        'possible_duplicates': duplicates,
+        'resumed_from_row': resumed_from,
+        'chunk_size': chunk_size,
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_second': round((totals['imported'] - imported_before) / elapsed, 1) if elapsed else None,
+    }
@@ -0,0 +1,176 @@
+import tempfile
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .exporters import export_filename, get_format, get_target, iter_customer_records, iter_export, DEFAULT_CHUNK_SIZE as EXPORT_CHUNK_SIZE
+from .checkpoints import import_csv_resumable
+from .models import Job, UserProfile
+
+
+def _report(job, processed_rows, progress):
+    Job.objects.filter(pk=job.pk).update(processed_rows=processed_rows, progress=min(progress, 1.0))
+
+
+def run_import_job(job):
+    # Checkpointed, so a retried job continues after its last committed chunk.
+    size = job.input_file.size or 1
+    with job.input_file.open('rb') as f:
+        result = import_csv_resumable(
+            f,
+            mode=job.options.get('mode', 'insert'),
+            chunk_size=job.options.get('chunk_size'),
+            restart=job.options.get('restart', False),
+            on_chunk=lambda imported, failed: _report(job, imported + failed, f.tell() / size),
+        )
+    result.pop('preview', None)
+    return result
+
+
+def run_export_job(job):
+    target = get_target(job.options.get('target', 'csv'))
+    export_format = get_format(job.options.get('format', 'csv'))
+    compress = job.options.get('compress', False)
+    total = UserProfile.objects.count() or 1
+    every = getattr(settings, 'EXPORT_CHUNK_SIZE', EXPORT_CHUNK_SIZE)
+    counted = {'rows': 0}
+
+    def records():
+        for rows, record in enumerate(iter_customer_records(target), 1):
+            yield record
+            counted['rows'] = rows
+            if rows % every == 0:
+                _report(job, rows, rows / total)
+
+    with tempfile.TemporaryFile() as tmp:
+        for chunk in iter_export(target, export_format, compress, records=records()):
+            tmp.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        tmp.seek(0)
+        job.output_file.save(f'{job.pk}_{export_filename(target, export_format, compress)}', File(tmp), save=False)
+    return {'exported': counted['rows']}
+
+
+JOB_RUNNERS = {
+    Job.IMPORT: run_import_job,
+    Job.EXPORT: run_export_job,
+}
+
+
+# -----------------------
+# Leases
+# -----------------------
+# A running job belongs to the run_jobs supervisor that claimed it, which
+# renews heartbeat_at on every poll. A RUNNING job whose lease lapsed has
+# no live supervisor: it goes back to the queue, and fails for good once
+# it has been claimed JOB_MAX_ATTEMPTS times (it may be what kills its
+# worker). Imports resume at their checkpoint.
+DEFAULT_LEASE_SECONDS = 60
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def _stale_running_jobs():
+    cutoff = timezone.now() - timedelta(seconds=getattr(settings, 'JOB_LEASE_SECONDS', DEFAULT_LEASE_SECONDS))
+    return Job.objects.filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True), status=Job.RUNNING)
+
+
+def claim_job(job_id):
+    """
+    Atomically moves a pending job to running. Returns False if another
+    worker got there first.
+    """
+    now = timezone.now()
+    return Job.objects.filter(pk=job_id, status=Job.PENDING).update(
+        status=Job.RUNNING, started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+    ) == 1
+
+
+def unclaim_job(job_id):
+    """Returns a claimed job that never reached a worker to the queue."""
+    Job.objects.filter(pk=job_id, status=Job.RUNNING).update(
+        status=Job.PENDING, started_at=None, heartbeat_at=None, attempts=F('attempts') - 1,
+    )
+
+
+def renew_leases(job_ids):
+    Job.objects.filter(pk__in=job_ids, status=Job.RUNNING).update(heartbeat_at=timezone.now())
+
+
+def release_job(job_id, error):
+    """
+    A running job whose worker died: back to the queue, or failed once it
+    has used its attempts. Returns the new status, or None if the job was
+    no longer running.
+    """
+    running = Job.objects.filter(pk=job_id, status=Job.RUNNING)
+    max_attempts = getattr(settings, 'JOB_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+    if running.filter(attempts__lt=max_attempts).update(
+        status=Job.PENDING, error=error, started_at=None, heartbeat_at=None,
+    ):
+        return Job.PENDING
+    if running.update(status=Job.FAILED, error=error, finished_at=timezone.now()):
+        return Job.FAILED
+    return None
+
+
+def release_stale_jobs():
+    """
+    Releases every running job whose lease lapsed. Returns {job id: new
+    status}.
+    """
+    released = {}
+    for job_id in _stale_running_jobs().values_list('pk', flat=True):
+        status = release_job(job_id, 'Its job worker stopped without recording an outcome.')
+        if status:
+            released[job_id] = status
+    return released
+
+
+def retry_job(job_id):
+    """
+    Puts a failed job, or a running one whose lease lapsed, back in the
+    queue with a fresh set of attempts; an import then resumes at its
+    checkpoint, even if it was first queued with `restart`. Returns False
+    for any other job.
+    """
+    retryable = Job.objects.filter(pk=job_id).filter(
+        Q(status=Job.FAILED) | Q(pk__in=_stale_running_jobs().values('pk'))
+    )
+    job = retryable.first()
+    if job is None:
+        return False
+    job.options.pop('restart', None)
+    return retryable.update(
+        status=Job.PENDING, options=job.options, error='', started_at=None, finished_at=None, heartbeat_at=None,
+        attempts=0,
+    ) == 1
+
+
+def run_job(job_id):
+    """
+    Runs one claimed job to completion and records the outcome on the Job
+    row. Executed inside worker processes by the run_jobs command.
+    """
+    job = Job.objects.get(pk=job_id)
+    try:
+        result = JOB_RUNNERS[job.kind](job)
+    except Exception as e:
+        job.status = Job.FAILED
+        job.error = f'{e}\n{traceback.format_exc()}'
+    else:
+        job.status = Job.DONE
+        job.result = result
+        job.error = ''
+        job.progress = 1.0
+        job.processed_rows = result.get('imported', result.get('exported', 0)) + result.get('failed', 0)
+    job.finished_at = timezone.now()
+    # Only while this claim still holds: a job released after its lease
+    # lapsed may already be running again elsewhere.
+    Job.objects.filter(pk=job.pk, status=Job.RUNNING, attempts=job.attempts).update(
+        status=job.status, result=job.result, error=job.error, progress=job.progress,
+        processed_rows=job.processed_rows, output_file=job.output_file.name or '', finished_at=job.finished_at,
+    )
+    return job.status
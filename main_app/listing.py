@@ -0,0 +1,187 @@
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F, Q
+
+from .models import CacheVersion, UserProfile, CustomerSummary
+from .search import search_customer_ids, fts_available
+from .summary import summary_available
+
+DEFAULT_PAGE_SIZE = 5
+MAX_PAGE_SIZE = 100
+
+# CacheVersion row of the customer data; every cached page key embeds it.
+LISTING_VERSION = 'customer_listing'
+DEFAULT_CACHE_TIMEOUT = 300
+
+
+# Keys of a customer table row, and the CustomerSummary fields holding them.
+TABLE_COLUMNS = ('id', 'LocationName', 'Address', 'City', 'State', 'Zip', 'ContactPerson', 'Phone', 'Email')
+SUMMARY_FIELDS = ('pk',) + TABLE_COLUMNS[1:]
+
+
+# --- Helper: One row of the customer table ---
+def table_record(user_profile, address):
+    return {
+        'id': user_profile.pk,
+        'LocationName': user_profile.Name,
+        'Address': address.Address if address else '',
+        'City': address.City if address else '',
+        'State': address.State if address else '',
+        'Zip': address.Zip if address else '',
+        'ContactPerson': address.AddressContact if address else '',
+        'Phone': user_profile.Mobile,
+        'Email': user_profile.Email,
+    }
+
+
+def parse_page_size(value):
+    """
+    Clamps a requested page size to 1..CUSTOMER_API_MAX_PAGE_SIZE, using
+    the default for missing or malformed values.
+    """
+    max_size = getattr(settings, 'CUSTOMER_API_MAX_PAGE_SIZE', MAX_PAGE_SIZE)
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return min(max(1, value), max_size)
+
+
+def summary_record(row):
+    return dict(zip(TABLE_COLUMNS, row))
+
+
+def profile_record(user):
+    return table_record(user, user.primary_address)
+
+
+def _records_source(use_summary):
+    # (queryset, row -> table record): the joinless summary table where its
+    # triggers exist, else profiles with their prefetched addresses.
+    if use_summary:
+        return CustomerSummary.objects.values_list(*SUMMARY_FIELDS), summary_record
+    return UserProfile.objects.with_primary_address(), profile_record
+
+
+def _page_queryset(after, page_size, use_summary):
+    queryset, to_record = _records_source(use_summary)
+    queryset = queryset.order_by('pk')
+    if after is not None:
+        queryset = queryset.filter(pk__gt=after)
+    # Fetch one extra row to learn whether another page exists.
+    return queryset[:page_size + 1], to_record
+
+
+def _page(records, page_size):
+    has_more = len(records) > page_size
+    records = records[:page_size]
+    return {
+        'results': records,
+        'next_cursor': records[-1]['id'] if has_more else None,
+        'has_more': has_more,
+    }
+
+
+def customer_page(after=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Returns one page of the customer table using keyset pagination on pk:
+    customers with pk greater than `after`, in pk order. Seeking on the
+    primary key keeps every page an index range scan, however deep it is.
+    """
+    queryset, to_record = _page_queryset(after, page_size, summary_available())
+    return _page([to_record(row) for row in queryset], page_size)
+
+
+async def acustomer_page(after=None, page_size=DEFAULT_PAGE_SIZE):
+    queryset, to_record = _page_queryset(after, page_size, await sync_to_async(summary_available)())
+    return _page([to_record(row) async for row in queryset], page_size)
+
+
+def search_page(term, after=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    Matches for `term` in the same shape as customer_page(), ranked by the
+    FTS5 index. Ranked results have no key order to seek on, so here
+    `after` and `next_cursor` count the matches already returned. Without
+    FTS5 (non-SQLite databases) it falls back to an unranked substring
+    match in pk order.
+    """
+    offset = max(after or 0, 0)
+    if fts_available():
+        ids = search_customer_ids(term, limit=page_size + 1, offset=offset)
+        if summary_available():
+            rows = {row[0]: row for row in CustomerSummary.objects.filter(pk__in=ids).values_list(*SUMMARY_FIELDS)}
+            records = [summary_record(rows[pk]) for pk in ids if pk in rows]
+        else:
+            users = UserProfile.objects.filter(pk__in=ids).with_primary_address().in_bulk()
+            records = [profile_record(users[pk]) for pk in ids if pk in users]
+    else:
+        records = [profile_record(user) for user in UserProfile.objects.filter(
+            Q(Name__icontains=term) | Q(Email__icontains=term) | Q(Mobile__icontains=term) | Q(Number__icontains=term)
+        ).order_by('pk').with_primary_address()[offset:offset + page_size + 1]]
+    has_more = len(records) > page_size
+    return {
+        'results': records[:page_size],
+        'next_cursor': offset + page_size if has_more else None,
+        'has_more': has_more,
+    }
+
+
+# -----------------------
+# Listing cache
+# -----------------------
+def initial_version():
+    # Clock-based, so a recreated database never reuses the keys of pages
+    # still cached from the old one (e.g. in a shared CACHE_DIR).
+    return time.time_ns() // 1000
+
+
+def _version_queryset():
+    return CacheVersion.objects.filter(name=LISTING_VERSION).values_list('version', flat=True)
+
+
+def listing_version():
+    return _version_queryset().first() or 0
+
+
+async def alisting_version():
+    return await _version_queryset().afirst() or 0
+
+
+def bump_listing_version():
+    """
+    Invalidates every cached listing page, in every process. The version
+    lives in the database and is bumped in the writer's transaction, so
+    it changes exactly when the new data becomes visible.
+    """
+    if not CacheVersion.objects.filter(name=LISTING_VERSION).update(version=F('version') + 1):
+        CacheVersion.objects.get_or_create(name=LISTING_VERSION, defaults={'version': initial_version()})
+
+
+def _page_key(version, after, page_size):
+    return f'main_app:customers:v{version}:after={after}:size={page_size}'
+
+
+def cached_customer_page_json(after=None, page_size=DEFAULT_PAGE_SIZE):
+    """
+    customer_page() serialized to JSON, cached per data version so repeated
+    loads skip both the queries and the encoding.
+    """
+    key = _page_key(listing_version(), after, page_size)
+    payload = cache.get(key)
+    if payload is None:
+        payload = json.dumps(customer_page(after=after, page_size=page_size))
+        cache.set(key, payload, getattr(settings, 'LISTING_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT))
+    return payload
+
+
+async def acached_customer_page_json(after=None, page_size=DEFAULT_PAGE_SIZE):
+    key = _page_key(await alisting_version(), after, page_size)
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = json.dumps(await acustomer_page(after=after, page_size=page_size))
+        await cache.aset(key, payload, getattr(settings, 'LISTING_CACHE_TIMEOUT', DEFAULT_CACHE_TIMEOUT))
+    return payload
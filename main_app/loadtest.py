@@ -0,0 +1,117 @@
+import http.client
+import importlib.util
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from .metrics import percentile
+
+# name -> (module that must be importable, command line; {port}/{workers}/{threads} filled in, async views)
+SERVERS = {
+    'asgi': ('uvicorn', [
+        '-m', 'uvicorn', 'ecom.asgi:application', '--host', '127.0.0.1', '--port', '{port}',
+        '--workers', '{workers}', '--no-access-log',
+    ], True),
+    'wsgi': ('gunicorn', [
+        '-m', 'gunicorn', 'ecom.wsgi:application', '--bind', '127.0.0.1:{port}',
+        '--workers', '{workers}', '--threads', '{threads}',
+    ], False),
+}
+
+
+def server_available(name):
+    return importlib.util.find_spec(SERVERS[name][0]) is not None
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with status {process.returncode}.')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server did not listen on port {port} within {timeout}s.')
+
+
+def start_server(name, workers=1, threads=8):
+    """
+    Starts the named server on a free local port, serving this project
+    with the async views under ASGI and the sync ones under WSGI. Returns
+    (process, port); the caller terminates the process.
+    """
+    _, args, async_views = SERVERS[name]
+    port = free_port()
+    env = dict(os.environ, DJANGO_ASYNC_VIEWS='1' if async_views else '0')
+    args = [arg.format(port=port, workers=workers, threads=threads) for arg in args]
+    # stderr goes to a file: a pipe nobody reads fills up with request
+    # tracebacks and then blocks the server mid-run.
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(
+            [sys.executable, *args], cwd=settings.BASE_DIR, env=env,
+            stdout=subprocess.DEVNULL, stderr=stderr,
+        )
+        try:
+            wait_for_port(port, process)
+        except RuntimeError as error:
+            process.kill()
+            process.wait()
+            raise RuntimeError(f'{error}\n{_tail(stderr)}'.rstrip()) from None
+    return process, port
+
+
+def _tail(file, size=4096):
+    # The last `size` bytes written to `file`, as text.
+    file.seek(0, os.SEEK_END)
+    file.seek(max(file.tell() - size, 0))
+    return file.read().decode('utf-8', 'replace')
+
+
+def fetch(port, path):
+    # One request on its own connection; returns (status, body bytes, seconds).
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=300)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        size = len(response.read())
+        return response.status, size, time.perf_counter() - started
+    finally:
+        conn.close()
+
+
+def run_load(port, path, requests, concurrency):
+    """
+    Sends `requests` GETs for `path` from `concurrency` threads. Returns
+    throughput, latency percentiles and the count of non-200 responses.
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: fetch(port, path), range(requests)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(seconds for _, _, seconds in results)
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': sum(1 for status, _, _ in results if status != 200),
+        'requests_per_second': round(requests / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+        'p90_ms': round(percentile(latencies, 0.9) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'bytes': sum(size for _, size, _ in results),
+    }
@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from main_app.benchmarks import BenchmarkCases, find_regressions, measure
+from main_app.models import UserProfile
+from main_app.synthetic import generate_customers
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the listing, export, import and admin changelists at growing data sizes, "
+        "in a throwaway file database (a fresh one, or a copy of the configured one), "
+        "and optionally fails on regressions against a baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                            help="Comma-separated customer counts (default: 1k,10k,100k,1M).")
+        parser.add_argument('--repeat', type=int, default=3, help="Timed runs per case.")
+        parser.add_argument('--cases', default='', help="Comma-separated subset of cases to run.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--copy-database', action='store_true',
+                            help="Benchmark a copy of the configured SQLite database instead of an empty one.")
+        parser.add_argument('--save', help="Write results as JSON to this path.")
+        parser.add_argument('--baseline', help="JSON results of an earlier run to compare against.")
+        parser.add_argument('--threshold', type=float, default=0.25,
+                            help="Allowed relative slowdown / memory growth vs. baseline (default 0.25).")
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(',') if size.strip())
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+
+        setup_test_environment(debug=False)
+        database, close_database = self.open_database(options['copy_database'])
+        try:
+            self.stdout.write(f"Database: {database['kind']}, {database['path']}.")
+            results = self.run_sizes(sizes, options)
+        finally:
+            close_database()
+            teardown_test_environment()
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump({'database': database, 'results': results}, f, indent=2)
+            self.stdout.write(f"Saved results to {options['save']}.")
+
+        if baseline is not None:
+            # Reports saved before the database was recorded are bare results.
+            baseline_database = baseline.get('database', {})
+            baseline = baseline.get('results', baseline)
+            if baseline_database.get('kind') != database['kind']:
+                self.stderr.write(self.style.WARNING(
+                    f"Baseline database: {baseline_database.get('kind', 'not recorded')}; "
+                    f"this run: {database['kind']}. Timings may not be comparable."
+                ))
+            regressions = find_regressions(results, baseline, options['threshold'])
+            if regressions:
+                raise CommandError("Performance regressions:\n  " + "\n  ".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    def open_database(self, copy):
+        """
+        Points the default connection at a database file in a temporary
+        directory and returns its description for the report, with a
+        function restoring the connection. SQLite test databases are
+        in-memory by default, which would hide disk I/O and WAL costs.
+        """
+        if connection.vendor != 'sqlite':
+            if copy:
+                raise CommandError("--copy-database only supports SQLite.")
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            database = {'kind': 'test database', 'path': connection.settings_dict['NAME'], 'vendor': connection.vendor}
+            return database, lambda: connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        directory = tempfile.mkdtemp(prefix='benchmark-')
+        path = os.path.join(directory, 'db.sqlite3')
+        settings_dict = connection.settings_dict
+        if copy:
+            source = str(settings_dict['NAME'])
+            connection.ensure_connection()
+            target = sqlite3.connect(path)
+            try:
+                connection.connection.backup(target)
+            finally:
+                target.close()
+            connection.close()
+            settings_dict['NAME'] = path
+            call_command('migrate', verbosity=0, interactive=False)
+            database = {'kind': 'copy of the configured database', 'path': path, 'source': source}
+
+            def close_database():
+                connection.close()
+                settings_dict['NAME'] = source
+                shutil.rmtree(directory, ignore_errors=True)
+        else:
+            test_name = settings_dict['TEST'].get('NAME')
+            settings_dict['TEST']['NAME'] = path
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            database = {'kind': 'temporary file', 'path': path}
+
+            def close_database():
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                settings_dict['TEST']['NAME'] = test_name
+                shutil.rmtree(directory, ignore_errors=True)
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            database['journal_mode'] = cursor.fetchone()[0]
+        database['vendor'] = connection.vendor
+        database['sqlite_version'] = sqlite3.sqlite_version
+        database['customers_at_start'] = UserProfile.objects.count()
+        return database, close_database
+
+    def run_sizes(self, sizes, options):
+        cases = BenchmarkCases()
+        names = [n.strip() for n in options['cases'].split(',') if n.strip()] or cases.names()
+        unknown = set(names) - set(cases.names())
+        if unknown:
+            raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}")
+
+        results = {}
+        self.stdout.write(f"{'size':>9}  {'case':<30} {'latency ms':>11} {'cpu ms':>9} {'queries':>8} {'peak MiB':>9}")
+        for size in sizes:
+            current = UserProfile.objects.count()
+            if size > current:
+                generate_customers(size - current, seed=options['seed'] + size)
+            results[str(size)] = {}
+            for name in names:
+                stats = measure(getattr(cases, name), repeat=options['repeat'])
+                results[str(size)][name] = stats
+                self.stdout.write(
+                    f"{size:>9}  {name:<30} {stats['latency_seconds'] * 1000:>11.1f} {stats['cpu_seconds'] * 1000:>9.1f} "
+                    f"{stats['queries']:>8} {stats['peak_memory_bytes'] / 2**20:>9.1f}"
+                )
+        return results
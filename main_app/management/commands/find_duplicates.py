@@ -0,0 +1,48 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from main_app.dedupe import duplicate_clusters, refresh_customer_keys
+from main_app.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = "Lists clusters of stored customers that share an email, phone or name+zip key."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--refresh-keys', action='store_true',
+                            help="Recompute every customer's keys first (after raw SQL edits or address deletes).")
+        parser.add_argument('--limit', type=int, default=50, help="Clusters to print, largest first (0 for all).")
+        parser.add_argument('--json', action='store_true', help="Print the clusters as JSON.")
+
+    def handle(self, *args, **options):
+        if options['refresh_keys']:
+            started = time.perf_counter()
+            updated = refresh_customer_keys()
+            self.stderr.write(f"Refreshed keys of {updated} customers in {time.perf_counter() - started:.1f}s.")
+
+        started = time.perf_counter()
+        clusters = duplicate_clusters()
+        elapsed = time.perf_counter() - started
+        shown = clusters[:options['limit']] if options['limit'] else clusters
+
+        ids = [pk for cluster in shown for pk in cluster['ids']]
+        customers = {
+            row['id']: row
+            for row in UserProfile.objects.filter(pk__in=ids).values('id', 'Number', 'Name', 'Email', 'Mobile')
+        }
+        for cluster in shown:
+            cluster['customers'] = [customers[pk] for pk in cluster['ids']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(shown, indent=2))
+            return
+
+        for cluster in shown:
+            self.stdout.write(f"{len(cluster['ids'])} customers linked by {', '.join(cluster['on'])}:")
+            for c in cluster['customers']:
+                self.stdout.write(f"  #{c['id']} {c['Number'] or '-'}  {c['Name']}  {c['Email'] or '-'}  {c['Mobile'] or '-'}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Found {len(clusters)} duplicate clusters ({sum(len(c['ids']) for c in clusters)} customers) in {elapsed:.2f}s."
+        ))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main_app.models import UserProfile
+from main_app.synthetic import generate_customers
+
+
+class Command(BaseCommand):
+    help = "Inserts N synthetic customers (profile, addresses, shipping & tax) for testing and benchmarks."
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help="Number of customers to create.")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for reproducible data.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Customers per transaction.")
+        parser.add_argument('--clear', action='store_true', help="Delete all customers first.")
+
+    def handle(self, *args, **options):
+        if options['clear']:
+            UserProfile.objects.all().delete()
+
+        started = time.perf_counter()
+        created = generate_customers(options['count'], seed=options['seed'], chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {created} customers in {elapsed:.1f}s ({created / elapsed if elapsed else 0:.0f} rows/s)."
+        ))
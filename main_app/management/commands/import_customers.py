@@ -0,0 +1,38 @@
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.checkpoints import ImportConflict, import_csv_resumable
+from main_app.importers import IMPORT_MODES, INSERT
+
+
+class Command(BaseCommand):
+    help = "Imports customers from a CSV export, resuming an earlier interrupted import of the same file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file in the export layout.")
+        parser.add_argument('--mode', choices=IMPORT_MODES, default=INSERT, help="Insert every row, or upsert on account number.")
+        parser.add_argument('--chunk-size', type=int, default=None, help="Rows per transaction (and checkpoint).")
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint of an unfinished import.")
+
+    def handle(self, *args, **options):
+        def progress(imported, failed):
+            self.stderr.write(f"{imported + failed} rows done.")
+
+        try:
+            with open(options['path'], 'rb') as f:
+                result = import_csv_resumable(
+                    File(f), options['mode'], options['chunk_size'], options['restart'],
+                    on_chunk=progress if options['verbosity'] > 1 else None,
+                )
+        except (OSError, ImportConflict) as e:
+            raise CommandError(e)
+
+        if result['resumed_from_row']:
+            self.stdout.write(f"Resumed after row {result['resumed_from_row']}.")
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {error['message']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['imported']} customers ({result['created']} created, {result['updated']} updated, "
+            f"{result['unchanged']} unchanged), {result['failed']} rows failed, "
+            f"{result['duplicates']} possible duplicates flagged; {result['rows_per_second']} rows/s."
+        ))
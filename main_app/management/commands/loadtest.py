@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from main_app.loadtest import SERVERS, run_load, server_available, start_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares concurrent throughput of the listing and export endpoints under ASGI (uvicorn, async views) "
+        "and WSGI (gunicorn, sync views), against the configured database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='asgi,wsgi', help="Comma-separated subset of: asgi, wsgi.")
+        parser.add_argument('--paths', default='/,/export_csv/', help="Comma-separated paths to load.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per path and server.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Concurrent client threads.")
+        parser.add_argument('--workers', type=int, default=1, help="Server worker processes.")
+        parser.add_argument('--threads', type=int, default=8, help="Threads per gunicorn worker.")
+        parser.add_argument('--save', help="Write results as JSON to this path.")
+
+    def handle(self, *args, **options):
+        names = [n.strip() for n in options['servers'].split(',') if n.strip()]
+        unknown = set(names) - set(SERVERS)
+        if unknown:
+            raise CommandError(f"Unknown servers: {', '.join(sorted(unknown))}")
+        paths = [p.strip() for p in options['paths'].split(',') if p.strip()]
+
+        results = {}
+        self.stdout.write(
+            f"{'server':<6} {'path':<20} {'req/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'errors':>7}"
+        )
+        for name in names:
+            if not server_available(name):
+                self.stderr.write(f"Skipping {name}: {SERVERS[name][0]} is not installed.")
+                continue
+            try:
+                process, port = start_server(name, options['workers'], options['threads'])
+            except RuntimeError as e:
+                raise CommandError(f"{name}: {e}")
+            try:
+                results[name] = {}
+                for path in paths:
+                    # One warm-up request so imports and caches are not timed.
+                    run_load(port, path, 1, 1)
+                    stats = run_load(port, path, options['requests'], options['concurrency'])
+                    results[name][path] = stats
+                    self.stdout.write(
+                        f"{name:<6} {path:<20} {stats['requests_per_second']:>8.1f} {stats['p50_ms']:>8.1f} "
+                        f"{stats['p90_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['errors']:>7}"
+                    )
+            finally:
+                process.terminate()
+                process.wait()
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Saved results to {options['save']}.")
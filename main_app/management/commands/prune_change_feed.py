@@ -0,0 +1,24 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main_app.changes import DEFAULT_RETENTION_DAYS, prune_change_feed
+
+
+class Command(BaseCommand):
+    help = "Deletes change feed tombstones and change log rows older than CHANGE_FEED_RETENTION_DAYS."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Keep this many days instead of CHANGE_FEED_RETENTION_DAYS.")
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'CHANGE_FEED_RETENTION_DAYS', DEFAULT_RETENTION_DAYS)
+        tombstones, changes = prune_change_feed(timezone.now() - timedelta(days=days))
+        self.stdout.write(self.style.SUCCESS(
+            f"Deleted {tombstones} tombstones and {changes} change log rows older than {days} days."
+        ))
@@ -0,0 +1,99 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from main_app.jobs import claim_job, release_job, release_stale_jobs, renew_leases, run_job, unclaim_job
+from main_app.models import Job
+
+
+class Command(BaseCommand):
+    help = "Runs queued import/export jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(),
+                            help="Number of worker processes (default: CPU count).")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait between queue polls.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling forever.")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        # Spawned (not forked) children each open their own DB connection.
+        context = multiprocessing.get_context('spawn')
+        running = {}
+
+        # Jobs left running by a supervisor that died.
+        for job_id, status in release_stale_jobs().items():
+            self.stderr.write(f"Job #{job_id} had no live worker; now {status}.")
+
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup)
+        self.stdout.write(f"Job worker started with {workers} processes.")
+        try:
+            while True:
+                close_old_connections()
+                renew_leases(list(running.values()))
+                claimed = 0
+                free = workers - len(running)
+                if free:
+                    pending = (Job.objects.filter(status=Job.PENDING)
+                               .order_by('created_at', 'pk').values_list('pk', flat=True)[:free])
+                    for job_id in list(pending):
+                        if not claim_job(job_id):
+                            continue
+                        try:
+                            future = pool.submit(run_job, job_id)
+                        except BrokenProcessPool:
+                            unclaim_job(job_id)
+                            pool = self.replace_pool(pool, running, workers, context)
+                            break
+                        running[future] = job_id
+                        claimed += 1
+                        self.stdout.write(f"Started job #{job_id}.")
+
+                if not running:
+                    if options['once'] and not claimed:
+                        return
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job_id = running.pop(future)
+                    error = future.exception()
+                    if isinstance(error, BrokenProcessPool):
+                        # Some worker process died, and the pool took down
+                        # every job it was running: none recorded an outcome.
+                        broken = True
+                        self.release(job_id, error)
+                    elif error is not None:
+                        self.release(job_id, error)
+                    else:
+                        self.stdout.write(f"Job #{job_id} {future.result()}.")
+                if broken:
+                    pool = self.replace_pool(pool, running, workers, context)
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    def release(self, job_id, error):
+        status = release_job(job_id, f'Its worker process died: {error}')
+        if status:
+            self.stderr.write(f"Job #{job_id} crashed ({error}); now {status}.")
+
+    def replace_pool(self, pool, running, workers, context):
+        """
+        A broken pool accepts nothing more: releases the jobs it still had
+        and starts a new one.
+        """
+        for job_id in running.values():
+            self.release(job_id, 'the job worker pool broke')
+        running.clear()
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.stderr.write("Restarted the job worker pool.")
+        return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup)
@@ -0,0 +1,84 @@
+import math
+import threading
+from collections import deque
+
+# Samples kept per view and metric for the percentile estimates.
+DEFAULT_WINDOW = 1024
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# metric name -> (help text, sample key)
+METRICS = (
+    ('main_app_request_duration_seconds', 'Wall-clock time per request.', 'total'),
+    ('main_app_sql_duration_seconds', 'Time spent executing SQL per request.', 'sql'),
+    ('main_app_python_duration_seconds', 'Request time not spent in SQL.', 'python'),
+    ('main_app_sql_queries', 'SQL queries executed per request.', 'queries'),
+    ('main_app_response_size_bytes', 'Response body size.', 'size'),
+)
+
+
+def percentile(sorted_values, q):
+    # Nearest-rank percentile of an already sorted list.
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values), max(1, math.ceil(q * len(sorted_values)))) - 1
+    return sorted_values[index]
+
+
+class MetricsRegistry:
+    """
+    In-process aggregation of per-view request metrics: running counts and
+    sums, plus a sliding window of samples for percentiles. Each process
+    (worker) keeps its own numbers.
+    """
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view, **sample):
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = {
+                    key: {'count': 0, 'sum': 0, 'samples': deque(maxlen=self.window)}
+                    for _, _, key in METRICS
+                }
+            for key, value in sample.items():
+                if value is None:
+                    continue
+                stats[key]['count'] += 1
+                stats[key]['sum'] += value
+                stats[key]['samples'].append(value)
+
+    def reset(self):
+        with self.lock:
+            self.views.clear()
+
+    def render_prometheus(self):
+        """
+        The collected metrics in the Prometheus text exposition format, one
+        summary per metric labelled by view.
+        """
+        with self.lock:
+            snapshot = {
+                view: {key: (s['count'], s['sum'], sorted(s['samples'])) for key, s in stats.items()}
+                for view, stats in self.views.items()
+            }
+
+        lines = []
+        for name, help_text, key in METRICS:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} summary')
+            for view in sorted(snapshot):
+                count, total, samples = snapshot[view][key]
+                label = view.replace('\\', '\\\\').replace('"', '\\"')
+                for q in QUANTILES:
+                    lines.append(f'{name}{{view="{label}",quantile="{q}"}} {percentile(samples, q):g}')
+                lines.append(f'{name}_sum{{view="{label}"}} {total:g}')
+                lines.append(f'{name}_count{{view="{label}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,122 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.db import connection
+
+from .metrics import registry
+
+
+class QueryCounter:
+    """
+    connection.execute_wrapper() hook counting queries and SQL time.
+    """
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - started
+
+
+# execute_wrapper() as plain calls, for the async path's sync_to_async().
+def _install(counter):
+    connection.execute_wrappers.append(counter)
+
+
+def _uninstall(counter):
+    connection.execute_wrappers.remove(counter)
+
+
+def view_label(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class RequestMetricsMiddleware:
+    """
+    Measures query count, SQL time, Python time and response size per
+    request. Adds a Server-Timing header and records the numbers in the
+    in-process registry served at /metrics/.
+
+    Streaming responses are measured until their last chunk is sent, so
+    their Server-Timing header only covers the work done before the body.
+
+    Works in both sync and async stacks. Under ASGI the ORM runs in the
+    request's sync thread, so the query counter is installed on that
+    thread's connection.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        started = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            response = self.get_response(request)
+        return self._finish(request, response, counter, started)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        started = time.perf_counter()
+        await sync_to_async(_install)(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(_uninstall)(counter)
+        return self._finish(request, response, counter, started)
+
+    def _finish(self, request, response, counter, started):
+        elapsed = time.perf_counter() - started
+        response['Server-Timing'] = ', '.join([
+            f'sql;dur={counter.sql_time * 1000:.2f};desc="{counter.queries} queries"',
+            f'app;dur={(elapsed - counter.sql_time) * 1000:.2f}',
+            f'total;dur={elapsed * 1000:.2f}',
+        ])
+
+        if response.streaming:
+            measure = self._ameasure_stream if response.is_async else self._measure_stream
+            response.streaming_content = measure(request, response.streaming_content, counter, started)
+        else:
+            self._record(request, counter, elapsed, len(response.content))
+        return response
+
+    def _measure_stream(self, request, content, counter, started):
+        size = 0
+        with connection.execute_wrapper(counter):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        self._record(request, counter, time.perf_counter() - started, size)
+
+    async def _ameasure_stream(self, request, content, counter, started):
+        size = 0
+        await sync_to_async(_install)(counter)
+        try:
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            await sync_to_async(_uninstall)(counter)
+        self._record(request, counter, time.perf_counter() - started, size)
+
+    def _record(self, request, counter, elapsed, size):
+        registry.record(
+            view_label(request),
+            total=elapsed,
+            sql=counter.sql_time,
+            python=max(0.0, elapsed - counter.sql_time),
+            queries=counter.queries,
+            size=size,
+        )
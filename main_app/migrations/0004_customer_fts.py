@@ -0,0 +1,22 @@
+from django.db import migrations
+
+
+def create_fts(apps, schema_editor):
+    from main_app.search import install_fts
+    install_fts(schema_editor.connection, rebuild=True)
+
+
+def drop_fts(apps, schema_editor):
+    from main_app.search import uninstall_fts
+    uninstall_fts(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0003_remove_userprofile_fax_remove_userprofile_home_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:40
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+# Conflicting account numbers listed in the error, at most.
+MAX_LISTED_NUMBERS = 20
+
+
+def resolve_duplicates(apps, schema_editor):
+    """
+    Makes existing rows satisfy the new unique constraints: only the oldest
+    default address per user stays default and blank account numbers become
+    NULL. An account number shared by several profiles cannot be fixed
+    without losing it, so the migration stops and lists them instead.
+    """
+    UserProfile = apps.get_model('main_app', 'UserProfile')
+    Address = apps.get_model('main_app', 'Address')
+
+    defaults = (Address.objects.filter(IsDefault=True).values('user')
+                .annotate(n=Count('pk'), keep=Min('pk')).filter(n__gt=1))
+    for row in defaults:
+        Address.objects.filter(user=row['user'], IsDefault=True).exclude(pk=row['keep']).update(IsDefault=False)
+
+    UserProfile.objects.filter(Number='').update(Number=None)
+    numbers = list(UserProfile.objects.exclude(Number__isnull=True).values('Number')
+                   .annotate(n=Count('pk')).filter(n__gt=1).order_by('Number')
+                   .values_list('Number', flat=True))
+    if numbers:
+        pks = {}
+        for pk, number in (UserProfile.objects.filter(Number__in=numbers[:MAX_LISTED_NUMBERS])
+                           .order_by('pk').values_list('pk', 'Number')):
+            pks.setdefault(number, []).append(str(pk))
+        listed = '; '.join(f"{number!r} (profiles {', '.join(pks[number])})" for number in numbers[:MAX_LISTED_NUMBERS])
+        more = f'; and {len(numbers) - MAX_LISTED_NUMBERS} more' if len(numbers) > MAX_LISTED_NUMBERS else ''
+        raise RuntimeError(
+            f'{len(numbers)} account numbers are used by more than one profile: {listed}{more}. '
+            f'Give each profile its own number, or clear the extra ones, and migrate again.'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0004_customer_fts'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_duplicates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['user', 'IsDefault'], name='address_user_default_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['user', 'AddressName'], name='address_user_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['City'], name='address_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['State'], name='address_state_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='address',
+            index=models.Index(fields=['Country', 'State', 'City'], name='address_location_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['Name'], name='userprofile_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['Active', 'Name'], name='userprofile_active_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['Group', 'Name'], name='userprofile_group_name_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='address',
+            constraint=models.UniqueConstraint(condition=models.Q(('IsDefault', True)), fields=('user',), name='address_one_default_per_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='userprofile',
+            constraint=models.UniqueConstraint(condition=models.Q(('Number__isnull', False)), fields=('Number',), name='userprofile_number_unique'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_summary(apps, schema_editor):
+    from main_app.summary import install_summary
+    install_summary(schema_editor.connection, rebuild=True)
+
+
+def drop_summary(apps, schema_editor):
+    from main_app.summary import uninstall_summary
+    uninstall_summary(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0008_change_feed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerSummary',
+            fields=[
+                ('customer', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='summary', serialize=False, to='main_app.userprofile')),
+                ('LocationName', models.CharField(max_length=255)),
+                ('Address', models.CharField(blank=True, max_length=255)),
+                ('City', models.CharField(blank=True, max_length=100)),
+                ('State', models.CharField(blank=True, max_length=100)),
+                ('Zip', models.CharField(blank=True, max_length=20)),
+                ('ContactPerson', models.CharField(blank=True, max_length=255, null=True)),
+                ('Phone', models.CharField(blank=True, max_length=20, null=True)),
+                ('Email', models.EmailField(blank=True, max_length=254, null=True)),
+            ],
+        ),
+        migrations.RunPython(create_summary, drop_summary),
+    ]
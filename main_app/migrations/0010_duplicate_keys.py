@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:44
+
+from django.db import migrations, models
+
+from main_app.summary import drop_triggers_for_migration, restore_triggers_after_migration
+
+
+def fill_keys(apps, schema_editor):
+    from main_app.dedupe import refresh_customer_keys
+    refresh_customer_keys(
+        profile_model=apps.get_model('main_app', 'UserProfile'),
+        address_model=apps.get_model('main_app', 'Address'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0009_customer_summary'),
+    ]
+
+    operations = [
+        # The summary triggers would break the rebuild of the profile table.
+        migrations.RunPython(drop_triggers_for_migration, restore_triggers_after_migration),
+        migrations.AddField(
+            model_name='userprofile',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='name_zip_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_keys, migrations.RunPython.noop),
+        migrations.RunPython(restore_triggers_after_migration, drop_triggers_for_migration),
+    ]
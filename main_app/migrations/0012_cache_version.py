@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:02
+
+from django.db import migrations, models
+
+
+def create_listing_version(apps, schema_editor):
+    from main_app.listing import LISTING_VERSION, initial_version
+    apps.get_model('main_app', 'CacheVersion').objects.create(name=LISTING_VERSION, version=initial_version())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0011_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_listing_version, migrations.RunPython.noop),
+    ]
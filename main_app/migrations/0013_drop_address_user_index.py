@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _user_indexes(schema_editor, table):
+    # The plain index Django created for the user foreign key; the partial
+    # unique constraint on user_id is kept.
+    with schema_editor.connection.cursor() as cursor:
+        constraints = schema_editor.connection.introspection.get_constraints(cursor, table)
+    return [
+        name for name, info in constraints.items()
+        if info['columns'] == ['user_id'] and info['index'] and not info['unique']
+    ]
+
+
+def drop_user_index(apps, schema_editor):
+    Address = apps.get_model('main_app', 'Address')
+    for name in _user_indexes(schema_editor, Address._meta.db_table):
+        schema_editor.execute(f'DROP INDEX {schema_editor.quote_name(name)}')
+
+
+def create_user_index(apps, schema_editor):
+    Address = apps.get_model('main_app', 'Address')
+    if not _user_indexes(schema_editor, Address._meta.db_table):
+        schema_editor.execute(schema_editor._create_index_sql(Address, fields=[Address._meta.get_field('user')]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0012_cache_version'),
+    ]
+
+    # address_user_default_idx and address_user_name_idx both lead with
+    # user_id. Dropping the index directly avoids the table rebuild an
+    # AlterField does on SQLite.
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='address',
+                    name='user',
+                    field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='addresses', to='main_app.userprofile'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunPython(drop_user_index, create_user_index),
+            ],
+        ),
+    ]
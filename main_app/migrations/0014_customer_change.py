@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:12
+
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+def create_change_log(apps, schema_editor):
+    from main_app.changelog import install_change_log
+    install_change_log(schema_editor.connection, expire_cursors=False)
+
+
+def drop_change_log(apps, schema_editor):
+    from main_app.changelog import uninstall_change_log
+    uninstall_change_log(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0013_drop_address_user_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('customer_id', models.BigIntegerField()),
+                ('changed_at', models.DateTimeField(db_default=django.db.models.functions.datetime.Now(), db_index=True)),
+            ],
+        ),
+        migrations.RunPython(create_change_log, drop_change_log),
+    ]
@@ -1,8 +1,25 @@
 from django.db import models
+from django.db.models.functions import Now
+
+# Default address first, then the oldest one.
+PRIMARY_ADDRESS_ORDERING = ('-IsDefault', 'pk')
 
 # -----------------------
 # 1. USER PROFILE
 # -----------------------
+class UserProfileQuerySet(models.QuerySet):
+    def with_primary_address(self):
+        """
+        Prefetches every profile's addresses, already ordered, into
+        `ordered_addresses` so `primary_address` resolves without a query.
+        """
+        return self.prefetch_related(models.Prefetch(
+            'addresses',
+            queryset=Address.objects.order_by(*PRIMARY_ADDRESS_ORDERING),
+            to_attr='ordered_addresses',
+        ))
+
+
 class UserProfile(models.Model):
     Name = models.CharField(max_length=255)
     Mobile = models.CharField(max_length=20, blank=True, null=True)
@@ -18,10 +35,45 @@ class UserProfile(models.Model):
     AlertNotes = models.TextField(blank=True, null=True)
     QuickBooksClassName = models.CharField(max_length=255, blank=True, null=True)
     IssuableStatus = models.CharField(max_length=50, blank=True, null=True)
+    # Normalized duplicate-detection blocking keys; see dedupe.py.
+    email_key = models.CharField(max_length=254, blank=True, default='', editable=False, db_index=True)
+    phone_key = models.CharField(max_length=20, blank=True, default='', editable=False, db_index=True)
+    name_zip_key = models.CharField(max_length=20, blank=True, default='', editable=False, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = UserProfileQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Profiles without an account number store NULL, which may repeat.
+            models.UniqueConstraint(
+                fields=['Number'],
+                condition=models.Q(Number__isnull=False),
+                name='userprofile_number_unique',
+            ),
+        ]
+        indexes = [
+            # Admin changelist: ordered by Name, filtered by Active / Group.
+            models.Index(fields=['Name'], name='userprofile_name_idx'),
+            models.Index(fields=['Active', 'Name'], name='userprofile_active_name_idx'),
+            models.Index(fields=['Group', 'Name'], name='userprofile_group_name_idx'),
+        ]
 
     def __str__(self):
         return self.Name
 
+    @property
+    def primary_address(self):
+        """
+        The default address, else the first one created. Served from the
+        with_primary_address() prefetch when present; `addresses.first()`
+        would bypass that cache and query once per profile.
+        """
+        if hasattr(self, 'ordered_addresses'):
+            return self.ordered_addresses[0] if self.ordered_addresses else None
+        return self.addresses.order_by(*PRIMARY_ADDRESS_ORDERING).first()
+
 # -----------------------
 # 2. ADDRESS
 # -----------------------
@@ -34,7 +86,9 @@ class Address(models.Model):
         ('OTHER', 'Other'),
     )
 
-    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='addresses')
+    # No index of its own: address_user_default_idx and address_user_name_idx
+    # both lead with user, so either serves lookups and cascades by user.
+    user = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='addresses', db_index=False)
     AddressName = models.CharField(max_length=255)
     AddressContact = models.CharField(max_length=255, blank=True, null=True)
     AddressType = models.CharField(max_length=50, choices=ADDRESS_TYPES, blank=True, null=True)
@@ -47,10 +101,38 @@ class Address(models.Model):
     Fax = models.CharField(max_length=20, blank=True, null=True)
     Pager = models.CharField(max_length=20, blank=True, null=True)
     Web = models.URLField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(IsDefault=True),
+                name='address_one_default_per_user',
+            ),
+        ]
+        indexes = [
+            # Primary address lookup (see PRIMARY_ADDRESS_ORDERING).
+            models.Index(fields=['user', 'IsDefault'], name='address_user_default_idx'),
+            # Admin changelist: ordered by user, AddressName; filtered by location.
+            models.Index(fields=['user', 'AddressName'], name='address_user_name_idx'),
+            models.Index(fields=['City'], name='address_city_idx'),
+            models.Index(fields=['State'], name='address_state_idx'),
+            models.Index(fields=['Country', 'State', 'City'], name='address_location_idx'),
+        ]
 
     def __str__(self):
         return f"{self.AddressName} ({self.user.Name})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # The stored Zip and IsDefault, so signals.update_name_zip_key can
+        # skip saves that cannot change the customer's name+zip key.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_key_fields = (instance.__dict__.get('Zip'), instance.__dict__.get('IsDefault'))
+        return instance
+
 # -----------------------
 # 3. SHIPPING AND TAX
 # -----------------------
@@ -65,6 +147,162 @@ class ShippingAndTax(models.Model):
     ShippingTerms = models.CharField(max_length=100, blank=True, null=True)
     ToBeEmailed = models.BooleanField(default=False)
     ToBePrinted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self):
         return f"Shipping & Tax for {self.user.Name}"
+
+# -----------------------
+# 4. DELETION TOMBSTONES
+# -----------------------
+class Tombstone(models.Model):
+    """
+    Records a deleted UserProfile, Address or ShippingAndTax so the change
+    feed can report deletions after the row itself is gone.
+    """
+    model = models.CharField(max_length=50)
+    object_id = models.BigIntegerField()
+    customer_id = models.BigIntegerField()
+    number = models.CharField(max_length=50, blank=True, null=True)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Deleted {self.model} #{self.object_id}"
+
+# -----------------------
+# 5. CUSTOMER SUMMARY
+# -----------------------
+class CustomerSummary(models.Model):
+    """
+    Read model of the customer table: one narrow row per UserProfile with
+    the columns of its primary address, kept in sync by SQLite triggers
+    (see summary.py) so the listing reads it without joins.
+    """
+    customer = models.OneToOneField(
+        UserProfile, primary_key=True, on_delete=models.DO_NOTHING, db_constraint=False, related_name='summary',
+    )
+    LocationName = models.CharField(max_length=255)
+    Address = models.CharField(max_length=255, blank=True)
+    City = models.CharField(max_length=100, blank=True)
+    State = models.CharField(max_length=100, blank=True)
+    Zip = models.CharField(max_length=20, blank=True)
+    ContactPerson = models.CharField(max_length=255, blank=True, null=True)
+    Phone = models.CharField(max_length=20, blank=True, null=True)
+    Email = models.EmailField(max_length=254, blank=True, null=True)
+
+    def __str__(self):
+        return self.LocationName
+
+# -----------------------
+# 6. BACKGROUND JOBS
+# -----------------------
+class Job(models.Model):
+    IMPORT = 'import'
+    EXPORT = 'export'
+    KINDS = (
+        (IMPORT, 'Import'),
+        (EXPORT, 'Export'),
+    )
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=20, choices=KINDS)
+    status = models.CharField(max_length=20, choices=STATUSES, default=PENDING)
+    options = models.JSONField(default=dict, blank=True)
+    input_file = models.FileField(upload_to='jobs/input/', blank=True)
+    output_file = models.FileField(upload_to='jobs/output/', blank=True)
+    processed_rows = models.PositiveIntegerField(default=0)
+    progress = models.FloatField(default=0)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    # Claims so far, and the last time the supervisor running the job
+    # renewed its lease (see jobs.py).
+    attempts = models.PositiveIntegerField(default=0)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Worker polling: oldest pending job first.
+            models.Index(fields=['status', 'created_at'], name='job_status_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job #{self.pk} ({self.status})"
+
+    def as_dict(self):
+        return {
+            'id': self.pk,
+            'kind': self.kind,
+            'status': self.status,
+            'processed_rows': self.processed_rows,
+            'progress': round(self.progress, 4),
+            'attempts': self.attempts,
+            'result': self.result,
+            'error': self.error,
+        }
+
+# -----------------------
+# 7. IMPORT CHECKPOINTS
+# -----------------------
+class ImportCheckpoint(models.Model):
+    """
+    How far the import of one CSV file (identified by its SHA-256) has
+    got: rows and bytes committed and the running totals, saved in the
+    same transaction as each chunk. Importing the same file again after
+    an interruption resumes from here (see checkpoints.py).
+    """
+    file_hash = models.CharField(max_length=64, unique=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    byte_offset = models.PositiveBigIntegerField(default=0)
+    totals = models.JSONField(default=dict, blank=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        state = 'done' if self.completed_at else f'{self.rows_done} rows committed'
+        return f"Import of {self.file_hash[:12]} ({state})"
+
+# -----------------------
+# 8. CACHE VERSIONS
+# -----------------------
+class CacheVersion(models.Model):
+    """
+    A named counter embedded in cache keys. It is bumped inside the
+    transaction of the writes it covers, so every process sees the
+    invalidation exactly when the data commits (see listing.py).
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+# -----------------------
+# 9. CHANGE LOG
+# -----------------------
+class CustomerChange(models.Model):
+    """
+    One row per insert, update or delete of a customer's profile, address
+    or shipping row, appended by SQLite triggers (see changelog.py). The id
+    is assigned inside the writing transaction and SQLite commits one
+    writer at a time, so ids grow in commit order: the change feed cursor.
+    """
+    customer_id = models.BigIntegerField()
+    changed_at = models.DateTimeField(db_default=Now(), db_index=True)
+
+    def __str__(self):
+        return f"Change #{self.pk} of customer #{self.customer_id}"
@@ -0,0 +1,138 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import UserProfile, Address
+
+# -----------------------
+# SQLite FTS5 indexes
+# -----------------------
+# Each index is an external-content FTS5 table over a main_app table, kept
+# in sync by triggers so bulk_create() and raw updates are indexed too.
+FTS_INDEXES = {
+    'main_app_userprofile_fts': {
+        'table': UserProfile._meta.db_table,
+        'columns': ['Name', 'Email', 'Mobile', 'Number'],
+    },
+    'main_app_address_fts': {
+        'table': Address._meta.db_table,
+        'columns': ['AddressName', 'Address', 'City', 'State', 'Zip', 'Country'],
+    },
+}
+USERPROFILE_FTS = 'main_app_userprofile_fts'
+ADDRESS_FTS = 'main_app_address_fts'
+
+MAX_SEARCH_RESULTS = 100
+
+TOKEN_RE = re.compile(r'\w[\w@.\-]*', re.UNICODE)
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def _trigger_sql(fts_name, table, columns):
+    cols = ', '.join(f'"{c}"' for c in columns)
+    old_values = ', '.join(f'old."{c}"' for c in columns)
+    new_values = ', '.join(f'new."{c}"' for c in columns)
+    insert_new = f'INSERT INTO {fts_name}(rowid, {cols}) VALUES (new.id, {new_values});'
+    delete_old = f"INSERT INTO {fts_name}({fts_name}, rowid, {cols}) VALUES ('delete', old.id, {old_values});"
+    return {
+        f'{fts_name}_ai': f'CREATE TRIGGER IF NOT EXISTS {fts_name}_ai AFTER INSERT ON {table} BEGIN {insert_new} END',
+        f'{fts_name}_ad': f'CREATE TRIGGER IF NOT EXISTS {fts_name}_ad AFTER DELETE ON {table} BEGIN {delete_old} END',
+        f'{fts_name}_au': f'CREATE TRIGGER IF NOT EXISTS {fts_name}_au AFTER UPDATE ON {table} BEGIN {delete_old} {insert_new} END',
+    }
+
+
+def install_fts(conn=None, rebuild=False):
+    """
+    Creates the FTS5 tables and their sync triggers if missing.
+
+    Rebuilding SQLite tables during a migration drops their triggers, so
+    this also runs after every migrate; when triggers had to be recreated
+    the index is rebuilt from the content tables.
+    """
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        for fts_name, spec in FTS_INDEXES.items():
+            needs_rebuild = rebuild
+            if fts_name not in existing:
+                cols = ', '.join(f'"{c}"' for c in spec['columns'])
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE {fts_name} USING fts5({cols}, "
+                    f"content='{spec['table']}', content_rowid='id')"
+                )
+                needs_rebuild = True
+            for trigger_name, sql in _trigger_sql(fts_name, spec['table'], spec['columns']).items():
+                if trigger_name not in existing:
+                    cursor.execute(sql)
+                    needs_rebuild = True
+            if needs_rebuild:
+                cursor.execute(f"INSERT INTO {fts_name}({fts_name}) VALUES ('rebuild')")
+
+
+def uninstall_fts(conn=None):
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for fts_name in FTS_INDEXES:
+            for trigger_name in ('_ai', '_ad', '_au'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {fts_name}{trigger_name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {fts_name}')
+
+
+def build_match_query(term):
+    """
+    Turns free text into a safe FTS5 MATCH expression: every token becomes
+    a quoted prefix query, and all of them must match.
+    """
+    tokens = TOKEN_RE.findall(term or '')
+    return ' '.join('"{}"*'.format(token.replace('"', '""')) for token in tokens)
+
+
+def fts_filter(queryset, fts_name, term):
+    """
+    Restricts a queryset of the FTS index's content table to rows matching
+    `term`. Returns None when FTS is not available so callers can fall back.
+    """
+    if not fts_available():
+        return None
+    match = build_match_query(term)
+    if not match:
+        return queryset.none()
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {fts_name} WHERE {fts_name} MATCH %s', [match]
+    ))
+
+
+def search_customer_ids(term, limit=MAX_SEARCH_RESULTS, offset=0):
+    """
+    Ranked customer search across profile and address fields. Returns
+    UserProfile primary keys, best bm25 score first, skipping the first
+    `offset` of them.
+    """
+    match = build_match_query(term)
+    if not match or not fts_available():
+        return []
+    sql = f'''
+        SELECT user_id FROM (
+            SELECT rowid AS user_id, bm25({USERPROFILE_FTS}) AS score
+            FROM {USERPROFILE_FTS} WHERE {USERPROFILE_FTS} MATCH %s
+            UNION ALL
+            SELECT a.user_id AS user_id, bm25({ADDRESS_FTS}) AS score
+            FROM {ADDRESS_FTS} JOIN {Address._meta.db_table} a ON a.id = {ADDRESS_FTS}.rowid
+            WHERE {ADDRESS_FTS} MATCH %s
+        )
+        GROUP BY user_id
+        ORDER BY MIN(score), user_id
+        LIMIT %s OFFSET %s
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, match, limit, offset])
+        return [row[0] for row in cursor.fetchall()]
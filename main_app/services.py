@@ -0,0 +1,118 @@
+from django import forms
+from django.db import transaction
+
+from .dedupe import set_customer_keys
+from .forms import UnifiedUserForm
+from .importers import import_chunk, save_customer
+from .models import UserProfile, Address, ShippingAndTax
+
+# Batch API records that leave out a checkbox field get its form initial
+# (Active=True) rather than the False an unchecked HTML checkbox means.
+BATCH_BOOLEAN_DEFAULTS = {
+    name: field.initial for name, field in UnifiedUserForm.base_fields.items()
+    if isinstance(field, forms.BooleanField) and field.initial
+}
+
+DUPLICATE_NUMBER_MESSAGE = 'Account Number already exists.'
+
+
+def build_customer_from_form(data):
+    """
+    Unsaved (UserProfile, Address, ShippingAndTax) triple from a valid
+    UnifiedUserForm's cleaned_data, with blanks where the form left
+    a field out.
+    """
+    user_profile = UserProfile(
+        Name=data['Name'],
+        Mobile=data.get('Mobile', ''),
+        Email=data.get('Email', ''),
+        Group=data.get('Group', ''),
+        Status=data.get('Status', ''),
+        Active=data.get('Active', True),
+        CreditLimit=data.get('CreditLimit'),
+        PaymentTerms=data.get('PaymentTerms', ''),
+        Salesman=data.get('Salesman', ''),
+        DefaultPriority=data.get('DefaultPriority', 5),
+        AlertNotes=data.get('AlertNotes', ''),
+        QuickBooksClassName=data.get('QuickBooksClassName', ''),
+        IssuableStatus=data.get('IssuableStatus', ''),
+        Number=data.get('Number') or None
+    )
+
+    address = Address(
+        AddressName=data.get('AddressName', ''),
+        AddressContact=data.get('AddressContact', ''),
+        AddressType=data.get('AddressType', ''),
+        IsDefault=data.get('IsDefault', False),
+        Address=data.get('Address', ''),
+        City=data.get('City', ''),
+        State=data.get('State', ''),
+        Zip=data.get('Zip', ''),
+        Country=data.get('Country', ''),
+        Fax=data.get('Fax', ''),
+        Pager=data.get('Pager', ''),
+        Web=data.get('Web', '')
+    )
+
+    shipping = ShippingAndTax(
+        TaxRate=data.get('TaxRate'),
+        TaxExempt=data.get('TaxExempt', False),
+        TaxExemptNumber=data.get('TaxExemptNumber', ''),
+        URL=data.get('URL', ''),
+        CarrierName=data.get('CarrierName', ''),
+        CarrierService=data.get('CarrierService', ''),
+        ShippingTerms=data.get('ShippingTerms', ''),
+        ToBeEmailed=data.get('ToBeEmailed', False),
+        ToBePrinted=data.get('ToBePrinted', False),
+    )
+    set_customer_keys(user_profile, address)
+    return user_profile, address, shipping
+
+
+def create_customer(data):
+    """
+    Creates a customer (profile, primary address, shipping and tax) from a
+    valid UnifiedUserForm's cleaned_data in one transaction. Returns the
+    saved (UserProfile, Address, ShippingAndTax).
+    """
+    return save_customer(build_customer_from_form(data))
+
+
+def create_customers_batch(records, chunk_size=None):
+    """
+    Validates API records (dicts of UnifiedUserForm fields) and inserts the
+    valid ones with bulk writes in one transaction. Account numbers already
+    taken, or repeated within the batch, fail that record only. Returns one
+    result per record, in order.
+    """
+    results = [None] * len(records)
+    customers = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            results[index] = {'index': index, 'success': False, 'errors': {'__all__': ['Expected an object.']}}
+            continue
+        form = UnifiedUserForm({**BATCH_BOOLEAN_DEFAULTS, **record})
+        if form.is_valid():
+            customers.append((index, build_customer_from_form(form.cleaned_data)))
+        else:
+            errors = {field: [str(e) for e in messages] for field, messages in form.errors.items()}
+            results[index] = {'index': index, 'success': False, 'errors': errors}
+
+    with transaction.atomic():
+        numbers = {customer[0].Number for _, customer in customers if customer[0].Number}
+        taken = set(UserProfile.objects.filter(Number__in=numbers).values_list('Number', flat=True))
+        accepted = []
+        for index, customer in customers:
+            number = customer[0].Number
+            if number and number in taken:
+                results[index] = {'index': index, 'success': False, 'errors': {'Number': [DUPLICATE_NUMBER_MESSAGE]}}
+                continue
+            if number:
+                taken.add(number)
+            accepted.append((index, customer))
+
+        if accepted:
+            saved = import_chunk([customer for _, customer in accepted], chunk_size)
+            for (index, _), (profile, _) in zip(accepted, saved):
+                results[index] = {'index': index, 'success': True, 'id': profile.pk, 'Number': profile.Number}
+    return results
@@ -0,0 +1,67 @@
+from django.db.models import OuterRef, Subquery
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .dedupe import name_zip_key, normalize_email, normalize_phone
+from .listing import bump_listing_version
+from .models import PRIMARY_ADDRESS_ORDERING, UserProfile, Address, ShippingAndTax, Tombstone
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+@receiver([post_save, post_delete], sender=Address)
+@receiver([post_save, post_delete], sender=ShippingAndTax)
+def invalidate_listing(sender, **kwargs):
+    bump_listing_version()
+
+
+@receiver(post_delete, sender=UserProfile)
+@receiver(post_delete, sender=Address)
+@receiver(post_delete, sender=ShippingAndTax)
+def record_tombstone(sender, instance, **kwargs):
+    # Cascaded deletes arrive here one object at a time as well.
+    Tombstone.objects.create(
+        model=sender._meta.model_name,
+        object_id=instance.pk,
+        customer_id=instance.pk if sender is UserProfile else instance.user_id,
+        number=instance.Number if sender is UserProfile else None,
+    )
+
+
+@receiver(pre_save, sender=UserProfile)
+def update_customer_keys(sender, instance, raw=False, **kwargs):
+    # Bulk writes set the keys themselves (dedupe.set_customer_keys). The
+    # zip part of name_zip_key is kept; address saves maintain it.
+    if raw:
+        return
+    instance.email_key = normalize_email(instance.Email)
+    instance.phone_key = normalize_phone(instance.Mobile)
+    instance.name_zip_key = name_zip_key(instance.Name, instance.name_zip_key.partition(':')[2])
+
+
+@receiver(post_save, sender=Address)
+def update_name_zip_key(sender, instance, created=False, raw=False, update_fields=None, **kwargs):
+    # Only a new address, or a change of Zip or IsDefault, can change the
+    # primary address's zip. The profile's name and the primary zip are read
+    # in one query by user_id, without loading instance.user.
+    if raw:
+        return
+    loaded, instance._loaded_key_fields = getattr(instance, '_loaded_key_fields', None), (instance.Zip, instance.IsDefault)
+    if update_fields is not None and not {'Zip', 'IsDefault'} & set(update_fields):
+        return
+    if not created and loaded == (instance.Zip, instance.IsDefault):
+        return
+    primary_zip = Address.objects.filter(user=OuterRef('pk')).order_by(*PRIMARY_ADDRESS_ORDERING).values('Zip')[:1]
+    row = (
+        UserProfile.objects.filter(pk=instance.user_id)
+        .annotate(primary_zip=Subquery(primary_zip))
+        .values_list('Name', 'name_zip_key', 'primary_zip')
+        .first()
+    )
+    if row is None:
+        return
+    name, current, zip_code = row
+    key = name_zip_key(name, zip_code)
+    if key != current:
+        UserProfile.objects.filter(pk=instance.user_id).update(name_zip_key=key)
+        if Address.user.is_cached(instance):
+            instance.user.name_zip_key = key
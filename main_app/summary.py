@@ -0,0 +1,170 @@
+from django.db import connection
+
+from .models import PRIMARY_ADDRESS_ORDERING, UserProfile, Address, CustomerSummary
+
+# -----------------------
+# Customer summary triggers
+# -----------------------
+# CustomerSummary holds what the listing shows of each customer. SQLite
+# triggers refresh a customer's row whenever the profile or any of its
+# addresses change, so bulk_create(), queryset updates and raw SQL are
+# covered as well as save() and delete().
+SUMMARY_TABLE = CustomerSummary._meta.db_table
+PROFILE_TABLE = UserProfile._meta.db_table
+ADDRESS_TABLE = Address._meta.db_table
+
+# Summary column -> SQL over the profile `p` and its primary address `a`.
+# Rows without an address show blanks, like listing.table_record().
+SUMMARY_COLUMNS = {
+    'customer_id': 'p.id',
+    'LocationName': 'p."Name"',
+    'Address': 'COALESCE(a."Address", \'\')',
+    'City': 'COALESCE(a."City", \'\')',
+    'State': 'COALESCE(a."State", \'\')',
+    'Zip': 'COALESCE(a."Zip", \'\')',
+    'ContactPerson': 'CASE WHEN a.id IS NULL THEN \'\' ELSE a."AddressContact" END',
+    'Phone': 'p."Mobile"',
+    'Email': 'p."Email"',
+}
+
+# Only changes to these columns can alter a summary row.
+PROFILE_COLUMNS = ['Name', 'Mobile', 'Email']
+ADDRESS_COLUMNS = ['user_id', 'IsDefault', 'Address', 'City', 'State', 'Zip', 'AddressContact']
+
+TRIGGER_NAMES = [
+    f'{SUMMARY_TABLE}_{suffix}'
+    for suffix in ('profile_ai', 'profile_au', 'profile_ad', 'address_ai', 'address_au', 'address_ad')
+]
+
+
+def summary_available(conn=None):
+    """
+    Whether the summary table is being kept current: SQLite, with all of
+    its triggers installed. The answer is kept per database connection, and
+    install_summary() and uninstall_summary() update it; a connection
+    opened later (CONN_MAX_AGE) checks again.
+    """
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return False
+    conn.ensure_connection()
+    known = getattr(conn, '_summary_triggers', None)
+    if known is not None and known[0] is conn.connection:
+        return known[1]
+    placeholders = ', '.join(['%s'] * len(TRIGGER_NAMES))
+    with conn.cursor() as cursor:
+        cursor.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})", TRIGGER_NAMES,
+        )
+        available = cursor.fetchone()[0] == len(TRIGGER_NAMES)
+    _remember_triggers(conn, available)
+    return available
+
+
+def _remember_triggers(conn, available):
+    conn._summary_triggers = (conn.connection, available)
+
+
+def _primary_address_order():
+    # PRIMARY_ADDRESS_ORDERING as SQL.
+    terms = []
+    for field in PRIMARY_ADDRESS_ORDERING:
+        name = field.lstrip('-')
+        column = 'id' if name == 'pk' else f'"{name}"'
+        terms.append(f'{column} DESC' if field.startswith('-') else column)
+    return ', '.join(terms)
+
+
+def refresh_sql(where):
+    """
+    Statement (re)writing the summary rows of the profiles matching
+    `where`, a condition on `p`.
+    """
+    columns = ', '.join(f'"{column}"' for column in SUMMARY_COLUMNS)
+    values = ', '.join(SUMMARY_COLUMNS.values())
+    return (
+        f'INSERT OR REPLACE INTO {SUMMARY_TABLE} ({columns}) SELECT {values} FROM {PROFILE_TABLE} p '
+        f'LEFT JOIN {ADDRESS_TABLE} a ON a.id = ('
+        f'SELECT id FROM {ADDRESS_TABLE} WHERE user_id = p.id ORDER BY {_primary_address_order()} LIMIT 1'
+        f') WHERE {where};'
+    )
+
+
+def _trigger_sql():
+    profile_columns = ', '.join(f'"{c}"' for c in PROFILE_COLUMNS)
+    address_columns = ', '.join(f'"{c}"' for c in ADDRESS_COLUMNS)
+    statements = [
+        f'AFTER INSERT ON {PROFILE_TABLE} BEGIN {refresh_sql("p.id = new.id")} END',
+        f'AFTER UPDATE OF {profile_columns} ON {PROFILE_TABLE} BEGIN {refresh_sql("p.id = new.id")} END',
+        f'AFTER DELETE ON {PROFILE_TABLE} BEGIN DELETE FROM {SUMMARY_TABLE} WHERE customer_id = old.id; END',
+        f'AFTER INSERT ON {ADDRESS_TABLE} BEGIN {refresh_sql("p.id = new.user_id")} END',
+        f'AFTER UPDATE OF {address_columns} ON {ADDRESS_TABLE} '
+        f'BEGIN {refresh_sql("p.id IN (old.user_id, new.user_id)")} END',
+        f'AFTER DELETE ON {ADDRESS_TABLE} BEGIN {refresh_sql("p.id = old.user_id")} END',
+    ]
+    return {
+        name: f'CREATE TRIGGER IF NOT EXISTS {name} {statement}'
+        for name, statement in zip(TRIGGER_NAMES, statements)
+    }
+
+
+def rebuild_summary(conn=None):
+    """
+    Repopulates the whole summary table from the profiles and addresses.
+    Returns the number of rows written.
+    """
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SUMMARY_TABLE}')
+        cursor.execute(refresh_sql('1'))
+        return cursor.rowcount
+
+
+def install_summary(conn=None, rebuild=None):
+    """
+    Creates the summary triggers if missing. The table is rebuilt when
+    `rebuild` is true, or by default when a trigger had to be recreated,
+    as writes may have gone by without it. Returns the number of rows
+    rebuilt, or None.
+    """
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existing = {row[0] for row in cursor.fetchall()}
+        if SUMMARY_TABLE not in existing:
+            # Migrated back to before the summary table.
+            return None
+        missing = [sql for name, sql in _trigger_sql().items() if name not in existing]
+        for sql in missing:
+            cursor.execute(sql)
+    if rebuild is None:
+        rebuild = bool(missing)
+    _remember_triggers(conn, True)
+    if rebuild:
+        return rebuild_summary(conn)
+
+
+def uninstall_summary(conn=None):
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return
+    with conn.cursor() as cursor:
+        for name in TRIGGER_NAMES:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    _remember_triggers(conn, False)
+
+
+# --- Migrations ---
+# The triggers of each table read the other one, so SQLite cannot rebuild
+# (create, copy, drop, rename) the profile or address table while they
+# exist. A migration altering either table runs these RunPython functions
+# around its operations. Both run in the migration's transaction, so no
+# other write can commit in between and the summary needs no rebuild.
+def drop_triggers_for_migration(apps, schema_editor):
+    uninstall_summary(schema_editor.connection)
+
+
+def restore_triggers_after_migration(apps, schema_editor):
+    install_summary(schema_editor.connection, rebuild=False)
@@ -0,0 +1,123 @@
+import random
+from decimal import Decimal
+
+from django.db import transaction
+
+from .dedupe import set_customer_keys
+from .importers import chunked, import_chunk
+from .models import UserProfile, Address, ShippingAndTax
+
+FIRST_NAMES = [
+    'James', 'Mary', 'Robert', 'Patricia', 'John', 'Jennifer', 'Michael', 'Linda', 'David', 'Elizabeth',
+    'William', 'Barbara', 'Richard', 'Susan', 'Joseph', 'Jessica', 'Thomas', 'Sarah', 'Carlos', 'Priya',
+]
+LAST_NAMES = [
+    'Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia', 'Miller', 'Davis', 'Rodriguez', 'Martinez',
+    'Hernandez', 'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor', 'Moore', 'Patel', 'Nguyen',
+]
+COMPANY_SUFFIXES = ['Inc', 'LLC', 'Co', 'Supply', 'Trading', 'Wholesale', 'Retail', 'Group']
+STREETS = ['Main St', 'Oak Ave', 'Maple Dr', 'Cedar Ln', 'Park Rd', 'Elm St', 'Lake View', 'Hill St', 'Market St']
+# (city, state, zip prefix, weight): a few large metros and a long tail.
+CITIES = [
+    ('New York', 'NY', '100', 20), ('Los Angeles', 'CA', '900', 14), ('Chicago', 'IL', '606', 10),
+    ('Houston', 'TX', '770', 8), ('Phoenix', 'AZ', '850', 6), ('Philadelphia', 'PA', '191', 5),
+    ('San Antonio', 'TX', '782', 4), ('San Diego', 'CA', '921', 4), ('Dallas', 'TX', '752', 4),
+    ('Austin', 'TX', '787', 3), ('Denver', 'CO', '802', 3), ('Seattle', 'WA', '981', 3),
+    ('Boise', 'ID', '837', 1), ('Springfield', 'IL', '627', 1), ('Burlington', 'VT', '054', 1),
+]
+GROUPS = [('Retail', 50), ('Wholesale', 25), ('Distributor', 15), ('Government', 5), ('', 5)]
+STATUSES = [('Normal', 85), ('Hold', 10), ('Inactive', 5)]
+PAYMENT_TERMS = ['Net 30', 'Net 15', 'Net 60', 'COD', 'Prepaid']
+CARRIERS = [('UPS', 'Ground'), ('FedEx', 'Express'), ('USPS', 'Priority'), ('Will Call', '')]
+SALESMEN = ['admin', 'jdoe', 'asmith', 'mlee', 'rpatel']
+
+
+def _weighted(rng, options):
+    return rng.choices([o[:-1] if len(o) > 2 else o[0] for o in options], weights=[o[-1] for o in options])[0]
+
+
+def synthetic_customer(rng, index):
+    """
+    One unsaved (UserProfile, Address, ShippingAndTax) triple. Values follow
+    skewed, roughly realistic distributions: a handful of big cities, mostly
+    retail accounts, log-normal credit limits, sparse notes.
+    """
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    company = f'{last} {rng.choice(COMPANY_SUFFIXES)}' if rng.random() < 0.7 else f'{first} {last}'
+    city, state, zip_prefix = _weighted(rng, CITIES)
+    carrier, service = rng.choice(CARRIERS)
+    tax_exempt = rng.random() < 0.1
+
+    profile = UserProfile(
+        Name=company,
+        Mobile=f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(0, 9999):04d}',
+        Email=f'{first.lower()}.{last.lower()}{index}@example.com',
+        Group=_weighted(rng, GROUPS),
+        Status=_weighted(rng, STATUSES),
+        Active=rng.random() < 0.92,
+        CreditLimit=Decimal(min(99999999, int(rng.lognormvariate(8, 1.2)))).quantize(Decimal('0.01')),
+        Number=f'SYN-{index:08d}',
+        PaymentTerms=rng.choice(PAYMENT_TERMS),
+        Salesman=rng.choice(SALESMEN),
+        DefaultPriority=rng.choice([1, 3, 5, 5, 5, 5, 7, 9]),
+        AlertNotes='Call before delivery.' if rng.random() < 0.05 else '',
+    )
+    address = Address(
+        AddressName='Main Office',
+        AddressContact=f'{first} {last}',
+        AddressType=rng.choice(['MAIN', 'MAIN', 'WORK', 'RES']),
+        IsDefault=True,
+        Address=f'{rng.randint(1, 9999)} {rng.choice(STREETS)}',
+        City=city,
+        State=state,
+        Zip=f'{zip_prefix}{rng.randint(0, 99):02d}',
+        Country='US',
+    )
+    shipping = ShippingAndTax(
+        TaxRate=None if tax_exempt else Decimal(rng.choice(['0.050', '0.060', '0.0725', '0.080', '0.0875'])).quantize(Decimal('0.001')),
+        TaxExempt=tax_exempt,
+        TaxExemptNumber=f'EX-{index}' if tax_exempt else '',
+        CarrierName=carrier,
+        CarrierService=service,
+        ShippingTerms=rng.choice(['Prepaid', 'Collect', 'Prepaid & Add']),
+    )
+    set_customer_keys(profile, address)
+    return profile, address, shipping
+
+
+def _extra_address(rng, profile):
+    city, state, zip_prefix = _weighted(rng, CITIES)
+    return Address(
+        user=profile,
+        AddressName=rng.choice(['Warehouse', 'Billing', 'Store']),
+        AddressType=rng.choice(['WORK', 'OTHER']),
+        IsDefault=False,
+        Address=f'{rng.randint(1, 9999)} {rng.choice(STREETS)}',
+        City=city,
+        State=state,
+        Zip=f'{zip_prefix}{rng.randint(0, 99):02d}',
+        Country='US',
+    )
+
+
+def generate_customers(count, seed=None, chunk_size=5000, start=None):
+    """
+    Bulk-inserts `count` synthetic customers, about a fifth of them with one
+    or two extra shipping locations. Account numbers continue after the
+    existing ones unless `start` is given. Returns the number created.
+    """
+    rng = random.Random(seed)
+    if start is None:
+        start = UserProfile.objects.filter(Number__startswith='SYN-').count()
+
+    for indexes in chunked(range(start, start + count), chunk_size):
+        customers = [synthetic_customer(rng, index) for index in indexes]
+        with transaction.atomic():
+            saved = import_chunk(customers, chunk_size)
+            extras = [
+                _extra_address(rng, profile)
+                for profile, _ in saved if rng.random() < 0.2
+                for _ in range(rng.randint(1, 2))
+            ]
+            Address.objects.bulk_create(extras, batch_size=chunk_size)
+    return count
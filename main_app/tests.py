@@ -1,3 +1,1390 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import pkgutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import F
+from django.db.backends.sqlite3.base import DatabaseWrapper as SQLiteDatabaseWrapper
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .benchmarks import find_regressions
+from .changelog import change_log_available, install_change_log, uninstall_change_log
+from .changes import customer_data_state, format_cursor
+from .checkpoints import ImportConflict, import_csv_resumable
+from .dedupe import duplicate_clusters, name_zip_key, normalize_email, normalize_phone, normalize_zip, soundex
+from .exporters import EXPORT_FORMATS, EXPORT_HEADERS, EXPORT_TARGETS, iter_export
+from .importers import OffsetCsvReader, build_customer
+from .jobs import claim_job, release_stale_jobs, retry_job, run_job
+from .listing import bump_listing_version, listing_version, profile_record, summary_record, SUMMARY_FIELDS
+from .loadtest import SERVERS, start_server
+from .metrics import percentile, registry
+from .models import (
+    UserProfile, Address, ShippingAndTax, CacheVersion, CustomerChange, CustomerSummary, ImportCheckpoint, Job,
+    Tombstone,
+)
+from .search import build_match_query, search_customer_ids
+from .summary import summary_available, uninstall_summary
+from .synthetic import generate_customers
+from .validation import RowValidator
+
+
+def make_csv(count, start=0):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_HEADERS)
+    writer.writeheader()
+    for i in range(start, start + count):
+        writer.writerow({
+            'Name': f'Customer {i}',
+            'Account Number': f'ACC-{i}',
+            'Mobile': f'555-{i:04d}',
+            'Email': f'customer{i}@example.com',
+            'Credit Limit': '100.00',
+            'Priority': '5',
+            'Address Name': 'Main',
+            'Address': f'{i} Main St',
+            'City': 'Springfield',
+            'State': 'IL',
+            'Zip': '62701',
+            'Country': 'US',
+            'Tax Rate': '0.075',
+            'Tax Exempt': 'False',
+            'Is Default': 'True',
+            'Active': 'True',
+        })
+    return buffer.getvalue().encode('utf-8')
+
+
+def upload(content, name='customers.csv'):
+    return SimpleUploadedFile(name, content, content_type='text/csv')
+
+
+class ImportUsersCsvTests(TestCase):
+
+    def test_bulk_import_links_related_rows(self):
+        response = self.client.post(reverse('import_csv'), {
+            'csv_file': upload(make_csv(25)),
+            'chunk_size': 10,
+        })
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['success'])
+        self.assertIn('rows_per_second', data)
+
+        self.assertEqual(UserProfile.objects.count(), 25)
+        self.assertEqual(Address.objects.count(), 25)
+        self.assertEqual(ShippingAndTax.objects.count(), 25)
+        profile = UserProfile.objects.get(Number='ACC-7')
+        self.assertEqual(profile.addresses.get().Address, '7 Main St')
+        self.assertEqual(str(profile.shipping_tax.TaxRate), '0.075')
+
+    def test_rejects_non_csv_upload(self):
+        response = self.client.post(reverse('import_csv'), {'csv_file': upload(b'x', name='data.txt')})
+        self.assertEqual(response.status_code, 400)
+
+    def test_streaming_import_reports_summary_and_error_rows(self):
+        content = make_csv(5).decode('utf-8').replace('100.00', 'not-a-number', 1).encode('utf-8')
+        response = self.client.post(reverse('import_csv'), {'csv_file': upload(content)})
+        data = response.json()
+        self.assertEqual(data['imported'], 4)
+        self.assertEqual(data['failed'], 1)
+        self.assertEqual(data['errors'][0]['row'], 1)
+        self.assertEqual(len(data['preview']), 4)
+        self.assertNotIn('new_records', data)
+
+
+class OffsetCsvReaderTests(TestCase):
+
+    def test_reads_multiline_and_non_ascii_rows(self):
+        content = '\ufeffName,City\r\n"Multi\nLine",Zürich\r\nB,Bern\r\n'.encode('utf-8')
+        rows = list(OffsetCsvReader(SimpleUploadedFile('x.csv', content)))
+        self.assertEqual(rows, [
+            {'Name': 'Multi\nLine', 'City': 'Zürich'},
+            {'Name': 'B', 'City': 'Bern'},
+        ])
+
+    def test_starts_mid_file(self):
+        content = '\ufeffName,Notes\r\nA,"two\r\nlines"\r\nB,é\r\nC,x\r\n'.encode('utf-8')
+        reader = OffsetCsvReader(io.BytesIO(content))
+        self.assertEqual(next(iter(reader)), {'Name': 'A', 'Notes': 'two\r\nlines'})
+        rest = list(OffsetCsvReader(io.BytesIO(content), reader.offset))
+        self.assertEqual(rest, [{'Name': 'B', 'Notes': 'é'}, {'Name': 'C', 'Notes': 'x'}])
+
+
+class ExportUsersCsvTests(TestCase):
+
+    def test_streams_header_and_one_row_per_customer(self):
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(3))})
+        with self.settings(EXPORT_CHUNK_SIZE=2):
+            response = self.client.get(reverse('export_csv'))
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(rows[0], EXPORT_HEADERS)
+        self.assertEqual([row[2] for row in rows[1:]], ['ACC-0', 'ACC-1', 'ACC-2'])
+
+
+FIXTURE_EXPORTS = os.path.join(os.path.dirname(__file__), 'fixtures', 'exports')
+
+
+class ExportTargetTests(TestCase):
+    fixtures = ['export_customers.json']
+
+    def test_targets_match_fixture_files(self):
+        for name, target in EXPORT_TARGETS.items():
+            with self.subTest(target=name), open(os.path.join(FIXTURE_EXPORTS, f'{name}.csv'), newline='') as f:
+                self.assertEqual(''.join(iter_export(target)), f.read())
+
+    def test_every_target_is_one_pass(self):
+        for target in EXPORT_TARGETS.values():
+            with self.subTest(target=target.name), self.assertNumQueries(2):
+                list(iter_export(target))
+
+    def test_reads_projected_values_only(self):
+        # Rows are value tuples of the columns a target uses; no model instances.
+        with mock.patch.object(UserProfile, 'from_db', side_effect=AssertionError), \
+                mock.patch.object(Address, 'from_db', side_effect=AssertionError):
+            with CaptureQueriesContext(connection) as captured:
+                list(iter_export(EXPORT_TARGETS['woocommerce']))
+        sql = ' '.join(query['sql'] for query in captured)
+        self.assertIn('"Email"', sql)
+        self.assertNotIn('AlertNotes', sql)
+        self.assertNotIn(ShippingAndTax._meta.db_table, sql)
+
+    def test_chunks_by_keyset(self):
+        for target in EXPORT_TARGETS.values():
+            with self.subTest(target=target.name):
+                with open(os.path.join(FIXTURE_EXPORTS, f'{target.name}.csv'), newline='') as f:
+                    self.assertEqual(''.join(iter_export(target, chunk_size=1)), f.read())
+
+    def test_target_query_parameter(self):
+        response = self.client.get(reverse('export_csv'), {'target': 'zoho'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="zoho_accounts.csv"')
+        self.assertEqual(next(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))[0], 'Account Name')
+        self.assertEqual(self.client.get(reverse('export_csv'), {'target': 'sap'}).status_code, 400)
+
+
+class ExportFormatTests(TestCase):
+    fixtures = ['export_customers.json']
+
+    def export(self, **params):
+        response = self.client.get(reverse('export_csv'), params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson(self):
+        response, body = self.export(format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in body.decode('utf-8').splitlines()]
+        self.assertEqual([line['Account Number'] for line in lines], ['ACME-1', ''])
+        self.assertEqual(lines[0]['Credit Limit'], '2500.00')
+
+    def test_gzip_matches_plain_export(self):
+        _, plain = self.export(target='fishbowl')
+        response, compressed = self.export(target='fishbowl', compress='gzip')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertIn('fishbowl_customers.csv.gz', response['Content-Disposition'])
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    @skipUnless(EXPORT_FORMATS['parquet'].available, 'pyarrow is not installed')
+    def test_parquet(self):
+        import pyarrow.parquet
+
+        with self.settings(EXPORT_CHUNK_SIZE=1):
+            _, body = self.export(format='parquet')
+        self.assertEqual(pyarrow.parquet.ParquetFile(io.BytesIO(body)).num_row_groups, 2)
+        table = pyarrow.parquet.read_table(io.BytesIO(body))
+        self.assertEqual(table.column_names, EXPORT_HEADERS)
+        self.assertEqual(table.column('Credit Limit').to_pylist(), [Decimal('2500.00'), None])
+
+    def test_parquet_without_pyarrow(self):
+        with mock.patch.object(EXPORT_FORMATS['parquet'], 'available', False):
+            response = self.client.get(reverse('export_csv'), {'format': 'parquet'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pyarrow', response.json()['message'])
+
+    def test_unknown_format_or_compression(self):
+        self.assertEqual(self.client.get(reverse('export_csv'), {'format': 'xlsx'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_csv'), {'compress': 'zip'}).status_code, 400)
+
+
+class PrimaryAddressTests(TestCase):
+
+    def setUp(self):
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(20))})
+
+    def test_prefers_default_address(self):
+        profile = UserProfile.objects.get(Number='ACC-3')
+        Address.objects.filter(user=profile).update(IsDefault=False)
+        default = Address.objects.create(
+            user=profile, AddressName='HQ', Address='1 HQ Way', City='X', State='Y', Zip='1', Country='US',
+            IsDefault=True,
+        )
+        self.assertEqual(profile.primary_address, default)
+        self.assertEqual(UserProfile.objects.with_primary_address().get(pk=profile.pk).primary_address, default)
+
+    def test_listing_runs_constant_queries(self):
+        # One read of the customer summary table, no joins or prefetches.
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_runs_constant_queries(self):
+        change_log_available()
+        # The newest change log row and tombstone (ETag/Last-Modified),
+        # then profiles with shipping and addresses.
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('export_csv'))
+            b''.join(response.streaming_content)
+
+
+class CustomersApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(12))})
+
+    def test_keyset_pages_cover_every_customer_once(self):
+        seen, after = [], None
+        while True:
+            params = {'page_size': 5}
+            if after is not None:
+                params['after'] = after
+            # The cache version and the page.
+            with self.assertNumQueries(2):
+                page = self.client.get(reverse('customers_api'), params).json()
+            seen.extend(record['id'] for record in page['results'])
+            if not page['has_more']:
+                break
+            after = page['next_cursor']
+        self.assertEqual(seen, list(UserProfile.objects.order_by('pk').values_list('pk', flat=True)))
+
+    def test_page_size_is_clamped(self):
+        page = self.client.get(reverse('customers_api'), {'page_size': 100000}).json()
+        self.assertEqual(len(page['results']), 12)
+        self.assertFalse(page['has_more'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('customers_api'), {'after': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_home_page_embeds_first_page_only(self):
+        response = self.client.get(reverse('home'))
+        self.assertEqual(len(json.loads(response.context['initial_table_data_json'])['results']), 5)
+
+
+class CustomerSearchTests(TestCase):
+
+    def setUp(self):
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(5))})
+        self.acme = UserProfile.objects.create(Name='Acme Widgets', Email='sales@acme.test', Number='ACME-1')
+        Address.objects.create(
+            user=self.acme, AddressName='Warehouse', Address='9 Dock Rd', City='Rotterdam', State='ZH',
+            Zip='3011', Country='NL',
+        )
+
+    def test_search_matches_profile_and_address_fields(self):
+        by_name = self.client.get(reverse('customers_api'), {'q': 'acme wid'}).json()
+        self.assertEqual([r['id'] for r in by_name['results']], [self.acme.pk])
+        by_city = self.client.get(reverse('customers_api'), {'q': 'rotter'}).json()
+        self.assertEqual([r['id'] for r in by_city['results']], [self.acme.pk])
+
+    def test_index_follows_updates_and_deletes(self):
+        UserProfile.objects.filter(pk=self.acme.pk).update(Name='Globex')
+        self.assertEqual(search_customer_ids('acme wid'), [])
+        self.assertEqual(search_customer_ids('globex'), [self.acme.pk])
+        self.acme.delete()
+        self.assertEqual(search_customer_ids('globex'), [])
+        self.assertEqual(search_customer_ids('rotterdam'), [])
+
+    def test_match_query_is_escaped(self):
+        self.assertEqual(build_match_query('a"b OR'), '"a"* "b"* "OR"*')
+        self.assertEqual(search_customer_ids('NEAR( "'), [])
+
+    def test_admin_changelist_uses_index(self):
+        from django.contrib.auth.models import User
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        response = self.client.get(reverse('admin:main_app_address_changelist'), {'q': 'dock'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class IndexAndConstraintTests(TestCase):
+
+    def setUp(self):
+        self.profile = UserProfile.objects.create(Name='Acme', Number='ACC-1')
+
+    def add_address(self, is_default):
+        return Address.objects.create(
+            user=self.profile, AddressName='A', Address='1 St', City='C', State='S', Zip='1', Country='US',
+            IsDefault=is_default,
+        )
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan, plan)
+
+    def test_account_number_is_unique_but_null_may_repeat(self):
+        UserProfile.objects.create(Name='No number 1')
+        UserProfile.objects.create(Name='No number 2')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            UserProfile.objects.create(Name='Dup', Number='ACC-1')
+
+    def test_one_default_address_per_user(self):
+        self.add_address(is_default=True)
+        self.add_address(is_default=False)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.add_address(is_default=True)
+
+    def test_query_plans_use_indexes(self):
+        self.assertUsesIndex(UserProfile.objects.filter(Number='ACC-1'), 'userprofile_number_unique')
+        self.assertUsesIndex(UserProfile.objects.filter(Group='Retail').order_by('Name'), 'userprofile_group_name_idx')
+        self.assertUsesIndex(UserProfile.objects.order_by('Name'), 'userprofile_name_idx')
+        self.assertUsesIndex(
+            Address.objects.filter(user=self.profile).order_by('-IsDefault', 'pk'), 'address_user_default_idx'
+        )
+        self.assertUsesIndex(Address.objects.filter(Country='US', State='IL'), 'address_location_idx')
+        self.assertUsesIndex(Address.objects.filter(City='Springfield'), 'address_city_idx')
+
+
+class UpsertImportTests(TestCase):
+
+    def import_csv(self, content, mode='upsert', **extra):
+        return self.client.post(reverse('import_csv'), {'csv_file': upload(content), 'mode': mode, **extra}).json()
+
+    def test_reimporting_an_export_is_idempotent(self):
+        self.import_csv(make_csv(6), mode='insert')
+        export = b''.join(self.client.get(reverse('export_csv')).streaming_content)
+
+        data = self.import_csv(export)
+        self.assertEqual((data['created'], data['updated'], data['unchanged']), (0, 0, 6))
+        self.assertEqual(UserProfile.objects.count(), 6)
+        self.assertEqual(Address.objects.count(), 6)
+        self.assertEqual(ShippingAndTax.objects.count(), 6)
+
+    def test_updates_changed_rows_and_creates_new_ones(self):
+        self.import_csv(make_csv(4), mode='insert')
+        profile = UserProfile.objects.get(Number='ACC-1')
+        profile.QuickBooksClassName = 'Kept'
+        profile.save()
+
+        content = make_csv(5).decode('utf-8').replace('1 Main St', '1 Elm St').encode('utf-8')
+        # One more for the duplicate check (see DuplicateDetectionTests), and
+        # the checkpoint's: 4 to open it, 3 per chunk and 1 to complete it,
+        # and two cache version bumps.
+        with self.assertNumQueries(21):
+            data = self.import_csv(content, chunk_size=100)
+        self.assertEqual((data['created'], data['updated'], data['unchanged']), (1, 1, 3))
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.primary_address.Address, '1 Elm St')
+        self.assertEqual(profile.QuickBooksClassName, 'Kept')
+        self.assertEqual(UserProfile.objects.count(), 5)
+
+    def test_repeated_number_in_one_file_keeps_last_row(self):
+        content = make_csv(2) + make_csv(1).decode('utf-8').split('\r\n', 1)[1].replace('0 Main St', 'Later').encode('utf-8')
+        data = self.import_csv(content)
+        self.assertEqual(data['failed'], 0)
+        self.assertEqual(UserProfile.objects.filter(Number='ACC-0').get().primary_address.Address, 'Later')
+
+    def test_unknown_mode(self):
+        response = self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(1)), 'mode': 'merge'})
+        self.assertEqual(response.status_code, 400)
+
+
+def batch_record(i, **extra):
+    return {
+        'Name': f'Batch {i}', 'Number': f'BAT-{i}', 'AddressName': 'Main', 'Address': f'{i} Batch St',
+        'City': 'Springfield', 'State': 'IL', 'Zip': '62701', 'Country': 'US', **extra,
+    }
+
+
+class CreateCustomerTests(TestCase):
+
+    def post(self, record):
+        return self.client.post(reverse('home'), record, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_form_post_creates_whole_customer(self):
+        response = self.post(batch_record(0, Active='on'))
+        self.assertEqual(response.status_code, 201)
+        profile = UserProfile.objects.get(pk=response.json()['new_record']['id'])
+        self.assertEqual(profile.primary_address.Address, '0 Batch St')
+        self.assertTrue(ShippingAndTax.objects.filter(user=profile).exists())
+
+    def test_failure_midway_leaves_no_partial_customer(self):
+        with mock.patch.object(ShippingAndTax, 'save', side_effect=RuntimeError('disk full')):
+            response = self.post(batch_record(0))
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual((UserProfile.objects.count(), Address.objects.count()), (0, 0))
+
+    def test_duplicate_number(self):
+        self.post(batch_record(0))
+        response = self.post(batch_record(0))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], {'Number': ['Account Number already exists.']})
+        self.assertEqual(UserProfile.objects.count(), 1)
+
+
+@override_settings(CUSTOMER_API_TOKENS=['test-token'])
+class BatchCreateTests(TestCase):
+
+    def post(self, payload, token='test-token'):
+        return self.client.post(
+            reverse('customers_batch_api'), json.dumps(payload), content_type='application/json',
+            HTTP_AUTHORIZATION=f'Bearer {token}',
+        )
+
+    def test_creates_all_records_with_bulk_writes(self):
+        with CaptureQueriesContext(connection) as small:
+            self.post([batch_record(i) for i in range(2)])
+        with CaptureQueriesContext(connection) as large:
+            response = self.post({'records': [batch_record(i) for i in range(2, 52)]})
+        self.assertEqual(len(small), len(large))
+
+        self.assertEqual(response.status_code, 201)
+        body = response.json()
+        self.assertEqual((body['created'], body['failed']), (50, 0))
+        self.assertEqual(body['results'][0]['Number'], 'BAT-2')
+        profile = UserProfile.objects.get(pk=body['results'][0]['id'])
+        self.assertTrue(profile.Active)
+        self.assertEqual(profile.primary_address.City, 'Springfield')
+        self.assertEqual(ShippingAndTax.objects.count(), 52)
+
+    def test_reports_failures_per_item(self):
+        self.post([batch_record(0)])
+        response = self.post([
+            batch_record(1),
+            batch_record(2, Email='not-an-email'),
+            batch_record(0),
+            batch_record(1, Name='Repeat'),
+            'oops',
+        ])
+        self.assertEqual(response.status_code, 207)
+        results = response.json()['results']
+        self.assertEqual([r['success'] for r in results], [True, False, False, False, False])
+        self.assertIn('Email', results[1]['errors'])
+        self.assertEqual(results[2]['errors'], {'Number': ['Account Number already exists.']})
+        self.assertEqual(results[3]['errors'], {'Number': ['Account Number already exists.']})
+        self.assertEqual(UserProfile.objects.count(), 2)
+
+    def test_token_replaces_csrf(self):
+        # Integrations have no CSRF cookie; the bearer token authenticates them.
+        self.client = Client(enforce_csrf_checks=True)
+        self.assertEqual(self.post([batch_record(0)]).status_code, 201)
+        for token in ('wrong', ''):
+            response = self.post([batch_record(1)], token=token)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response['WWW-Authenticate'], 'Bearer')
+        response = self.client.post(reverse('customers_batch_api'), json.dumps([batch_record(1)]), content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        with self.settings(CUSTOMER_API_TOKENS=[]):
+            self.assertEqual(self.post([batch_record(1)]).status_code, 401)
+        self.assertEqual(UserProfile.objects.count(), 1)
+
+    def test_rejects_bad_payloads(self):
+        self.assertEqual(self.client.post(
+            reverse('customers_batch_api'), 'nope', content_type='application/json', HTTP_AUTHORIZATION='Bearer test-token',
+        ).status_code, 400)
+        self.assertEqual(self.post([]).status_code, 400)
+        self.assertEqual(self.post([{'Name': ''}]).status_code, 400)
+        with self.settings(CUSTOMER_BATCH_MAX_SIZE=2):
+            self.assertEqual(self.post([batch_record(i) for i in range(3)]).status_code, 400)
+        self.assertEqual(UserProfile.objects.count(), 0)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class BackgroundJobTests(TestCase):
+
+    def test_import_job_runs_and_reports_progress(self):
+        response = self.client.post(reverse('enqueue_import_job'), {'csv_file': upload(make_csv(7)), 'chunk_size': 3})
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job']['id']
+        self.assertEqual(UserProfile.objects.count(), 0)
+
+        self.assertTrue(claim_job(job_id))
+        self.assertFalse(claim_job(job_id))
+        self.assertEqual(run_job(job_id), Job.DONE)
+
+        job = self.client.get(reverse('job_status', args=[job_id])).json()['job']
+        self.assertEqual((job['status'], job['progress'], job['processed_rows']), (Job.DONE, 1.0, 7))
+        self.assertEqual(job['result']['imported'], 7)
+        self.assertEqual(UserProfile.objects.count(), 7)
+
+    def test_export_job_produces_download(self):
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(3))})
+        job_id = self.client.post(reverse('enqueue_export_job')).json()['job']['id']
+        claim_job(job_id)
+        run_job(job_id)
+
+        response = self.client.get(reverse('job_download', args=[job_id]))
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode('utf-8'))))
+        self.assertEqual(len(rows), 4)
+
+    def test_export_job_target(self):
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(2))})
+        job_id = self.client.post(reverse('enqueue_export_job'), {'target': 'woocommerce'}).json()['job']['id']
+        claim_job(job_id)
+        run_job(job_id)
+
+        response = self.client.get(reverse('job_download', args=[job_id]))
+        self.assertIn('woocommerce_customers.csv', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'username,email,'))
+
+    def test_failed_job_records_error(self):
+        job = Job.objects.create(kind=Job.IMPORT)
+        claim_job(job.pk)
+        self.assertEqual(run_job(job.pk), Job.FAILED)
+        self.assertNotEqual(Job.objects.get(pk=job.pk).error, '')
+
+    def test_jobs_without_a_live_worker_are_released(self):
+        abandoned, healthy = (Job.objects.create(kind=Job.EXPORT) for _ in range(2))
+        claim_job(abandoned.pk)
+        claim_job(healthy.pk)
+        Job.objects.filter(pk=abandoned.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(release_stale_jobs(), {abandoned.pk: Job.PENDING})
+        self.assertEqual(Job.objects.get(pk=healthy.pk).status, Job.RUNNING)
+        self.assertFalse(retry_job(healthy.pk))
+
+        # The last allowed claim fails instead of looping forever.
+        for _ in range(settings.JOB_MAX_ATTEMPTS - 1):
+            claim_job(abandoned.pk)
+            Job.objects.filter(pk=abandoned.pk).update(heartbeat_at=None)
+            release_stale_jobs()
+        self.assertEqual(Job.objects.get(pk=abandoned.pk).status, Job.FAILED)
+
+        # A running job whose supervisor died can be retried by hand.
+        Job.objects.filter(pk=healthy.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertTrue(retry_job(healthy.pk))
+        self.assertEqual(Job.objects.filter(pk=healthy.pk).values_list('status', 'attempts').get(), (Job.PENDING, 0))
+
+    def test_run_jobs_survives_a_broken_pool(self):
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(2))})
+        jobs = [Job.objects.create(kind=Job.EXPORT) for _ in range(2)]
+        pools = []
+
+        class DyingPool:
+            # The first pool loses a worker process: its first job's future
+            # fails and it refuses further submissions, like a real one.
+            def __init__(self, **kwargs):
+                self.broken = not pools
+                self.submitted = 0
+                pools.append(self)
+
+            def submit(self, fn, job_id):
+                self.submitted += 1
+                future = Future()
+                if not self.broken:
+                    future.set_result(fn(job_id))
+                elif self.submitted == 1:
+                    future.set_exception(BrokenProcessPool('A worker process died.'))
+                else:
+                    raise BrokenProcessPool('A worker process died.')
+                return future
+
+            def shutdown(self, **kwargs):
+                pass
+
+        with mock.patch('main_app.management.commands.run_jobs.ProcessPoolExecutor', DyingPool):
+            call_command('run_jobs', '--workers', '2', '--once', '--poll-interval', '0', stdout=io.StringIO(),
+                         stderr=io.StringIO())
+        self.assertEqual(len(pools), 2)
+        self.assertEqual(
+            list(Job.objects.filter(pk__in=[job.pk for job in jobs]).order_by('pk').values_list('status', 'attempts')),
+            [(Job.DONE, 2), (Job.DONE, 1)],
+        )
+
+
+class RowValidationTests(TestCase):
+
+    def rows(self):
+        rows = list(csv.DictReader(io.StringIO(make_csv(6).decode('utf-8'))))
+        rows[1]['Email'] = 'not-an-email'
+        rows[3]['Tax Rate'] = '0.12345'
+        rows[4]['City'] = ''
+        return list(enumerate(rows, start=1))
+
+    def assertReportsBadRows(self, validator):
+        valid, errors = validator(self.rows())
+        self.assertEqual([n for n, _ in valid], [1, 3, 6])
+        self.assertEqual([(e['row'], list(e['errors'])) for e in errors], [(2, ['Email']), (4, ['TaxRate']), (5, ['City'])])
+
+    def test_inline_validation(self):
+        with RowValidator(workers=1) as validator:
+            self.assertReportsBadRows(validator)
+
+    @mock.patch('main_app.validation.PARALLEL_THRESHOLD', 0)
+    def test_parallel_validation_matches_inline(self):
+        with RowValidator(workers=2, batch_size=2) as validator:
+            self.assertReportsBadRows(validator)
+            self.assertIsNotNone(validator.pool)
+
+    def test_import_skips_invalid_rows(self):
+        content = make_csv(3).decode('utf-8').replace('customer1@example.com', 'bad@', 1).encode('utf-8')
+        data = self.client.post(reverse('import_csv'), {'csv_file': upload(content)}).json()
+        self.assertEqual((data['imported'], data['failed']), (2, 1))
+        self.assertEqual(data['errors'][0]['row'], 2)
+        self.assertIn('Email', data['errors'][0]['errors'])
+
+
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(3))})
+        # Trigger checks are kept per connection; keep them out of the counts.
+        summary_available(), change_log_available()
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('customers_api'))
+        self.assertRegex(response['Server-Timing'], r'sql;dur=[\d.]+;desc="1 queries", app;dur=[\d.]+, total;dur=[\d.]+')
+
+    def test_metrics_endpoint_reports_per_view_summaries(self):
+        self.client.get(reverse('home'))
+        b''.join(self.client.get(reverse('export_csv')).streaming_content)
+
+        body = self.client.get(reverse('metrics')).content.decode('utf-8')
+        self.assertIn('# TYPE main_app_sql_queries summary', body)
+        self.assertIn('main_app_sql_queries{view="home",quantile="0.5"} 1', body)
+        self.assertIn('main_app_sql_queries{view="export_csv",quantile="0.99"} 4', body)
+        self.assertIn('main_app_request_duration_seconds_count{view="import_csv"} 1', body)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual([percentile(values, q) for q in (0.5, 0.9, 0.99)], [50, 90, 99])
+        self.assertEqual(percentile([], 0.5), 0)
+
+
+class LoadTestServerTests(SimpleTestCase):
+
+    def test_startup_failure_reports_server_stderr(self):
+        broken = ('sys', ['-c', 'import sys; sys.exit("Error: no such app")'], False)
+        with mock.patch.dict(SERVERS, {'broken': broken}):
+            with self.assertRaisesRegex(RuntimeError, r'exited with status 1\.\nError: no such app'):
+                start_server('broken')
+
+
+class SyntheticDataTests(TestCase):
+
+    def test_generates_linked_customers_with_one_default_address(self):
+        generate_customers(50, seed=1, chunk_size=20)
+        self.assertEqual(UserProfile.objects.count(), 50)
+        self.assertEqual(ShippingAndTax.objects.count(), 50)
+        self.assertEqual(Address.objects.filter(IsDefault=True).count(), 50)
+        self.assertGreaterEqual(Address.objects.count(), 50)
+
+        generate_customers(10, seed=2)
+        self.assertEqual(UserProfile.objects.filter(Number='SYN-00000059').count(), 1)
+
+    def test_find_regressions(self):
+        baseline = {'1000': {'home_page': {'latency_seconds': 0.1, 'queries': 2, 'peak_memory_bytes': 1000}}}
+        ok = {'1000': {'home_page': {'latency_seconds': 0.11, 'queries': 2, 'peak_memory_bytes': 1100}}}
+        slow = {'1000': {'home_page': {'latency_seconds': 0.2, 'queries': 3, 'peak_memory_bytes': 1000}}}
+        self.assertEqual(find_regressions(ok, baseline, 0.25), [])
+        self.assertEqual(len(find_regressions(slow, baseline, 0.25)), 2)
+
+
+class SQLiteConcurrencyTests(SimpleTestCase):
+    """
+    Uses two independent connections to a file database configured like
+    DATABASES['default'] to check that readers are not blocked by a writer.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        settings_dict = {**connection.settings_dict, 'NAME': os.path.join(self.tmpdir.name, 'db.sqlite3')}
+        # Fail fast instead of waiting out the busy timeout.
+        settings_dict['OPTIONS'] = {**settings_dict['OPTIONS'], 'timeout': 0.2}
+        self.writer = SQLiteDatabaseWrapper(settings_dict, alias='writer')
+        self.reader = SQLiteDatabaseWrapper(settings_dict, alias='reader')
+        with self.writer.cursor() as cursor:
+            cursor.execute('CREATE TABLE customer (id INTEGER PRIMARY KEY, name TEXT)')
+            cursor.execute("INSERT INTO customer (name) VALUES ('existing')")
+
+    def tearDown(self):
+        self.writer.close()
+        self.reader.close()
+        self.tmpdir.cleanup()
+
+    def count(self):
+        with self.reader.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM customer')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied(self):
+        with self.reader.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_reads_proceed_while_import_is_writing(self):
+        with self.writer.cursor() as cursor:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.executemany('INSERT INTO customer (name) VALUES (%s)', [(f'new {i}',) for i in range(500)])
+            # Uncommitted rows are invisible, but the read is not blocked.
+            self.assertEqual(self.count(), 1)
+            cursor.execute('COMMIT')
+        self.assertEqual(self.count(), 501)
+
+    def test_import_commits_while_a_reader_is_open(self):
+        with self.reader.cursor() as reader:
+            reader.execute('BEGIN')
+            reader.execute('SELECT COUNT(*) FROM customer')
+            with self.writer.cursor() as cursor:
+                cursor.execute("INSERT INTO customer (name) VALUES ('new')")
+            # The open read transaction keeps its snapshot until it ends.
+            reader.execute('SELECT COUNT(*) FROM customer')
+            self.assertEqual(reader.fetchone()[0], 1)
+            reader.execute('COMMIT')
+        self.assertEqual(self.count(), 2)
+
+
+class CustomerSummaryTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(6))})
+
+    def assertSummaryMatches(self):
+        summary = [summary_record(row) for row in CustomerSummary.objects.order_by('pk').values_list(*SUMMARY_FIELDS)]
+        joined = [profile_record(user) for user in UserProfile.objects.order_by('pk').with_primary_address()]
+        self.assertEqual(summary, joined)
+
+    def test_follows_saves_bulk_updates_and_deletes(self):
+        self.assertSummaryMatches()
+        profile = UserProfile.objects.get(Number='ACC-1')
+        Address.objects.create(
+            user=profile, AddressName='Depot', Address='2 Depot Rd', City='Shelbyville', State='IL', Zip='1',
+            Country='US', AddressContact='Ned',
+        )
+        self.assertSummaryMatches()
+
+        Address.objects.filter(user=profile).update(IsDefault=False)
+        self.assertEqual(CustomerSummary.objects.get(pk=profile.pk).Address, '1 Main St')
+        Address.objects.filter(user=profile, AddressName='Depot').update(IsDefault=True)
+        self.assertEqual(CustomerSummary.objects.get(pk=profile.pk).City, 'Shelbyville')
+
+        UserProfile.objects.filter(Number__in=['ACC-2', 'ACC-3']).update(Name='Renamed', Mobile=None)
+        Address.objects.filter(user__Number='ACC-4').delete()
+        UserProfile.objects.filter(Number='ACC-5').delete()
+        self.assertSummaryMatches()
+        self.assertEqual(CustomerSummary.objects.count(), 5)
+
+    def test_rebuild_command(self):
+        uninstall_summary()
+        UserProfile.objects.update(Name='Stale')
+        self.assertFalse(CustomerSummary.objects.filter(LocationName='Stale').exists())
+
+        call_command('rebuild_customer_summary', stdout=io.StringIO())
+        self.assertSummaryMatches()
+        UserProfile.objects.update(Name='Fresh')
+        self.assertSummaryMatches()
+
+    def test_migrate_leaves_the_summary_alone(self):
+        with mock.patch('main_app.summary.rebuild_summary') as rebuild:
+            call_command('migrate', verbosity=0)
+        rebuild.assert_not_called()
+        self.assertTrue(summary_available())
+
+        # Triggers a migration left missing are recreated, with a rebuild.
+        uninstall_summary()
+        UserProfile.objects.update(Name='Stale')
+        call_command('migrate', verbosity=0)
+        self.assertTrue(summary_available())
+        self.assertSummaryMatches()
+
+    def test_listing_reads_summary_without_joins(self):
+        with CaptureQueriesContext(connection) as captured:
+            page = self.client.get(reverse('customers_api'), {'page_size': 10}).json()
+        self.assertEqual(len(captured), 2)
+        self.assertIn(CacheVersion._meta.db_table, captured[0]['sql'])
+        self.assertNotIn('JOIN', captured[1]['sql'])
+        self.assertIn(CustomerSummary._meta.db_table, captured[1]['sql'])
+        self.assertEqual(page['results'][0]['LocationName'], 'Customer 0')
+        self.assertEqual(self.client.get(reverse('customers_api'), {'q': 'Customer 3'}).json()['results'][0]['Address'], '3 Main St')
+
+    def test_listing_joins_when_triggers_are_missing(self):
+        self.assertTrue(summary_available())
+        uninstall_summary()
+        self.assertFalse(summary_available())
+        # Without its triggers the summary table goes stale.
+        UserProfile.objects.filter(Number='ACC-0').update(Name='Renamed')
+        page = self.client.get(reverse('customers_api'), {'page_size': 10}).json()
+        self.assertEqual(page['results'][0]['LocationName'], 'Renamed')
+        self.assertEqual(self.client.get(reverse('customers_api'), {'q': 'Renamed'}).json()['results'][0]['LocationName'], 'Renamed')
+
+        call_command('rebuild_customer_summary', stdout=io.StringIO())
+        self.assertTrue(summary_available())
+        self.assertSummaryMatches()
+
+    def test_search_pages_follow_the_cursor(self):
+        seen, after = [], None
+        while True:
+            params = {'q': 'customer', 'page_size': 4}
+            if after is not None:
+                params['after'] = after
+            page = self.client.get(reverse('customers_api'), params).json()
+            seen += [record['id'] for record in page['results']]
+            after = page['next_cursor']
+            self.assertEqual(page['has_more'], after is not None)
+            if after is None:
+                break
+        self.assertEqual(sorted(seen), sorted(UserProfile.objects.values_list('pk', flat=True)))
+        self.assertEqual(len(seen), 6)
+
+
+class ListingCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(3))})
+
+    def test_repeated_loads_only_read_the_version(self):
+        self.client.get(reverse('customers_api'))
+        with self.assertNumQueries(2):
+            self.client.get(reverse('customers_api'))
+            self.client.get(reverse('customers_api'))
+
+    def test_saves_and_deletes_invalidate(self):
+        first = self.client.get(reverse('customers_api')).json()['results'][0]
+        profile = UserProfile.objects.get(pk=first['id'])
+        profile.Name = 'Renamed'
+        profile.save()
+        self.assertEqual(self.client.get(reverse('customers_api')).json()['results'][0]['LocationName'], 'Renamed')
+
+        profile.primary_address.delete()
+        self.assertEqual(self.client.get(reverse('customers_api')).json()['results'][0]['Address'], '')
+
+    def test_bulk_import_invalidates(self):
+        self.client.get(reverse('customers_api'), {'page_size': 10})
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(2, start=3))})
+        self.assertEqual(len(self.client.get(reverse('customers_api'), {'page_size': 10}).json()['results']), 5)
+
+    def test_writes_from_another_process_invalidate(self):
+        first = self.client.get(reverse('customers_api')).json()['results'][0]
+        version = listing_version()
+        # A job worker or another web worker, with a cache of its own.
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'other-process',
+        }}):
+            UserProfile.objects.filter(pk=first['id']).update(Name='Renamed elsewhere')
+            bump_listing_version()
+        self.assertEqual(listing_version(), version + 1)
+        self.assertEqual(self.client.get(reverse('customers_api')).json()['results'][0]['LocationName'], 'Renamed elsewhere')
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(3))})
+
+    def test_export_returns_304_until_data_changes(self):
+        response = self.client.get(reverse('export_csv'))
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        self.assertEqual(self.client.get(reverse('export_csv'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(reverse('export_csv'), HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        Address.objects.first().delete()
+        response = self.client.get(reverse('export_csv'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        UserProfile.objects.update(Name='Bulk renamed', updated_at=timezone.now() + timedelta(seconds=1))
+        response = self.client.get(reverse('export_csv'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        # A queryset update that leaves updated_at alone still shows up.
+        Address.objects.update(IsDefault=False)
+        self.assertEqual(self.client.get(reverse('export_csv'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_data_state_reads_indexes_only(self):
+        change_log_available()
+        with CaptureQueriesContext(connection) as captured:
+            customer_data_state()
+        self.assertEqual(len(captured), 2)
+        self.assertNotIn('COUNT', ' '.join(query['sql'] for query in captured))
+
+        # Without the change log: the newest updated_at of each model.
+        uninstall_change_log()
+        self.addCleanup(install_change_log)
+        with CaptureQueriesContext(connection) as captured:
+            state = customer_data_state()
+        self.assertEqual(len(captured), 4)
+        self.assertEqual(
+            state['last_modified'],
+            max(model.objects.latest('updated_at').updated_at for model in (UserProfile, Address, ShippingAndTax)),
+        )
+
+    def test_etag_differs_per_export_variant(self):
+        etag = self.client.get(reverse('export_csv'))['ETag']
+        for params in ({'format': 'ndjson'}, {'target': 'zoho'}, {'compress': 'gzip'}):
+            response = self.client.get(reverse('export_csv'), params, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, params)
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(
+                self.client.get(reverse('export_csv'), params, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304
+            )
+        self.assertEqual(self.client.get(reverse('export_csv'), {'format': 'nope'}, HTTP_IF_NONE_MATCH=etag).status_code, 400)
+
+    def test_upsert_touches_updated_at(self):
+        before = dict(UserProfile.objects.values_list('Number', 'updated_at'))
+        content = make_csv(3).decode('utf-8').replace('Customer 1', 'Customer One').encode('utf-8')
+        self.client.post(reverse('import_csv'), {'csv_file': upload(content), 'mode': 'upsert'})
+        self.assertGreater(UserProfile.objects.get(Number='ACC-1').updated_at, before['ACC-1'])
+        self.assertEqual(UserProfile.objects.get(Number='ACC-2').updated_at, before['ACC-2'])
+
+    def test_listing_api_etag(self):
+        etag = self.client.get(reverse('customers_api'))['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('customers_api'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+class ChangeFeedTests(TestCase):
+
+    def setUp(self):
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(4))})
+
+    def feed(self, since=None):
+        params = {'since': since} if since else {}
+        response = self.client.get(reverse('customer_changes_api'), params)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_full_sync_then_only_changes(self):
+        feed = self.feed()
+        self.assertEqual([c['number'] for c in feed['changes']], ['ACC-0', 'ACC-1', 'ACC-2', 'ACC-3'])
+        self.assertEqual(feed['changes'][0]['record']['Name'], 'Customer 0')
+        self.assertEqual(self.feed(feed['cursor'])['changes'], [])
+
+        renamed = UserProfile.objects.get(Number='ACC-0')
+        renamed.Name = 'Renamed'
+        renamed.save()
+        Address.objects.get(user__Number='ACC-1').delete()
+        UserProfile.objects.get(Number='ACC-2').delete()
+
+        delta = self.feed(feed['cursor'])
+        self.assertEqual(
+            [(c['op'], c['number']) for c in delta['changes']],
+            [('upsert', 'ACC-0'), ('upsert', 'ACC-1'), ('delete', 'ACC-2')],
+        )
+        self.assertEqual(delta['changes'][0]['record']['Name'], 'Renamed')
+        self.assertEqual(delta['changes'][1]['record']['City'], '')
+        self.assertEqual(self.feed(delta['cursor'])['changes'], [])
+
+    def test_deletes_leave_tombstones(self):
+        profile = UserProfile.objects.get(Number='ACC-3')
+        pk = profile.pk
+        profile.delete()
+        self.assertEqual(
+            sorted(Tombstone.objects.filter(customer_id=pk).values_list('model', flat=True)),
+            ['address', 'shippingandtax', 'userprofile'],
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('customer_changes_api'), {'since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_write_stamped_before_the_cursor_is_not_missed(self):
+        cursor = self.feed()['cursor']
+        # A writer that took its timestamp earlier but committed after the
+        # read, like a save waiting out another writer's lock.
+        stamped = timezone.now() - timedelta(minutes=5)
+        UserProfile.objects.filter(Number='ACC-3').update(Name='Late', updated_at=stamped)
+        delta = self.feed(cursor)
+        self.assertEqual([(c['number'], c['record']['Name']) for c in delta['changes']], [('ACC-3', 'Late')])
+        self.assertEqual(self.feed(delta['cursor'])['changes'], [])
+
+    def test_timestamp_cursor_moves_to_the_change_log(self):
+        since = format_cursor(timezone.now())
+        UserProfile.objects.get(Number='ACC-1').delete()
+        delta = self.feed(since)
+        self.assertEqual([(c['op'], c['number']) for c in delta['changes']], [('delete', 'ACC-1')])
+        self.assertTrue(delta['cursor'].isdigit())
+        self.assertEqual(self.feed(delta['cursor'])['changes'], [])
+
+    def test_pruned_cursors_must_sync_again(self):
+        old_cursor = self.feed()['cursor']
+        UserProfile.objects.get(Number='ACC-2').delete()
+        self.assertEqual(len(self.feed(old_cursor)['changes']), 1)
+        long_ago = timezone.now() - timedelta(days=settings.CHANGE_FEED_RETENTION_DAYS + 1)
+        CustomerChange.objects.update(changed_at=long_ago)
+        Tombstone.objects.update(deleted_at=long_ago)
+
+        out = io.StringIO()
+        call_command('prune_change_feed', stdout=out)
+        self.assertIn('Deleted 3 tombstones', out.getvalue())
+        self.assertFalse(Tombstone.objects.exists())
+        # The newest log row stays.
+        self.assertEqual(CustomerChange.objects.count(), 1)
+
+        response = self.client.get(reverse('customer_changes_api'), {'since': old_cursor})
+        self.assertEqual(response.status_code, 410)
+        response = self.client.get(reverse('customer_changes_api'), {'since': format_cursor(long_ago)})
+        self.assertEqual(response.status_code, 410)
+        cursor = self.feed()['cursor']
+        UserProfile.objects.filter(Number='ACC-0').update(Name='After pruning')
+        self.assertEqual([c['number'] for c in self.feed(cursor)['changes']], ['ACC-0'])
+
+    def test_migrate_keeps_the_change_log(self):
+        cursor = self.feed()['cursor']
+        call_command('migrate', verbosity=0)
+        self.assertTrue(change_log_available())
+        UserProfile.objects.filter(Number='ACC-0').update(Name='After migrate')
+        self.assertEqual([c['number'] for c in self.feed(cursor)['changes']], ['ACC-0'])
+
+    def test_recreated_triggers_expire_cursors(self):
+        cursor = self.feed()['cursor']
+        uninstall_change_log()
+        self.addCleanup(install_change_log)
+        # Never logged: the triggers are missing.
+        UserProfile.objects.filter(Number='ACC-1').update(Name='Unlogged')
+        call_command('migrate', verbosity=0)
+        self.assertTrue(change_log_available())
+        response = self.client.get(reverse('customer_changes_api'), {'since': cursor})
+        self.assertEqual(response.status_code, 410)
+        UserProfile.objects.filter(Number='ACC-0').update(Name='After resync')
+        response = self.client.get(reverse('customer_changes_api'), {'since': cursor})
+        self.assertEqual(response.status_code, 410)
+        cursor = self.feed()['cursor']
+        self.assertEqual(self.feed(cursor)['changes'], [])
+
+    def test_delta_queries_use_indexes(self):
+        since = timezone.now()
+        for model in (UserProfile, Address, ShippingAndTax):
+            plan = model.objects.filter(updated_at__gt=since).values_list('pk').explain()
+            self.assertIn(f'INDEX main_app_{model._meta.model_name}_updated_at', plan, plan)
+        plan = Tombstone.objects.filter(deleted_at__gt=since).explain()
+        self.assertIn('INDEX main_app_tombstone_deleted_at', plan, plan)
+
+
+@override_settings(ROOT_URLCONF='main_app.async_urls')
+class AsyncViewTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        registry.reset()
+        self.client.post(reverse('import_csv'), {'csv_file': upload(make_csv(3))})
+        # Trigger checks are kept per connection; keep them out of the counts.
+        summary_available(), change_log_available()
+
+    async def read(self, response):
+        return b''.join([chunk async for chunk in response.streaming_content])
+
+    async def test_home_page(self):
+        response = await self.async_client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, '555-0002')
+
+    async def test_export_streams_same_csv(self):
+        response = await self.async_client.get(reverse('export_csv'))
+        self.assertTrue(response.is_async)
+        body = await self.read(response)
+        self.assertEqual(body.decode('utf-8'), await sync_to_async(lambda: ''.join(iter_export()))())
+
+        response = await self.async_client.get(reverse('export_csv'), {'compress': 'gzip', 'format': 'ndjson'})
+        lines = gzip.decompress(await self.read(response)).decode('utf-8').splitlines()
+        self.assertEqual([json.loads(line)['Account Number'] for line in lines], ['ACC-0', 'ACC-1', 'ACC-2'])
+
+    async def test_export_returns_304(self):
+        etag = (await self.async_client.get(reverse('export_csv')))['ETag']
+        response = await self.async_client.get(reverse('export_csv'), headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        response = await self.async_client.get(reverse('export_csv'), {'format': 'ndjson'}, headers={'if-none-match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    async def test_form_post_and_import(self):
+        response = await self.async_client.post(
+            reverse('home'), batch_record(7), headers={'x-requested-with': 'XMLHttpRequest'}
+        )
+        self.assertEqual(response.status_code, 201)
+
+        response = await self.async_client.post(reverse('import_csv'), {'csv_file': upload(make_csv(2, start=10))})
+        self.assertEqual(json.loads(response.content)['imported'], 2)
+        self.assertEqual(await UserProfile.objects.acount(), 6)
+
+    async def test_metrics_count_async_queries(self):
+        await self.read(await self.async_client.get(reverse('export_csv')))
+        body = registry.render_prometheus()
+        self.assertIn('main_app_sql_queries{view="export_csv",quantile="0.99"} 4', body)
+
+
+class DuplicateDetectionTests(TestCase):
+
+    def import_csv(self, content, mode='insert'):
+        return self.client.post(reverse('import_csv'), {'csv_file': upload(content), 'mode': mode}).json()
+
+    def test_normalizers(self):
+        for name, code in [('Robert', 'R163'), ('Rupert', 'R163'), ('Ashcraft', 'A261'), ('Tymczak', 'T522'),
+                           ('Pfister', 'P236'), ('  ', '')]:
+            self.assertEqual(soundex(name), code)
+        self.assertEqual(normalize_email(' Jo@Example.COM '), 'jo@example.com')
+        self.assertEqual(normalize_email('n/a'), '')
+        self.assertEqual(normalize_phone('+1 (217) 555-0100'), '2175550100')
+        self.assertEqual(normalize_phone('x12'), '')
+        self.assertEqual(normalize_zip('62701-1234'), '62701')
+        self.assertEqual(name_zip_key('Smith Supply', '62701'), name_zip_key('Smyth Supply', '62701 '))
+        self.assertEqual(name_zip_key('Smith Supply', ''), '')
+        self.assertNotEqual(name_zip_key('Store 12', '62701'), name_zip_key('Store 14', '62701'))
+
+    def test_import_flags_stored_and_in_file_duplicates(self):
+        self.import_csv(make_csv(3))
+        content = make_csv(2, start=10).decode('utf-8')
+        # Row 1 repeats a stored email, row 2 a phone number from row 1.
+        content = content.replace('customer10@example.com', 'CUSTOMER1@example.com')
+        content = content.replace('555-0011', '(555) 0010')
+        data = self.import_csv(content.encode('utf-8'))
+
+        self.assertEqual(data['imported'], 2)
+        self.assertEqual(data['duplicates'], 2)
+        self.assertIn('2 possible duplicates flagged', data['message'])
+        first, second = data['possible_duplicates']
+        stored = UserProfile.objects.get(Number='ACC-1')
+        self.assertEqual(first['matches'], [{'id': stored.pk, 'number': 'ACC-1', 'name': 'Customer 1', 'on': ['email']}])
+        self.assertEqual(second['matches'], [{'row': 1, 'number': 'ACC-10', 'name': 'Customer 10', 'on': ['phone']}])
+
+    def test_upsert_of_the_same_account_is_not_a_duplicate(self):
+        self.import_csv(make_csv(3))
+        data = self.import_csv(make_csv(3), mode='upsert')
+        self.assertEqual(data['duplicates'], 0)
+
+    def test_saves_keep_keys_current(self):
+        self.import_csv(make_csv(1))
+        profile = UserProfile.objects.get()
+        self.assertEqual(
+            (profile.email_key, profile.phone_key, profile.name_zip_key),
+            ('customer0@example.com', '5550000', 'C2350:62701'),
+        )
+        profile.Name, profile.Mobile = 'Kustomer Zero', '555-123-4567'
+        profile.save()
+        address = profile.primary_address
+        address.Zip = '62702-0001'
+        address.save()
+
+        profile.refresh_from_db()
+        self.assertEqual(profile.phone_key, '5551234567')
+        self.assertEqual(profile.name_zip_key, name_zip_key('Kustomer Zero', '62702'))
+
+    def test_address_saves_only_recompute_key_when_needed(self):
+        self.import_csv(make_csv(1))
+        profile = UserProfile.objects.get()
+        address = Address.objects.get(user=profile)
+        address.City = 'Chicago'
+        # The address update and the listing version bump; the profile is
+        # neither loaded nor updated.
+        with self.assertNumQueries(2):
+            address.save()
+
+        other = Address.objects.create(
+            user_id=profile.pk, AddressName='Branch', Address='1 Side St', City='Peoria', State='IL',
+            Zip='61602', Country='US',
+        )
+        profile.refresh_from_db()
+        self.assertEqual(profile.name_zip_key, 'C2350:62701')
+
+        Address.objects.filter(user=profile).update(IsDefault=False)
+        other.IsDefault = True
+        other.save()
+        profile.refresh_from_db()
+        self.assertEqual(profile.name_zip_key, 'C2350:61602')
+
+    def test_clusters_and_command(self):
+        self.import_csv(make_csv(5))
+        UserProfile.objects.filter(Number__in=['ACC-0', 'ACC-1']).update(email_key='shared@example.com')
+        UserProfile.objects.filter(Number__in=['ACC-1', 'ACC-2']).update(phone_key='5550000000')
+        ids = sorted(UserProfile.objects.filter(Number__in=['ACC-0', 'ACC-1', 'ACC-2']).values_list('pk', flat=True))
+        self.assertEqual(duplicate_clusters(), [{'ids': ids, 'on': ['email', 'phone']}])
+
+        out = io.StringIO()
+        call_command('find_duplicates', '--json', stdout=out)
+        self.assertEqual([c['Number'] for c in json.loads(out.getvalue())[0]['customers']], ['ACC-0', 'ACC-1', 'ACC-2'])
+
+        # --refresh-keys recomputes the keys from the stored fields.
+        call_command('find_duplicates', '--refresh-keys', stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertEqual(duplicate_clusters(), [])
+
+    def test_lookups_use_key_indexes(self):
+        for field in ('email_key', 'phone_key', 'name_zip_key'):
+            sql, params = UserProfile.objects.filter(**{f'{field}__in': ['a', 'b']}).values('pk').query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+            self.assertIn('USING', plan)
+            self.assertIn(field, plan)
+
+
+def fail_on_call(target, n, exception=KeyboardInterrupt):
+    """
+    Patches `target` so that its `n`th call does its work and then raises:
+    an import dying before its chunk commits.
+    """
+    original, calls = pkgutil.resolve_name(target), []
+
+    def side_effect(*args, **kwargs):
+        calls.append(original(*args, **kwargs))
+        if len(calls) == n:
+            raise exception
+        return calls[-1]
+    return mock.patch(target, autospec=True, side_effect=side_effect)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class ResumableImportTests(TestCase):
+
+    def import_csv(self, content, **extra):
+        return self.client.post(reverse('import_csv'), {'csv_file': upload(content), 'chunk_size': 3, **extra})
+
+    def test_interrupted_import_resumes_after_last_committed_chunk(self):
+        bad_row = make_csv(3, start=7).split(b'\r\n', 1)[1].replace(b'100.00', b'oops', 1)
+        content = make_csv(7) + bad_row
+        with fail_on_call('main_app.importers.write_chunk', 3), self.assertRaises(KeyboardInterrupt):
+            self.import_csv(content)
+        # The third chunk died before its commit, and its checkpoint with it.
+        self.assertEqual(UserProfile.objects.count(), 6)
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.rows_done, checkpoint.completed_at), (6, None))
+        self.assertIn('ACC-6', next(csv.reader(io.StringIO(content[checkpoint.byte_offset:].decode()))))
+
+        with mock.patch('main_app.importers.build_customer', wraps=build_customer) as built:
+            data = self.import_csv(content).json()
+        self.assertEqual(built.call_count, 3)
+        self.assertEqual((data['resumed_from_row'], data['imported'], data['failed']), (6, 9, 1))
+        self.assertEqual(data['errors'][0]['row'], 8)
+        self.assertIn('Resumed after row 6.', data['message'])
+        self.assertEqual(UserProfile.objects.filter(Number__startswith='ACC-').values('Number').distinct().count(), 9)
+        self.assertIsNotNone(ImportCheckpoint.objects.get().completed_at)
+
+    def test_finished_file_imports_again_and_restart_ignores_checkpoint(self):
+        self.import_csv(make_csv(4), mode='upsert')
+        data = self.import_csv(make_csv(4), mode='upsert').json()
+        self.assertEqual((data['resumed_from_row'], data['unchanged']), (0, 4))
+
+        with fail_on_call('main_app.importers.write_chunk', 2), self.assertRaises(KeyboardInterrupt):
+            self.import_csv(make_csv(7), mode='upsert')
+        data = self.import_csv(make_csv(7), mode='upsert', restart='1').json()
+        self.assertEqual((data['resumed_from_row'], data['created'], data['unchanged']), (0, 3, 4))
+
+    def test_database_errors_abort_instead_of_failing_rows(self):
+        content = make_csv(7)
+        with fail_on_call('main_app.importers.write_chunk', 2, OperationalError('database is locked')):
+            with self.assertRaises(OperationalError):
+                import_csv_resumable(upload(content), chunk_size=3)
+        # The locked chunk is neither written nor skipped by the checkpoint.
+        self.assertEqual(UserProfile.objects.count(), 3)
+        self.assertEqual(ImportCheckpoint.objects.get().rows_done, 3)
+
+        result = import_csv_resumable(upload(content), chunk_size=3)
+        self.assertEqual((result['resumed_from_row'], result['imported'], result['failed']), (3, 7, 0))
+
+        with mock.patch('main_app.importers.find_duplicates', side_effect=RuntimeError('bug')):
+            with self.assertRaises(RuntimeError):
+                import_csv_resumable(upload(make_csv(2, start=20)), chunk_size=3)
+
+    def test_concurrent_import_of_the_same_file_conflicts(self):
+        def other_import_commits(imported, failed):
+            ImportCheckpoint.objects.update(rows_done=F('rows_done') + 3)
+
+        with self.assertRaises(ImportConflict):
+            import_csv_resumable(upload(make_csv(6)), chunk_size=3, on_chunk=other_import_commits)
+        self.assertEqual(UserProfile.objects.count(), 3)
+
+        with mock.patch('main_app.views.import_csv_resumable', side_effect=ImportConflict('busy')):
+            self.assertEqual(self.import_csv(make_csv(6)).status_code, 409)
+
+    def test_retried_import_job_resumes(self):
+        response = self.client.post(reverse('enqueue_import_job'), {'csv_file': upload(make_csv(7)), 'chunk_size': 3})
+        job_id = response.json()['job']['id']
+        claim_job(job_id)
+        with fail_on_call('main_app.checkpoints.ResumableImport.advance', 2, OperationalError('disk I/O error')):
+            self.assertEqual(run_job(job_id), Job.FAILED)
+        self.assertEqual(UserProfile.objects.count(), 3)
+
+        response = self.client.post(reverse('retry_import_job', args=[job_id]))
+        self.assertEqual(response.json()['job']['status'], Job.PENDING)
+        claim_job(job_id)
+        self.assertEqual(run_job(job_id), Job.DONE)
+        job = Job.objects.get(pk=job_id)
+        self.assertEqual((job.result['resumed_from_row'], job.result['imported'], job.processed_rows), (3, 7, 7))
+        self.assertEqual(UserProfile.objects.count(), 7)
+        self.assertEqual(self.client.post(reverse('retry_import_job', args=[job_id])).status_code, 409)
+
+
+# Runs import_customers and SIGKILLs the process once chunk N is written
+# but not committed.
+KILL_DURING_CHUNK = """
+import os, signal, sys
+from unittest import mock
+import django
+django.setup()
+from django.core.management import call_command
+from main_app import importers
+write_chunk, chunks = importers.write_chunk, []
+def write_then_die(*args, **kwargs):
+    chunks.append(write_chunk(*args, **kwargs))
+    if len(chunks) == int(sys.argv[2]):
+        os.kill(os.getpid(), signal.SIGKILL)
+    return chunks[-1]
+with mock.patch.object(importers, 'write_chunk', write_then_die):
+    call_command('import_customers', sys.argv[1], chunk_size=10)
+"""
+
+
+@skipUnless(hasattr(signal, 'SIGKILL'), 'needs SIGKILL')
+class KilledImportTests(SimpleTestCase):
+    """
+    Kills a real import process in the middle of a chunk, then resumes it
+    with the import_customers command, on a file database.
+    """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmpdir.name, 'db.sqlite3')
+        self.csv_path = os.path.join(self.tmpdir.name, 'customers.csv')
+        with open(self.csv_path, 'wb') as f:
+            f.write(make_csv(50))
+        self.env = {**os.environ, 'SQLITE_PATH': self.db_path, 'DJANGO_SETTINGS_MODULE': 'ecom.settings'}
+        self.run_python('manage.py', 'migrate', '-v0')
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_python(self, *args):
+        return subprocess.run(
+            [sys.executable, *args], cwd=settings.BASE_DIR, env=self.env, capture_output=True, text=True,
+        )
+
+    def query(self, sql):
+        with sqlite3.connect(self.db_path) as db:
+            return db.execute(sql).fetchone()
+
+    def test_killed_import_resumes(self):
+        killed = self.run_python('-c', KILL_DURING_CHUNK, self.csv_path, '3')
+        self.assertEqual(killed.returncode, -signal.SIGKILL, killed.stderr)
+        self.assertEqual(self.query('SELECT COUNT(*) FROM main_app_userprofile'), (20,))
+        self.assertEqual(self.query('SELECT rows_done FROM main_app_importcheckpoint'), (20,))
+
+        resumed = self.run_python('manage.py', 'import_customers', self.csv_path, '--chunk-size', '10')
+        self.assertEqual(resumed.returncode, 0, resumed.stderr)
+        self.assertIn('Resumed after row 20.', resumed.stdout)
+        self.assertEqual(self.query('SELECT COUNT(*), COUNT(DISTINCT Number) FROM main_app_userprofile'), (50, 50))
@@ -5,4 +5,13 @@ urlpatterns = [
     path('', views.home_page, name='home'),
     path('export_csv/', views.export_users_csv, name='export_csv'),
     path('import_csv/', views.import_users_csv, name='import_csv'),
+    path('api/customers/', views.customers_api, name='customers_api'),
+    path('api/customers/batch/', views.customers_batch_api, name='customers_batch_api'),
+    path('api/customers/changes/', views.customer_changes_api, name='customer_changes_api'),
+    path('jobs/import/', views.enqueue_import_job, name='enqueue_import_job'),
+    path('jobs/export/', views.enqueue_export_job, name='enqueue_export_job'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/retry/', views.retry_import_job, name='retry_import_job'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
+    path('metrics/', views.metrics_view, name='metrics'),
 ]
@@ -0,0 +1,126 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+
+from .forms import UnifiedUserForm
+
+# Export column -> UnifiedUserForm field, so imported rows are checked with
+# exactly the rules of the interactive form.
+CSV_FORM_FIELDS = {
+    'Name': 'Name',
+    'Group': 'Group',
+    'Account Number': 'Number',
+    'Mobile': 'Mobile',
+    'Email': 'Email',
+    'Status': 'Status',
+    'Credit Limit': 'CreditLimit',
+    'Payment Terms': 'PaymentTerms',
+    'Salesman': 'Salesman',
+    'Priority': 'DefaultPriority',
+    'Alert Notes': 'AlertNotes',
+    'Address Name': 'AddressName',
+    'Address Contact': 'AddressContact',
+    'Address Type': 'AddressType',
+    'Address': 'Address',
+    'City': 'City',
+    'State': 'State',
+    'Zip': 'Zip',
+    'Country': 'Country',
+    'Tax Rate': 'TaxRate',
+    'Tax Exempt': 'TaxExempt',
+    'Tax Exempt Number': 'TaxExemptNumber',
+    'URL': 'URL',
+    'Carrier': 'CarrierName',
+    'Shipping Terms': 'ShippingTerms',
+    'Is Default': 'IsDefault',
+    'Active': 'Active',
+}
+
+# Rows per task sent to a worker process.
+DEFAULT_BATCH_SIZE = 250
+
+# Below this many rows per chunk, validating in-process beats the cost of
+# starting and feeding the pool.
+PARALLEL_THRESHOLD = 1000
+
+
+def row_errors(row):
+    """
+    Runs one CSV row through UnifiedUserForm. Returns None if it is valid,
+    else a dict of field name -> list of messages.
+    """
+    data = {field: row.get(column) or '' for column, field in CSV_FORM_FIELDS.items()}
+    form = UnifiedUserForm(data)
+    if form.is_valid():
+        return None
+    return {field: [str(e) for e in errors] for field, errors in form.errors.items()}
+
+
+def validate_batch(numbered_rows):
+    """
+    Validates (row_number, row) pairs; returns (row_number, errors) for the
+    invalid ones only. Runs inside worker processes.
+    """
+    invalid = []
+    for row_number, row in numbered_rows:
+        errors = row_errors(row)
+        if errors:
+            invalid.append((row_number, errors))
+    return invalid
+
+
+def error_entry(row_number, errors):
+    message = '; '.join(f"{field}: {' '.join(messages)}" for field, messages in errors.items())
+    return {'row': row_number, 'message': message, 'errors': errors}
+
+
+class RowValidator:
+    """
+    Validates import chunks with UnifiedUserForm, spreading large chunks
+    over a process pool in batches. Use as a context manager so the pool
+    (started on first need) is shut down with the import.
+    """
+
+    def __init__(self, workers=None, batch_size=None):
+        self.workers = workers or getattr(settings, 'IMPORT_VALIDATION_WORKERS', None) or multiprocessing.cpu_count()
+        self.batch_size = batch_size or getattr(settings, 'IMPORT_VALIDATION_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def _batches(self, numbered_rows):
+        for start in range(0, len(numbered_rows), self.batch_size):
+            yield numbered_rows[start:start + self.batch_size]
+
+    def __call__(self, numbered_rows):
+        """
+        Splits a chunk of (row_number, row) pairs into the valid pairs and
+        error entries for the invalid ones.
+        """
+        if self.workers > 1 and len(numbered_rows) >= PARALLEL_THRESHOLD:
+            if self.pool is None:
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=django.setup,
+                )
+            invalid = [item for batch in self.pool.map(validate_batch, self._batches(numbered_rows)) for item in batch]
+        else:
+            invalid = validate_batch(numbered_rows)
+
+        if not invalid:
+            return numbered_rows, []
+        bad_rows = {row_number for row_number, _ in invalid}
+        valid = [pair for pair in numbered_rows if pair[0] not in bad_rows]
+        return valid, [error_entry(row_number, errors) for row_number, errors in invalid]
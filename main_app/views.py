@@ -1,16 +1,161 @@
+import hmac
 import json
-import csv
-import io
-from django.http import HttpResponse, JsonResponse
-from django.shortcuts import render
+from functools import wraps
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
 from django.db import IntegrityError
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from .changes import (
+    CursorExpired, customer_data_last_modified, iter_change_feed_json, parse_cursor, read_changes, variant_etag,
+)
 from .forms import UnifiedUserForm
-from .models import UserProfile, Address, ShippingAndTax
+from .models import Job
+from .checkpoints import ImportConflict, import_csv_resumable
+from .importers import IMPORT_MODES, INSERT, UPSERT
+from .jobs import retry_job
+from .exporters import EXPORT_FORMATS, EXPORT_TARGETS, export_filename, get_format, get_target, iter_export
+from .listing import cached_customer_page_json, parse_page_size, search_page
+from .metrics import registry
+from .services import create_customer, create_customers_batch, DUPLICATE_NUMBER_MESSAGE
 
 # --- Helper: Convert form errors to JSON ---
 def get_form_errors_json(form_errors):
     return {field: [str(e) for e in errors] for field, errors in form_errors.items()}
 
+# --- Helper: Export target, format and compression from a query ---
+def parse_export_options(params):
+    try:
+        target = get_target(params.get('target') or 'csv')
+    except KeyError:
+        return None, 'Unknown export target.'
+    try:
+        export_format = get_format(params.get('format') or 'csv')
+    except KeyError:
+        return None, 'Unknown export format.'
+    if not export_format.available:
+        return None, f'{export_format.label} export needs pyarrow installed; use format=ndjson instead.'
+    compress = params.get('compress') or ''
+    if compress not in ('', 'gzip'):
+        return None, 'Unknown compression.'
+    return (target, export_format, compress == 'gzip'), None
+
+# --- Helper: Validators of an export, which differ per target, format and compression ---
+def export_etag(request, *args, **kwargs):
+    options, error = parse_export_options(request.GET)
+    if error:
+        return None
+    target, export_format, compress = options
+    return variant_etag(request, target.name, export_format.name, compress)
+
+
+def export_last_modified(request, *args, **kwargs):
+    # No validators for a request that gets a 400 anyway.
+    options, error = parse_export_options(request.GET)
+    return None if error else customer_data_last_modified(request)
+
+# --- Helper: JSON responses of the customer form POST ---
+def customer_saved_json(user_profile, address_record):
+    return JsonResponse({
+        'success': True,
+        'message': f'Customer "{user_profile.Name}" saved successfully.',
+        'new_record': {
+            'id': user_profile.pk,
+            'LocationName': user_profile.Name,
+            'Address': address_record.Address,
+            'City': address_record.City,
+            'State': address_record.State,
+            'Zip': address_record.Zip,
+            'ContactPerson': address_record.AddressContact,
+            'Phone': user_profile.Mobile,
+            'Email': user_profile.Email,
+        }
+    }, status=201)
+
+
+def customer_save_error_json(e):
+    if isinstance(e, IntegrityError):
+        error_message = f"Database error: {e}"
+        if 'unique constraint' in str(e).lower() and 'number' in str(e).lower():
+            error_message = DUPLICATE_NUMBER_MESSAGE
+        return JsonResponse({'success': False, 'message': error_message, 'errors': {'Number': [error_message]}}, status=400)
+    return JsonResponse({'success': False, 'message': f'Server error: {str(e)}', 'errors': 'Check server logs.'}, status=500)
+
+
+def form_invalid_json(form):
+    return JsonResponse({
+        'success': False,
+        'message': 'Form validation failed.',
+        'errors': get_form_errors_json(form.errors),
+    }, status=400)
+
+
+# --- Helper: Context of the main page ---
+def home_context(form, initial_table_data_json):
+    return {
+        'unified_form': form,
+        'initial_table_data_json': initial_table_data_json,
+        'export_targets': EXPORT_TARGETS.values(),
+        'export_formats': [f for f in EXPORT_FORMATS.values() if f.available],
+    }
+
+
+# --- Helper: Streaming export response; `stream` is iter_export or aiter_export ---
+def export_response(request, stream):
+    options, error = parse_export_options(request.GET)
+    if error:
+        return JsonResponse({'success': False, 'message': error}, status=400)
+    target, export_format, compress = options
+    response = StreamingHttpResponse(
+        stream(target, export_format, compress),
+        content_type='application/gzip' if compress else export_format.content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(target, export_format, compress)}"'
+    return response
+
+
+# --- Helper: Checks an import upload; returns (csv_file, mode) or an error response ---
+def parse_import_request(request):
+    if request.method == "POST" and request.FILES.get('csv_file'):
+        csv_file = request.FILES['csv_file']
+        if not csv_file.name.endswith('.csv'):
+            return None, JsonResponse({'success': False, 'message': 'File is not CSV type.'}, status=400)
+        mode = request.POST.get('mode') or INSERT
+        if mode not in IMPORT_MODES:
+            return None, JsonResponse({'success': False, 'message': f'Unknown import mode "{mode}".'}, status=400)
+        return (csv_file, mode), None
+    return None, JsonResponse({'success': False, 'message': 'Invalid request.'}, status=400)
+
+
+def import_result_json(result, mode):
+    message = f"{result['imported']} users imported successfully."
+    if result['resumed_from_row']:
+        message += f" Resumed after row {result['resumed_from_row']}."
+    if mode == UPSERT:
+        message += f" {result['created']} created, {result['updated']} updated, {result['unchanged']} unchanged."
+    if result['failed']:
+        message += f" {result['failed']} rows failed."
+    if result['duplicates']:
+        message += f" {result['duplicates']} possible duplicates flagged."
+    return JsonResponse({
+        'success': True,
+        'message': message,
+        'mode': mode,
+        'imported': result['imported'],
+        'created': result['created'],
+        'updated': result['updated'],
+        'unchanged': result['unchanged'],
+        'failed': result['failed'],
+        'preview': result['preview'],
+        'errors': result['errors'],
+        'duplicates': result['duplicates'],
+        'possible_duplicates': result['possible_duplicates'],
+        'resumed_from_row': result['resumed_from_row'],
+        'rows_per_second': result['rows_per_second'],
+        'elapsed_seconds': result['elapsed_seconds'],
+    })
+
 # ---------------------------------------------------
 
 def home_page(request):
@@ -20,246 +165,199 @@ def home_page(request):
         # --- Normal form submission ---
         form = UnifiedUserForm(request.POST)
         if form.is_valid():
-            data = form.cleaned_data
             try:
-                # --- 1. Create UserProfile ---
-                user_profile = UserProfile.objects.create(
-                    Name=data['Name'],
-                    Mobile=data.get('Mobile', ''),
-                    Email=data.get('Email', ''),
-                    Group=data.get('Group', ''),
-                    Status=data.get('Status', ''),
-                    Active=data.get('Active', True),
-                    CreditLimit=data.get('CreditLimit'),
-                    PaymentTerms=data.get('PaymentTerms', ''),
-                    Salesman=data.get('Salesman', ''),
-                    DefaultPriority=data.get('DefaultPriority', 5),
-                    AlertNotes=data.get('AlertNotes', ''),
-                    QuickBooksClassName=data.get('QuickBooksClassName', ''),
-                    IssuableStatus=data.get('IssuableStatus', ''),
-                    Number=data.get('Number') or None
-                )
-
-                # --- 2. Create Primary Address ---
-                address_record = Address.objects.create(
-                    user=user_profile,
-                    AddressName=data.get('AddressName', ''),
-                    AddressContact=data.get('AddressContact', ''),
-                    AddressType=data.get('AddressType', ''),
-                    IsDefault=data.get('IsDefault', False),
-                    Address=data.get('Address', ''),
-                    City=data.get('City', ''),
-                    State=data.get('State', ''),
-                    Zip=data.get('Zip', ''),
-                    Country=data.get('Country', ''),
-                    Fax=data.get('Fax', ''),
-                    Pager=data.get('Pager', ''),
-                    Web=data.get('Web', '')
-                )
-
-                # --- 3. Create ShippingAndTax ---
-                ShippingAndTax.objects.create(
-                    user=user_profile,
-                    TaxRate=data.get('TaxRate'),
-                    TaxExempt=data.get('TaxExempt', False),
-                    TaxExemptNumber=data.get('TaxExemptNumber', ''),
-                    URL=data.get('URL', ''),
-                    CarrierName=data.get('CarrierName', ''),
-                    CarrierService=data.get('CarrierService', ''),
-                    ShippingTerms=data.get('ShippingTerms', ''),
-                    ToBeEmailed=data.get('ToBeEmailed', False),
-                    ToBePrinted=data.get('ToBePrinted', False),
-                )
-
-                # --- 4. Return success JSON ---
-                return JsonResponse({
-                    'success': True,
-                    'message': f'Customer "{user_profile.Name}" saved successfully.',
-                    'new_record': {
-                        'id': user_profile.pk,
-                        'LocationName': user_profile.Name,
-                        'Address': address_record.Address,
-                        'City': address_record.City,
-                        'State': address_record.State,
-                        'Zip': address_record.Zip,
-                        'ContactPerson': address_record.AddressContact,
-                        'Phone': user_profile.Mobile,
-                        'Email': user_profile.Email,
-                    }
-                }, status=201)
-
-            except IntegrityError as e:
-                error_message = f"Database error: {e}"
-                if 'unique constraint' in str(e).lower() and 'number' in str(e).lower():
-                    error_message = "Account Number already exists."
-                return JsonResponse({'success': False, 'message': error_message, 'errors': {'Number': [error_message]}}, status=400)
-
+                # --- Create profile, primary address and shipping in one transaction ---
+                user_profile, address_record, _ = create_customer(form.cleaned_data)
             except Exception as e:
-                return JsonResponse({'success': False, 'message': f'Server error: {str(e)}', 'errors': 'Check server logs.'}, status=500)
+                return customer_save_error_json(e)
+            return customer_saved_json(user_profile, address_record)
 
         else:
             # Form invalid
-            return JsonResponse({
-                'success': False,
-                'message': 'Form validation failed.',
-                'errors': get_form_errors_json(form.errors),
-            }, status=400)
-
-    # --- GET request: render page with initial table data ---
-    all_users = UserProfile.objects.all().prefetch_related('addresses').select_related('shipping_tax')
-    initial_table_data = []
-    for user in all_users:
-        address = user.addresses.first()
-        initial_table_data.append({
-            'id': user.pk,
-            'LocationName': user.Name,
-            'Address': address.Address if address else '',
-            'City': address.City if address else '',
-            'State': address.State if address else '',
-            'Zip': address.Zip if address else '',
-            'ContactPerson': address.AddressContact if address else '',
-            'Phone': user.Mobile,
-            'Email': user.Email,
-        })
+            return form_invalid_json(form)
 
-    context = {
-        'unified_form': form,
-        'initial_table_data_json': json.dumps(initial_table_data)
-    }
-    return render(request, 'index.html', context)
+    # --- GET request: render page with the first table page only ---
+    return render(request, 'index.html', home_context(form, cached_customer_page_json()))
+
+
+# --- Paginated customer table API ---
+def customers_api(request):
+    after = request.GET.get('after')
+    if after not in (None, ''):
+        try:
+            after = int(after)
+        except ValueError:
+            return JsonResponse({'success': False, 'message': 'Invalid cursor.'}, status=400)
+    else:
+        after = None
+
+    page_size = parse_page_size(request.GET.get('page_size'))
+    term = request.GET.get('q', '').strip()
+    if term:
+        return JsonResponse(search_page(term, after=after, page_size=page_size))
+
+    return HttpResponse(cached_customer_page_json(after=after, page_size=page_size), content_type='application/json')
+
+
+# --- Helper: Token auth for integration APIs ---
+def api_token_required(view):
+    """
+    Requires an `Authorization: Bearer <token>` header matching one of
+    CUSTOMER_API_TOKENS. Such clients have no session, so the view is
+    exempt from CSRF checks; the token takes their place.
+    """
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        tokens = getattr(settings, 'CUSTOMER_API_TOKENS', [])
+        if scheme.lower() != 'bearer' or not any(
+            hmac.compare_digest(token.encode('utf-8'), known.encode('utf-8')) for known in tokens
+        ):
+            response = JsonResponse({'success': False, 'message': 'Invalid or missing API token.'}, status=401)
+            response['WWW-Authenticate'] = 'Bearer'
+            return response
+        return view(request, *args, **kwargs)
+    return csrf_exempt(inner)
+
+
+# --- Batch create from a JSON array of UnifiedUserForm records ---
+@api_token_required
+def customers_batch_api(request):
+    if request.method != "POST":
+        return JsonResponse({'success': False, 'message': 'Invalid request.'}, status=400)
+    try:
+        payload = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'Invalid JSON.'}, status=400)
+
+    records = payload.get('records') if isinstance(payload, dict) else payload
+    if not isinstance(records, list) or not records:
+        return JsonResponse({'success': False, 'message': 'Expected a non-empty array of records.'}, status=400)
+    max_size = getattr(settings, 'CUSTOMER_BATCH_MAX_SIZE', 1000)
+    if len(records) > max_size:
+        return JsonResponse({'success': False, 'message': f'At most {max_size} records per batch.'}, status=400)
+
+    try:
+        results = create_customers_batch(records)
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': f'Server error: {str(e)}'}, status=500)
+
+    created = sum(1 for result in results if result['success'])
+    # 201 when every record was created, 207 when only some were.
+    status = 201 if created == len(results) else 207 if created else 400
+    return JsonResponse({
+        'success': created == len(results),
+        'message': f'{created} of {len(results)} customers created.',
+        'created': created,
+        'failed': len(results) - created,
+        'results': results,
+    }, status=status)
 
 
 # --- Export users to CSV ---
+@condition(etag_func=export_etag, last_modified_func=export_last_modified)
 def export_users_csv(request):
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="user_data.csv"'
-
-    writer = csv.writer(response)
-    writer.writerow([
-        'Name', 'Group', 'Account Number', 'Mobile', 'Email', 'Status', 'Credit Limit', 'Payment Terms',
-        'Salesman', 'Priority', 'Alert Notes',
-        'Address Name', 'Address Contact', 'Address Type', 'Address', 'City', 'State', 'Zip', 'Country',
-        'Tax Rate', 'Tax Exempt', 'Tax Exempt Number', 'URL', 'Carrier', 'Shipping Terms',
-        'Is Default', 'Active'
-    ])
-
-    users = UserProfile.objects.all().prefetch_related('addresses').select_related('shipping_tax')
-
-    for user in users:
-        address = user.addresses.first()
-        shipping = getattr(user, 'shipping_tax', None)
-        writer.writerow([
-            user.Name,
-            user.Group,
-            user.Number or '',
-            user.Mobile,
-            user.Email,
-            user.Status,
-            user.CreditLimit or '',
-            user.PaymentTerms,
-            user.Salesman,
-            user.DefaultPriority or '',
-            user.AlertNotes or '',
-
-            address.AddressName if address else '',
-            address.AddressContact if address else '',
-            address.AddressType if address else '',
-            address.Address if address else '',
-            address.City if address else '',
-            address.State if address else '',
-            address.Zip if address else '',
-            address.Country if address else '',
-
-            shipping.TaxRate if shipping else '',
-            shipping.TaxExempt if shipping else False,
-            shipping.TaxExemptNumber if shipping else '',
-            shipping.URL if shipping else '',
-            shipping.CarrierName if shipping else '',
-            shipping.ShippingTerms if shipping else '',
-
-            address.IsDefault if address else False,
-            user.Active,
-        ])
-    return response
+    return export_response(request, iter_export)
+
+
+# --- Incremental change feed ---
+def customer_changes_api(request):
+    since = request.GET.get('since')
+    if since:
+        since = parse_cursor(since)
+        if since is None:
+            return JsonResponse({'success': False, 'message': 'Invalid cursor.'}, status=400)
+    else:
+        since = None
+
+    # Everything up to the newest change seen now; later writes go to the next cursor.
+    try:
+        cursor, customer_ids = read_changes(since)
+    except CursorExpired:
+        return JsonResponse(
+            {'success': False, 'message': 'Changes after this cursor have been pruned; sync again without one.'},
+            status=410,
+        )
+    return StreamingHttpResponse(iter_change_feed_json(since, cursor, customer_ids), content_type='application/json')
 
 
 # --- Import users from CSV ---
 def import_users_csv(request):
-    if request.method == "POST" and request.FILES.get('csv_file'):
-        csv_file = request.FILES['csv_file']
-        if not csv_file.name.endswith('.csv'):
-            return JsonResponse({'success': False, 'message': 'File is not CSV type.'}, status=400)
-        try:
-            decoded_file = csv_file.read().decode('utf-8')
-            io_string = io.StringIO(decoded_file)
-            reader = csv.DictReader(io_string)
-            new_records = []
-
-            for row in reader:
-                # Create UserProfile
-                user_profile = UserProfile.objects.create(
-                    Name=row.get('Name', ''),
-                    Mobile=row.get('Mobile', ''),
-                    Email=row.get('Email', ''),
-                    Group=row.get('Group', ''),
-                    Status=row.get('Status', ''),
-                    Active=row.get('Active', 'True') == 'True',
-                    CreditLimit=row.get('Credit Limit') or None,
-                    PaymentTerms=row.get('Payment Terms', ''),
-                    Salesman=row.get('Salesman', ''),
-                    DefaultPriority=row.get('Priority') or 5,
-                    AlertNotes=row.get('Alert Notes', ''),
-                    QuickBooksClassName='',
-                    IssuableStatus='',
-                    Number=row.get('Account Number') or None
-                )
-
-                # Create Address
-                address_record = Address.objects.create(
-                    user=user_profile,
-                    AddressName=row.get('Address Name', ''),
-                    AddressContact=row.get('Address Contact', ''),
-                    AddressType=row.get('Address Type', ''),
-                    IsDefault=row.get('Is Default', 'False') == 'True',
-                    Address=row.get('Address', ''),
-                    City=row.get('City', ''),
-                    State=row.get('State', ''),
-                    Zip=row.get('Zip', ''),
-                    Country=row.get('Country', ''),
-                    Fax='',
-                    Pager='',
-                    Web=''
-                )
-
-                # Create ShippingAndTax
-                ShippingAndTax.objects.create(
-                    user=user_profile,
-                    TaxRate=row.get('Tax Rate') or None,
-                    TaxExempt=row.get('Tax Exempt', 'False') == 'True',
-                    TaxExemptNumber=row.get('Tax Exempt Number', ''),
-                    URL=row.get('URL', ''),
-                    CarrierName=row.get('Carrier', ''),
-                    CarrierService='',
-                    ShippingTerms=row.get('Shipping Terms', ''),
-                    ToBeEmailed=False,
-                    ToBePrinted=False,
-                )
-
-                new_records.append({
-                    'id': user_profile.pk,
-                    'LocationName': user_profile.Name,
-                    'Address': address_record.Address,
-                    'City': address_record.City,
-                    'State': address_record.State,
-                    'Zip': address_record.Zip,
-                    'ContactPerson': address_record.AddressContact,
-                    'Phone': user_profile.Mobile,
-                    'Email': user_profile.Email,
-                })
-
-            return JsonResponse({'success': True, 'message': f'{len(new_records)} users imported successfully.', 'new_records': new_records})
-
-        except Exception as e:
-            return JsonResponse({'success': False, 'message': f'Error reading CSV: {str(e)}'}, status=500)
+    options, error = parse_import_request(request)
+    if error:
+        return error
+    csv_file, mode = options
+    try:
+        # Uploading a file again after an interrupted import resumes it.
+        result = import_csv_resumable(
+            csv_file, mode, chunk_size=request.POST.get('chunk_size'), restart=request.POST.get('restart') == '1',
+        )
+    except ImportConflict as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=409)
+    except Exception as e:
+        return JsonResponse({'success': False, 'message': f'Error reading CSV: {str(e)}'}, status=500)
+    return import_result_json(result, mode)
+
+
+# --- Background jobs: queue an import ---
+def enqueue_import_job(request):
+    options, error = parse_import_request(request)
+    if error:
+        return error
+    csv_file, mode = options
+    job = Job(kind=Job.IMPORT, options={
+        'mode': mode, 'chunk_size': request.POST.get('chunk_size'), 'restart': request.POST.get('restart') == '1',
+    })
+    job.input_file.save(csv_file.name, csv_file, save=False)
+    job.save()
+    return JsonResponse({'success': True, 'job': job.as_dict()}, status=202)
+
+
+# --- Background jobs: queue an export ---
+def enqueue_export_job(request):
+    if request.method == "POST":
+        options, error = parse_export_options(request.POST)
+        if error:
+            return JsonResponse({'success': False, 'message': error}, status=400)
+        target, export_format, compress = options
+        job = Job.objects.create(kind=Job.EXPORT, options={
+            'target': target.name, 'format': export_format.name, 'compress': compress,
+        })
+        return JsonResponse({'success': True, 'job': job.as_dict()}, status=202)
 
     return JsonResponse({'success': False, 'message': 'Invalid request.'}, status=400)
+
+
+# --- Background jobs: progress polling ---
+def job_status(request, job_id):
+    job = get_object_or_404(Job, pk=job_id)
+    return JsonResponse({'success': True, 'job': job.as_dict()})
+
+
+# --- Background jobs: requeue a failed import, which resumes at its checkpoint ---
+def retry_import_job(request, job_id):
+    if request.method != "POST":
+        return JsonResponse({'success': False, 'message': 'Invalid request.'}, status=400)
+    job = get_object_or_404(Job, pk=job_id, kind=Job.IMPORT)
+    if not retry_job(job.pk):
+        return JsonResponse({'success': False, 'message': 'Only failed or abandoned jobs can be retried.'}, status=409)
+    job.refresh_from_db()
+    return JsonResponse({'success': True, 'job': job.as_dict()}, status=202)
+
+
+# --- Background jobs: finished export download ---
+def job_download(request, job_id):
+    job = get_object_or_404(Job, pk=job_id, kind=Job.EXPORT, status=Job.DONE)
+    if not job.output_file:
+        raise Http404("Export file is missing.")
+    filename = export_filename(
+        get_target(job.options.get('target', 'csv')),
+        get_format(job.options.get('format', 'csv')),
+        job.options.get('compress', False),
+    )
+    return FileResponse(job.output_file.open('rb'), as_attachment=True, filename=filename)
+
+
+# --- Request metrics (Prometheus text format) ---
+def metrics_view(request):
+    return HttpResponse(registry.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')